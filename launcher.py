@@ -0,0 +1,110 @@
+"""
+Runs the bot as several shard cluster processes sharing one data directory
+"""
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import requests
+from dotenv import load_dotenv
+
+RESTART_DELAY = 5
+
+
+def recommended_shard_count(token: str) -> int:
+    """Ask Discord how many shards the bot should use"""
+    response = requests.get(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}"},
+        timeout=10
+    )
+    response.raise_for_status()
+    return int(response.json()['shards'])
+
+
+def split_shards(shard_count: int, clusters: int) -> List[List[int]]:
+    """Distribute shard IDs over clusters in contiguous blocks"""
+    clusters = max(1, min(clusters, shard_count))
+    per_cluster, extra = divmod(shard_count, clusters)
+    result, start = [], 0
+    for cluster in range(clusters):
+        size = per_cluster + (1 if cluster < extra else 0)
+        result.append(list(range(start, start + size)))
+        start += size
+    return result
+
+
+def migrate():
+    """Apply database migrations once, before any cluster starts"""
+    # Imported after load_dotenv so DATA_DIR/DB_PATH from .env apply
+    from src.database import db
+    json_file_path = os.path.join(os.getenv('DATA_DIR', '.'), 'channels.json')
+    asyncio.run(db.migrate(json_file_path))
+
+
+def spawn(cluster_id: int, shard_ids: List[int], shard_count: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env['CLUSTER_ID'] = str(cluster_id)
+    env['SHARD_COUNT'] = str(shard_count)
+    env['SHARD_IDS'] = ','.join(str(shard) for shard in shard_ids)
+    # Each cluster gets its own metrics/feed port
+    if os.getenv('HTTP_PORT'):
+        env['HTTP_PORT'] = str(int(os.environ['HTTP_PORT']) + cluster_id)
+    # Clusters share the parsed schedules through SQLite instead of each scraping VOCO
+    env.setdefault('SCHEDULE_CACHE_BACKEND', 'sqlite')
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    print(f"🧩 Starting cluster {cluster_id} with shards {shard_ids}")
+    return subprocess.Popen([sys.executable, main_path], env=env)
+
+
+def main():
+    load_dotenv()
+    token = os.getenv("DISCORD_TOKEN")
+
+    shard_count = int(os.getenv('SHARD_COUNT', '0')) or recommended_shard_count(token)
+    clusters = int(os.getenv('SHARD_CLUSTERS', '0')) or (os.cpu_count() or 1)
+    layout = split_shards(shard_count, clusters)
+    print(f"🧩 {shard_count} shards in {len(layout)} clusters")
+    # Clusters still migrate on startup (under a lock), but find nothing left to do
+    migrate()
+
+    processes: Dict[int, subprocess.Popen] = {
+        cluster_id: spawn(cluster_id, shard_ids, shard_count)
+        for cluster_id, shard_ids in enumerate(layout)
+    }
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.poll() is None:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Supervise: restart clusters that exit until we are asked to stop
+    while not stopping:
+        time.sleep(1)
+        for cluster_id, process in list(processes.items()):
+            code = process.poll()
+            if code is not None and not stopping:
+                print(f"⚠️ Cluster {cluster_id} exited with code {code}, restarting in {RESTART_DELAY}s")
+                time.sleep(RESTART_DELAY)
+                processes[cluster_id] = spawn(cluster_id, layout[cluster_id], shard_count)
+
+    for process in processes.values():
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,34 @@
+from time import perf_counter
+PROCESS_STARTED = perf_counter()
+
 import os
+import signal
+import sys
 import discord
 import asyncio
-import re
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
 from src.commands import setup_info_commands, init_database
+from src.slash import setup_slash_commands, sync_commands
 from src.database import db
-from src.scraper import VOCOScraper
-from datetime import datetime, time
+from src.scraper import VOCOScraper, ScheduleUnavailableError
+from src.schedule import schedule
+from src.render import program_display, build_changes_embed, format_reminder
+from src.tracing import tracer, traced
+from src.watchdog import watchdog
+from src.web import web
+from src.metrics import metrics
+from src.leader import lease, global_lease
+from src.scheduler import broadcaster, reminders, timers
+from src.programs import registry, DEFAULT_PROGRAM
+from src.index import schedule_index
+from src.memory import low_memory_enabled, memory_report
+from src.changes import changes
+from src.webhooks import webhooks
+from datetime import date
+
+IMPORTS_DONE = perf_counter()
+startup_phase = metrics.gauge('startup_phase_seconds', 'Duration of each startup phase')
 
 # Load environment variables from .env file
 load_dotenv()
@@ -17,134 +38,328 @@ TOKEN = os.getenv("DISCORD_TOKEN")
 intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot_options = {}
+if low_memory_enabled():
+    # Only guilds, channels, roles, messages and reactions are used; skip the rest
+    intents.typing = False
+    intents.voice_states = False
+    intents.invites = False
+    intents.integrations = False
+    intents.emojis_and_stickers = False
+    intents.scheduled_events = False
+    bot_options = {
+        # Members come with each command and reaction payload; only the bot's own member is cached
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        'chunk_guilds_at_startup': False,
+        # Role pickers are handled through raw events, so few messages need caching
+        'max_messages': int(os.getenv('MAX_MESSAGES', '100')),
+    }
+# Sharding: SHARD_COUNT/SHARD_IDS are set per process by launcher.py, AUTO_SHARD=1 lets Discord pick
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None
+SHARD_IDS = [int(shard) for shard in os.getenv('SHARD_IDS', '').split(',') if shard.strip()] or None
+if SHARD_COUNT or SHARD_IDS or os.getenv('AUTO_SHARD', '').lower() in ('1', 'true'):
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **bot_options)
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, **bot_options)
+
+def owns_guild(guild_id) -> bool:
+    """Whether this process's shards handle the guild"""
+    shard_ids = getattr(bot, 'shard_ids', None)
+    if not bot.shard_count or not shard_ids:
+        return True
+    return ((int(guild_id) >> 22) % bot.shard_count) in shard_ids
+
+# Set once the one-time startup in on_ready has run; on_ready fires again on every reconnect
+startup_done = False
+# Set when the database could not be initialized; the process then exits with an error
+startup_failed = False
 
 @bot.event
 async def on_ready():
+    global startup_done, startup_failed
     print(f"✅ Logged in as {bot.user}")
+    if getattr(bot, 'shard_ids', None):
+        print(f"🧩 Running shards {bot.shard_ids} of {bot.shard_count}")
+    if startup_done:
+        print("🔄 Reconnected to Discord, startup already done")
+        return
+    startup_done = True
+    
+    phases = {
+        'imports': IMPORTS_DONE - PROCESS_STARTED,
+        'connect': perf_counter() - IMPORTS_DONE,
+    }
+    
+    # Start the event loop watchdog and the metrics endpoint
+    started = perf_counter()
+    watchdog.start()
+    await web.start()
+    phases['monitoring'] = perf_counter() - started
+    
     # Initialize database
-    await init_database()
-    # Start the daily lesson task
-    daily_lessons.start()
-
-@tasks.loop(time=time(3, 0))  # 6:00 AM every day
-async def daily_lessons():
-    """Send daily lessons to all servers based on their program settings"""
-    # Check if it's a weekday (Monday=0, Sunday=6)
-    if datetime.now().weekday() >= 5:  # Saturday or Sunday
+    started = perf_counter()
+    try:
+        await init_database()
+        await registry.load()
+    except Exception as e:
+        # Exit so the launcher (or Docker) restarts us instead of running without a schema
+        print(f"❌ Database startup failed, shutting down: {e}")
+        startup_failed = True
+        await bot.close()
+        return
+    phases['database'] = perf_counter() - started
+    
+    # Register slash commands with Discord (skipped when unchanged since the last sync)
+    started = perf_counter()
+    try:
+        await sync_commands(bot)
+    except Exception as e:
+        print(f"⚠️ Error syncing slash commands: {e}")
+    phases['commands'] = perf_counter() - started
+    
+    started = perf_counter()
+    # Compete for the scheduler lease; only the leader runs scheduled jobs
+    if not leader_heartbeat.is_running():
+        leader_heartbeat.start()
+    # Start the timer heap; the daily lessons are planned once this process becomes leader
+    timers.start()
+    if not broadcast_reload.is_running():
+        broadcast_reload.start()
+    if not reminder_planner.is_running():
+        reminder_planner.start()
+    # Start probing VOCO in the background while it is down
+    if not voco_probe.is_running():
+        voco_probe.start()
+    # Keep the VOCO group list up to date
+    if not program_refresh.is_running():
+        program_refresh.start()
+    # Build the teacher/room index in the background
+    if not index_refresh.is_running():
+        index_refresh.start()
+    # Watch for schedule changes (CHANGE_POLL_MINUTES=0 disables)
+    if CHANGE_POLL_MINUTES > 0 and not change_poller.is_running():
+        change_poller.start()
+    # Publish memory and cache usage
+    if not memory_stats.is_running():
+        memory_stats.start()
+    # Start the periodic database maintenance
+    if not db_maintenance.is_running():
+        db_maintenance.start()
+    phases['tasks'] = perf_counter() - started
+    
+    for phase, seconds in phases.items():
+        startup_phase.set(seconds, phase=phase)
+    summary = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in phases.items())
+    print(f"🚀 Startup finished in {(perf_counter() - PROCESS_STARTED) * 1000:.0f}ms ({summary})")
+
+@traced('daily_lessons')
+async def send_daily_lessons(guild_id: str, channel_id: int, day: date):
+    """Send the day's lessons to one server; called by the broadcast scheduler at the server's local time"""
+    # Only the replica holding the lease posts, and only to guilds on this process's shards
+    if not lease.is_leader or not owns_guild(guild_id):
+        return
+    # Already posted (e.g. by a previous leader before it died)
+    if await db.is_broadcast_done(broadcaster.JOB, guild_id, day.isoformat()):
         return
     
     try:
-        # Get all servers with tunniplaan channels
-        _, tunniplaan_channels = await db.get_channels()
+        # Get the channel
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            print(f"⚠️ Channel {channel_id} not found for guild {guild_id}")
+            return
         
-        # Process each server
-        for guild_id, channel_id in tunniplaan_channels.items():
-            try:
-                # Get the channel
-                channel = bot.get_channel(channel_id)
-                if not channel:
-                    print(f"⚠️ Channel {channel_id} not found for guild {guild_id}")
-                    continue
-                
-                # Get server's program preference
-                server_program = await db.get_server_program(guild_id)
-                if not server_program:
-                    # Default to ITA25 if not set
-                    server_program = 'ITA25'
-                    print(f"📢 No program set for {channel.guild.name}, defaulting to ITA25")
-                
-                # Get lessons for this server's program
-                scraper = VOCOScraper(server_program)
-                lessons = scraper.get_todays_lessons()
-                
-                program_display = "ITA25" if server_program == 'ITA25' else "ITS25 (2028)"
-                
-                if not lessons:
-                    message = "📅 **Täna tunde ei ole** - Vaba päev! 🎉"
-                    await channel.send(message)
-                    print(f"📅 Daily lessons (no lessons) sent to {channel.guild.name}#{channel.name}")
-                else:
-                    # Sort lessons by time
-                    lessons.sort(key=lambda x: x.get('start_time', ''))
-                    
-                    # Create embed
-                    embed = discord.Embed(
-                        title=f"📅 Tänased tunnid ({program_display}) - Automaatne",
-                        color=0x00ff00,
-                        timestamp=datetime.now()
-                    )
-                    
-                    # Add lessons to embed (same logic as manual command)
-                    for i, lesson in enumerate(lessons):
-                        time_str = f"{lesson.get('start_time', '')}-{lesson.get('end_time', '')}"
-                        lesson_info = ""
-                        
-                        # Handle multiple subjects/teachers/rooms (grouped by time)
-                        if 'teachers' in lesson and 'rooms' in lesson and 'subjects' in lesson:
-                            # Multiple subjects/teachers/rooms (grouped by time slot)
-                            teachers = lesson['teachers']
-                            rooms = lesson['rooms']
-                            subjects = lesson['subjects']
-                            
-                            for j, (teacher, room, subject) in enumerate(zip(teachers, rooms, subjects)):
-                                # Clean subject name for display
-                                clean_subject = re.sub(r'_\s*Rühm\s*\d+|_\s*R\d+', '', subject).strip()
-                                clean_subject = re.sub(r'\s*Rühm\s*\d+|\s*R\d+', '', clean_subject).strip()
-                                clean_subject = re.sub(r'_\s*$', '', clean_subject).strip()
-                                
-                                lesson_info += f"**{clean_subject}**\n"
-                                
-                                # Show group info if present
-                                group_suffix = re.search(r'_\s*Rühm\s*\d+|_\s*R\d+', subject)
-                                if group_suffix:
-                                    lesson_info += f"📚 {group_suffix.group(0).replace('_', ' ').strip()}: "
-                                elif 'Rühm' in subject or 'R1' in subject or 'R2' in subject:
-                                    # Extract group info from subject name
-                                    group_match = re.search(r'(Rühm\s*\d+|R\d+)', subject)
-                                    if group_match:
-                                        lesson_info += f"📚 {group_match.group(0)}: "
-                                
-                                if teacher and teacher != 'Tundmatu':
-                                    lesson_info += f"👨‍🏫 {teacher}"
-                                if room and room != 'Tundmatu ruum':
-                                    lesson_info += f" - 🏫 {room}"
-                                if j < len(teachers) - 1:
-                                    lesson_info += "\n\n"
-                        else:
-                            # Single subject/teacher/room (original format)
-                            subject = lesson.get('subject', 'Tundmatu aine')
-                            clean_subject = re.sub(r'_\s*Rühm\s*\d+|_\s*R\d+', '', subject).strip()
-                            clean_subject = re.sub(r'\s*Rühm\s*\d+|\s*R\d+', '', clean_subject).strip()
-                            clean_subject = re.sub(r'_\s*$', '', clean_subject).strip()
-                            
-                            lesson_info += f"**{clean_subject}**\n"
-                            
-                            teacher = lesson.get('teacher', 'Tundmatu')
-                            room = lesson.get('room', 'Tundmatu ruum')
-                            if teacher and teacher != 'Tundmatu':
-                                lesson_info += f"👨‍🏫 {teacher}"
-                            if room and room != 'Tundmatu ruum':
-                                lesson_info += f" - 🏫 {room}"
-                        
-                        embed.add_field(
-                            name=f"Tund {i+1} - ⏰ {time_str}",
-                            value=lesson_info,
-                            inline=False
-                        )
-                    
-                    embed.set_footer(text=f"Kokku {len(lessons)} tundi")
-                    await channel.send(embed=embed)
-                    print(f"📅 Daily lessons sent to {channel.guild.name}#{channel.name} ({program_display})")
-                    
-            except Exception as e:
-                print(f"⚠️ Error sending to guild {guild_id}: {e}")
-                
+        # Get server's program preference
+        server_program = await db.get_server_program(guild_id)
+        if not server_program:
+            # Default to ITA25 if not set
+            server_program = DEFAULT_PROGRAM
+            print(f"📢 No program set for {channel.guild.name}, defaulting to {DEFAULT_PROGRAM}")
+        
+        # Get lessons for this server's program (other guilds with the same program hit the week cache)
+        try:
+            result = await schedule.render_day(server_program, day, automatic=True)
+        except ScheduleUnavailableError as e:
+            # Never announce a free day just because VOCO is down
+            print(f"⚠️ VOCO unavailable for {channel.guild.name}: {e}")
+            with tracer.span('send', guild=guild_id):
+                await webhooks.send(guild_id, channel, content="⚠️ Tänast tunniplaani ei õnnestunud laadida - VOCO ei vasta.")
+            return
+        
+        with tracer.span('send', guild=guild_id):
+            await webhooks.send(guild_id, channel, content=result['content'], embed=result['embed'])
+        await db.mark_broadcast_done(broadcaster.JOB, guild_id, day.isoformat())
+        if result['embed'] is None:
+            print(f"📅 Daily lessons (no lessons) sent to {channel.guild.name}#{channel.name}")
+        else:
+            print(f"📅 Daily lessons sent to {channel.guild.name}#{channel.name} ({program_display(server_program)})")
+            
+    except Exception as e:
+        print(f"⚠️ Error sending to guild {guild_id}: {e}")
+
+broadcaster.sender = send_daily_lessons
+webhooks.client = bot
+
+async def send_schedule_changes(program: str, program_changes):
+    """Post detected schedule changes to the tunniplaan channel of every server following the program"""
+    _, tunniplaan_channels = await db.get_channels()
+    server_programs = await db.get_server_programs()
+    embed = build_changes_embed(program, program_changes)
+    for guild_id, channel_id in tunniplaan_channels.items():
+        if server_programs.get(guild_id, DEFAULT_PROGRAM) != program:
+            continue
+        # The global leader notifies every guild; guilds on other clusters' shards are reached over REST
+        channel = bot.get_channel(channel_id) if owns_guild(guild_id) else None
+        if channel is None:
+            channel = bot.get_partial_messageable(channel_id, guild_id=int(guild_id))
+        try:
+            with tracer.span('send', guild=guild_id):
+                await webhooks.send(guild_id, channel, embed=embed)
+        except Exception as e:
+            print(f"⚠️ Error sending schedule changes to guild {guild_id}: {e}")
+
+changes.notifier = send_schedule_changes
+
+async def send_reminder(guild_id: str, channel_id: int, lesson, minutes: int):
+    """Post an upcoming-lesson reminder; fired by the reminder timers"""
+    if not lease.is_leader or not owns_guild(guild_id):
+        return
+    channel = bot.get_channel(channel_id)
+    if not channel:
+        return
+    with tracer.span('send', guild=guild_id):
+        await channel.send(format_reminder(lesson, minutes))
+
+reminders.sender = send_reminder
+
+@tasks.loop(minutes=15)
+async def reminder_planner():
+    """Re-plan today's reminders from the cache so schedule changes and the new day are picked up"""
+    if lease.is_leader:
+        await reminders.plan()
+
+CHANGE_POLL_MINUTES = float(os.getenv('CHANGE_POLL_MINUTES', '15'))
+
+@tasks.loop(minutes=CHANGE_POLL_MINUTES or 15)
+@traced('change_poll')
+async def change_poller():
+    """Poll VOCO for changes to the current and next week (global leader only, so one snapshot baseline serves every guild)"""
+    if global_lease.is_leader:
+        await changes.poll()
+
+@tasks.loop(seconds=30)
+async def voco_probe():
+    """Probe VOCO while the circuit breaker is open so it closes as soon as VOCO recovers"""
+    if VOCOScraper.breaker.state != VOCOScraper.breaker.CLOSED:
+        await asyncio.to_thread(VOCOScraper.probe)
+
+@tasks.loop(hours=float(os.getenv('PROGRAM_REFRESH_HOURS', '24')))
+async def program_refresh():
+    """Scrape VOCO's group list (leader only) and reload the program index from the database"""
+    try:
+        if lease.is_leader:
+            programs = await asyncio.to_thread(VOCOScraper.fetch_programs)
+            await registry.update(programs)
+            print(f"📚 Program registry refreshed: {len(registry)} groups")
+        else:
+            await registry.load()
+    except Exception as e:
+        print(f"⚠️ Error refreshing the program registry: {e}")
+
+@program_refresh.before_loop
+async def before_program_refresh():
+    # Let the first leader election finish so the first run scrapes
+    await asyncio.sleep(lease.ttl)
+
+@tasks.loop(minutes=float(os.getenv('INDEX_REFRESH_MINUTES', '30')))
+async def index_refresh():
+    """Fetch missing weeks of all programs (global leader only) and rebuild the teacher/room index from the cache"""
+    try:
+        if global_lease.is_leader:
+            await schedule_index.warm()
+        await schedule_index.rebuild()
     except Exception as e:
-        print(f"⚠️ Error in daily lessons task: {e}")
+        print(f"⚠️ Error refreshing the schedule index: {e}")
+
+@tasks.loop(minutes=1)
+async def memory_stats():
+    """Refresh the memory and cache size metrics"""
+    memory_report(bot)
+
+@tasks.loop(seconds=lease.heartbeat_interval)
+async def leader_heartbeat():
+    """Acquire or renew the cluster's scheduler lease and the global lease"""
+    await lease.heartbeat()
+    await global_lease.heartbeat()
+
+@lease.on_elected
+async def plan_daily_lessons():
+    """A new leader plans every guild's post and catches up on runs missed while no leader was up"""
+    # Guilds already posted are skipped via the broadcast log
+    await broadcaster.load(catch_up=True)
+    await reminders.plan()
+
+@tasks.loop(minutes=5)
+async def broadcast_reload():
+    """Pick up post times changed through other replicas"""
+    if lease.is_leader:
+        await broadcaster.load(catch_up=False)
+
+@tasks.loop(hours=24)
+async def db_maintenance():
+    """Prune rows of departed guilds, refresh statistics and reclaim space"""
+    if not lease.is_leader:
+        return
+    try:
+        current_guilds = {str(guild.id) for guild in bot.guilds}
+        departed = [
+            g for g in await db.get_role_message_guild_ids()
+            if owns_guild(g) and g not in current_guilds
+        ]
+        report = await db.run_maintenance(departed)
+        pruned_weeks = await asyncio.to_thread(VOCOScraper.prune_cache)
+        print(f"🧹 Database maintenance: {report['departed_guilds']} departed guilds, "
+              f"{report['orphaned_assignments']} orphaned assignments removed, "
+              f"{pruned_weeks} old cached weeks pruned, "
+              f"{report['bytes_before']} -> {report['bytes_after']} bytes")
+    except Exception as e:
+        print(f"⚠️ Error in database maintenance: {e}")
+
+@db_maintenance.before_loop
+async def before_db_maintenance():
+    # Give the guild cache time to fill before deciding which guilds were left
+    await bot.wait_until_ready()
+    # Let the first leader election finish, or every restart would skip a day of maintenance
+    await asyncio.sleep(lease.ttl)
 
 # Setup command groups
 setup_info_commands(bot)
+setup_slash_commands(bot)
+
+async def main():
+    """Run the bot; on shutdown stop the timers, commit queued database writes and release the scheduler leases.
+    
+    Returns the process exit code.
+    """
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(bot.close()))
+        except NotImplementedError:
+            pass  # Not supported on Windows
+    
+    async with bot:
+        try:
+            await bot.start(TOKEN)
+        finally:
+            await timers.stop()
+            try:
+                await db.flush()
+            finally:
+                await lease.release()
+                await global_lease.release()
+    return 1 if startup_failed else 0
 
 # Run the bot
-bot.run(TOKEN)
+discord.utils.setup_logging()
+sys.exit(asyncio.run(main()))
@@ -0,0 +1,191 @@
+"""
+Compressed archive of raw VOCO pages for replaying the parser.
+
+Usage:
+    python -m src.archive stats
+    python -m src.archive replay [--repeat N] [--save FILE] [--compare FILE]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, Optional, Tuple
+
+from .metrics import metrics
+
+archived_pages = metrics.counter('page_archive_stored_total', 'Raw pages written to the archive')
+archive_bytes = metrics.gauge('page_archive_bytes', 'Compressed size of the page archive')
+
+
+class PageArchive:
+    """Stores pages zlib-compressed under DATA_DIR, one file per content hash, evicting the oldest"""
+
+    def __init__(self, directory: str = None, max_bytes: int = None):
+        if directory is None:
+            data_dir = os.getenv('DATA_DIR', '.')
+            directory = os.getenv('PAGE_ARCHIVE_DIR', os.path.join(data_dir, 'page_archive'))
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('PAGE_ARCHIVE_MAX_MB', '100')) * 1024 * 1024)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = os.getenv('PAGE_ARCHIVE', '').lower() in ('1', 'true', 'yes')
+        self._lock = threading.Lock()
+        # Total size of the archive, computed on first use
+        self._size: Optional[int] = None
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, 'index.jsonl')
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.z")
+
+    def store(self, page: bytes, oppegrupp: int = None, week: str = None) -> Optional[str]:
+        """Archive a page unless an identical one is stored; returns its hash"""
+        if not self.enabled:
+            return None
+        digest = hashlib.sha256(page).hexdigest()
+        path = self._path(digest)
+        with self._lock:
+            if os.path.exists(path):
+                # Eviction goes by mtime, so pages VOCO keeps serving must look recent
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return digest
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = zlib.compress(page, 9)
+            # Write then rename so readers never see a partial file
+            tmp = f"{path}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+            with open(self._index_path(), 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'hash': digest, 'oppegrupp': oppegrupp, 'week': week, 'stored_at': time.time()}) + '\n')
+            archived_pages.inc()
+            self._size = (self._size if self._size is not None else self._scan_size()) + len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+            archive_bytes.set(self._size)
+        return digest
+
+    def _files(self) -> Iterator[Tuple[str, os.stat_result]]:
+        if not os.path.isdir(self.directory):
+            return
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith('.z'):
+                    yield entry.path, entry.stat()
+
+    def _scan_size(self) -> int:
+        return sum(stat.st_size for _, stat in self._files())
+
+    def _evict(self):
+        # Oldest first until the archive is back under 90% of its cap
+        target = self.max_bytes * 0.9
+        evicted = set()
+        for path, stat in sorted(self._files(), key=lambda item: item[1].st_mtime):
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= stat.st_size
+                evicted.add(os.path.basename(path)[:-2])
+            except OSError:
+                pass
+        if evicted:
+            self._prune_index(evicted)
+
+    def _prune_index(self, evicted):
+        # Rewrite the index without the evicted pages' entries
+        index_path = self._index_path()
+        try:
+            with open(index_path, encoding='utf-8') as f:
+                lines = [line for line in f if line.strip() and json.loads(line).get('hash') not in evicted]
+            tmp = f"{index_path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+            os.replace(tmp, index_path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not prune the page archive index: {e}")
+
+    def pages(self) -> Iterator[Tuple[str, bytes]]:
+        """Yield (hash, page) for every archived page, oldest first"""
+        for path, _ in sorted(self._files(), key=lambda item: item[1].st_mtime):
+            with open(path, 'rb') as f:
+                yield os.path.basename(path)[:-2], zlib.decompress(f.read())
+
+
+def events_digest(events) -> str:
+    return hashlib.sha256(json.dumps(events, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def replay(archive: PageArchive, repeat: int = 1, save: str = None, compare: str = None) -> int:
+    """Re-parse every archived page, print throughput and optionally check against a baseline"""
+    from .scraper import VOCOScraper
+    parser = VOCOScraper()
+    results: Dict[str, Dict] = {}
+    pages = list(archive.pages())
+    if not pages:
+        print(f"No pages archived in {archive.directory}")
+        return 1
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for digest, page in pages:
+            events = parser._parse_page(page)
+            results[digest] = {'events': len(events), 'digest': events_digest(events)}
+    elapsed = time.perf_counter() - started
+    parsed = len(pages) * repeat
+    total_events = sum(result['events'] for result in results.values())
+    print(f"Parsed {parsed} pages ({total_events} events per pass) in {elapsed:.2f}s: "
+          f"{elapsed / parsed * 1000:.2f} ms/page, {parsed / elapsed:.1f} pages/s")
+
+    status = 0
+    if compare:
+        with open(compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        changed = [d for d, result in results.items() if d in baseline and baseline[d]['digest'] != result['digest']]
+        for digest in changed:
+            print(f"CHANGED {digest}: {baseline[digest]['events']} -> {results[digest]['events']} events")
+        print(f"{len(changed)} of {len(results)} pages parse differently than {compare}")
+        status = 1 if changed else 0
+    if save:
+        with open(save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+        print(f"Saved parse results to {save}")
+    return status
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.archive', description='VOCO raw page archive')
+    parser.add_argument('--dir', help='archive directory (default: $DATA_DIR/page_archive)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='show archive size')
+    replay_parser = commands.add_parser('replay', help='re-parse all archived pages')
+    replay_parser.add_argument('--repeat', type=int, default=1, help='passes over the archive for benchmarking')
+    replay_parser.add_argument('--save', help='write per-page parse results to a JSON file')
+    replay_parser.add_argument('--compare', help='compare against results saved with --save')
+    args = parser.parse_args(argv)
+
+    archive = PageArchive(directory=args.dir)
+    if args.command == 'stats':
+        files = list(archive._files())
+        size = sum(stat.st_size for _, stat in files)
+        print(f"{len(files)} pages, {size / 1024:.1f} KiB compressed in {archive.directory} (cap {archive.max_bytes / 1024 / 1024:.0f} MiB)")
+        return 0
+    return replay(archive, repeat=max(1, args.repeat), save=args.save, compare=args.compare)
+
+
+# Global archive, written to by the scraper when PAGE_ARCHIVE=1
+archive = PageArchive()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Week cache backends for parsed VOCO schedules
+"""
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# (oppegrupp, monday ISO date)
+WeekKey = Tuple[int, str]
+
+
+class MemoryWeekCache:
+    """Process-local LRU cache of parsed weeks"""
+
+    def __init__(self, max_entries: int = None):
+        if max_entries is None:
+            max_entries = int(os.getenv('SCHEDULE_CACHE_MAX_WEEKS', '512'))
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[WeekKey, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: WeekKey) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: WeekKey, entry: Dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def keys(self) -> List[WeekKey]:
+        with self._lock:
+            return list(self._entries)
+
+    def prune(self, before: str) -> int:
+        """Drop weeks whose monday is before the given ISO date; returns how many"""
+        with self._lock:
+            old = [key for key in self._entries if key[1] < before]
+            for key in old:
+                del self._entries[key]
+            return len(old)
+
+
+def encode_events(events: List[Dict]) -> bytes:
+    """Compact serialization: minified JSON, zlib-compressed"""
+    return zlib.compress(json.dumps(events, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_events(data) -> List[Dict]:
+    # Rows written before compression hold plain JSON text
+    if isinstance(data, bytes):
+        data = zlib.decompress(data).decode('utf-8')
+    return json.loads(data)
+
+
+class SQLiteWeekCache:
+    """Week cache in a SQLite file, shared by all bot processes and kept across restarts"""
+
+    def __init__(self, path: str = None):
+        if path is None:
+            data_dir = os.getenv('DATA_DIR', '.')
+            path = os.getenv('SCHEDULE_CACHE_PATH', os.path.join(data_dir, 'schedule_cache.db'))
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS weeks (
+                oppegrupp INTEGER NOT NULL,
+                monday TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                events TEXT NOT NULL,
+                PRIMARY KEY (oppegrupp, monday)
+            )
+        """)
+        # Added later: hash of the raw page the events were parsed from
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(weeks)")}
+        if 'hash' not in columns:
+            conn.execute("ALTER TABLE weeks ADD COLUMN hash TEXT")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; the scraper runs in worker threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+        return conn
+
+    def get(self, key: WeekKey) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT fetched_at, events, hash FROM weeks WHERE oppegrupp = ? AND monday = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        return {'events': decode_events(row[1]), 'fetched_at': row[0], 'hash': row[2]}
+
+    def put(self, key: WeekKey, entry: Dict):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO weeks (oppegrupp, monday, fetched_at, events, hash) VALUES (?, ?, ?, ?, ?)",
+            (key[0], key[1], entry['fetched_at'], encode_events(entry['events']), entry.get('hash'))
+        )
+        conn.commit()
+
+    def keys(self) -> List[WeekKey]:
+        rows = self._conn().execute("SELECT oppegrupp, monday FROM weeks ORDER BY fetched_at").fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def prune(self, before: str) -> int:
+        """Delete weeks whose monday is before the given ISO date; returns how many"""
+        conn = self._conn()
+        deleted = conn.execute("DELETE FROM weeks WHERE monday < ?", (before,)).rowcount
+        conn.commit()
+        return deleted
+
+
+def create_week_cache():
+    """Create the cache backend selected by SCHEDULE_CACHE_BACKEND (sqlite or memory)"""
+    backend = os.getenv('SCHEDULE_CACHE_BACKEND', 'sqlite').lower()
+    if backend == 'memory':
+        return MemoryWeekCache()
+    return SQLiteWeekCache()
@@ -0,0 +1,144 @@
+"""
+Schedule change detection: polls VOCO and reports lessons that were added, moved or cancelled
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .database import db
+from .metrics import metrics
+from .programs import DEFAULT_PROGRAM
+from .scraper import VOCOScraper
+
+polled_weeks = metrics.counter('schedule_poll_weeks_total', 'Weeks polled for changes')
+unchanged_weeks = metrics.counter('schedule_poll_unchanged_total', 'Polled weeks skipped because the page hash was unchanged')
+detected_changes = metrics.counter('schedule_changes_total', 'Lesson changes detected by the poller')
+
+# Fields whose change makes a lesson "moved"
+TRACKED_FIELDS = ('date', 'start_time', 'end_time', 'room')
+
+
+def _by_plan(events: List[Dict], today: str) -> Dict[str, List[Dict]]:
+    """Upcoming events grouped by plan_id, each group ordered by start"""
+    groups: Dict[str, List[Dict]] = {}
+    for event in events:
+        if event.get('date', '') < today or not event.get('subject', '').strip() or event.get('subject') == 'Tegevuspäev':
+            continue
+        groups.setdefault(event['plan_id'], []).append(event)
+    for group in groups.values():
+        group.sort(key=lambda event: event.get('start', ''))
+    return groups
+
+
+def diff_events(old: List[Dict], new: List[Dict], today: str = None) -> Dict[str, list]:
+    """Compare two parsed weeks by plan_id.
+
+    A plan_id can occur several times a week. Occurrences on the same date and
+    start time are matched first; only the remaining ones are paired (in start
+    order) as moves. Returns {'added': [event], 'cancelled': [event],
+    'moved': [(old, new)]} covering lessons from today on.
+
+    Cancelling the Wednesday of a Mon/Wed/Fri lesson is one cancellation, not a move:
+
+    >>> week = [{'plan_id': '1', 'subject': 'Matemaatika', 'date': day, 'start': day + 'T08:30',
+    ...          'start_time': '08:30', 'end_time': '10:00', 'room': 'A310'}
+    ...         for day in ('2025-01-13', '2025-01-15', '2025-01-17')]
+    >>> changes = diff_events(week, [week[0], week[2]], today='2025-01-13')
+    >>> [event['date'] for event in changes['cancelled']], changes['moved'], changes['added']
+    (['2025-01-15'], [], [])
+    """
+    today = today or date.today().isoformat()
+    old_plans, new_plans = _by_plan(old, today), _by_plan(new, today)
+    changes = {'added': [], 'cancelled': [], 'moved': []}
+    for plan_id in old_plans.keys() | new_plans.keys():
+        before, after = old_plans.get(plan_id, []), new_plans.get(plan_id, [])
+        # Same slot on both sides: only the end time or room can have changed
+        slots: Dict[tuple, List[Dict]] = {}
+        for event in after:
+            slots.setdefault((event.get('date'), event.get('start_time')), []).append(event)
+        unmatched_before = []
+        for old_event in before:
+            same_slot = slots.get((old_event.get('date'), old_event.get('start_time')))
+            if same_slot:
+                new_event = same_slot.pop(0)
+                if any(old_event.get(field) != new_event.get(field) for field in TRACKED_FIELDS):
+                    changes['moved'].append((old_event, new_event))
+            else:
+                unmatched_before.append(old_event)
+        unmatched_after = [event for events in slots.values() for event in events]
+        unmatched_after.sort(key=lambda event: event.get('start', ''))
+        for old_event, new_event in zip(unmatched_before, unmatched_after):
+            changes['moved'].append((old_event, new_event))
+        changes['cancelled'].extend(unmatched_before[len(unmatched_after):])
+        changes['added'].extend(unmatched_after[len(unmatched_before):])
+    for kind in ('added', 'cancelled'):
+        changes[kind].sort(key=lambda event: event.get('start', ''))
+    changes['moved'].sort(key=lambda pair: pair[1].get('start', ''))
+    return changes
+
+
+class ChangeDetector:
+    """Polls the current and next week of the programs servers follow"""
+
+    def __init__(self, weeks: int = 2):
+        self.weeks = weeks
+        # async notifier(program, changes) set by main.py
+        self.notifier: Optional[Callable[[str, Dict[str, list]], Awaitable]] = None
+
+    async def poll(self):
+        """Poll every program with a tunniplaan channel and notify about changes"""
+        _, tunniplaan_channels = await db.get_channels()
+        server_programs = await db.get_server_programs()
+        programs = {server_programs.get(guild_id, DEFAULT_PROGRAM) for guild_id in tunniplaan_channels}
+        for program in sorted(programs):
+            try:
+                await self.poll_program(program)
+            except Exception as e:
+                print(f"⚠️ Change poll failed for {program}: {e}")
+
+    async def poll_program(self, program: str) -> Dict[str, list]:
+        today = date.today()
+        monday = today - timedelta(days=today.weekday())
+        total = {'added': [], 'cancelled': [], 'moved': []}
+        for week in range(self.weeks):
+            day = datetime.combine(monday + timedelta(weeks=week), datetime.min.time())
+            changes = await self._poll_week(program, day)
+            for kind, items in changes.items():
+                total[kind].extend(items)
+
+        count = sum(len(items) for items in total.values())
+        if count:
+            detected_changes.inc(count)
+            if self.notifier is not None:
+                await self.notifier(program, total)
+        return total
+
+    async def _poll_week(self, program: str, day: datetime) -> Dict[str, list]:
+        scraper = VOCOScraper(program)
+        if not scraper.breaker.allow_request():
+            return {}
+        polled_weeks.inc()
+        events = await asyncio.to_thread(scraper.refresh_week, day)
+        monday = day.strftime('%Y-%m-%d')
+
+        snapshot = await db.get_snapshot(scraper.oppegrupp, monday)
+        if snapshot is not None and snapshot['hash'] == scraper.payload_hash:
+            # Same page as last time: nothing to parse, diff or render
+            unchanged_weeks.inc()
+            return {}
+
+        await db.save_snapshot(scraper.oppegrupp, monday, scraper.payload_hash, events)
+        if snapshot is None:
+            # First sight of this week is the baseline, not a change
+            return {}
+        return diff_events(snapshot['events'], events)
+
+
+# Global change detector
+changes = ChangeDetector()
+
+
+if __name__ == '__main__':
+    # python -m src.changes runs the diff examples above
+    import doctest
+    doctest.testmod()
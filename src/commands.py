@@ -1,24 +1,121 @@
 import discord
 import os
+import io
 import re
-from datetime import datetime
-from .scraper import VOCOScraper
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from .scraper import ScheduleUnavailableError
+from .schedule import schedule, resolve_date_param, MAX_RANGE_DAYS
+from .render import program_display, build_range_embeds
+from .programs import registry
+from .index import schedule_index
+from .memory import memory_report
+from .ical import stream_calendar
 from .database import db
+from .scheduler import broadcaster, reminders, parse_broadcast_time, DEFAULT_BROADCAST_TIME, DEFAULT_TIMEZONE, LESSON_TIMEZONE
+from .tracing import tracer, traced
+from .webhooks import webhooks
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 async def init_database():
-    """Initialize the database and migrate from JSON if needed"""
-    try:
-        # Initialize database
-        await db.init_db()
-        
-        # Migrate from JSON if it exists
-        data_dir = os.getenv('DATA_DIR', '.')
-        json_file_path = os.path.join(data_dir, 'channels.json')
-        await db.migrate_from_json(json_file_path)
-        
-        print(f"📢 Database initialized successfully")
-    except Exception as e:
-        print(f"⚠️ Error initializing database: {e}")
+    """Initialize the database; the JSON import runs only once (tracked in schema_version).
+    
+    Errors are raised: the bot must not run on a half-migrated schema.
+    """
+    data_dir = os.getenv('DATA_DIR', '.')
+    json_file_path = os.path.join(data_dir, 'channels.json')
+    await db.migrate(json_file_path)
+    
+    print(f"📢 Database initialized successfully")
+
+# Days shown by !opetaja and !ruum, starting today
+LOOKUP_DAYS = int(os.getenv('LOOKUP_DAYS', '7'))
+
+# Default duration for !vaba-ruum in minutes (one double lesson)
+FREE_ROOM_MINUTES = int(os.getenv('FREE_ROOM_MINUTES', '90'))
+
+DURATION_PATTERN = re.compile(r'^(?:(\d+)h)?\s*(?:(\d+)\s*(?:min|m)?)?$')
+
+def parse_duration(text: str) -> int:
+    """Parse '90', '90min', '1h' or '1h30' to minutes; raises ValueError"""
+    match = DURATION_PATTERN.match(text.lower().strip())
+    if not match or not any(match.groups()):
+        raise ValueError(f"invalid duration: {text}")
+    hours, mins = match.groups()
+    total = int(hours or 0) * 60 + int(mins or 0)
+    if total <= 0:
+        raise ValueError(f"invalid duration: {text}")
+    return total
+
+# Weeks exported by !tunniplaan ical unless a count is given
+ICAL_COMMAND_WEEKS = int(os.getenv('ICAL_COMMAND_WEEKS', '4'))
+
+def parse_role_pairs(guild: discord.Guild, parts: List[str]) -> Tuple[List[Tuple[discord.Role, str]], Optional[str]]:
+    """Parse '<@&role> emoji' pairs; returns (pairs, None) or ([], error message)"""
+    roles_data = []
+    i = 0
+    while i < len(parts):
+        if parts[i].startswith('<@&') and parts[i].endswith('>'):
+            # Role mention found
+            role_id = int(parts[i][3:-1])
+            role = guild.get_role(role_id)
+            if not role:
+                return [], f"❌ Rolli ID {role_id} ei leitud!"
+            
+            # Check if bot can manage this role
+            if role.position >= guild.me.top_role.position:
+                return [], f"❌ Ma ei saa hallata rolli {role.name} - see on minu rollist kõrgemal!"
+            
+            # Get emoji
+            if i + 1 < len(parts):
+                roles_data.append((role, parts[i + 1]))
+                i += 2
+            else:
+                return [], f"❌ Emoji puudub rolli {role.name} jaoks!"
+        else:
+            return [], f"❌ Vale formaat: {parts[i]} - kasuta @roll formaati!"
+    
+    if not roles_data:
+        return [], "❌ Pole ühtegi kehtivat rolli-emoji paari!"
+    return roles_data, None
+
+def build_roles_embed(roles_data: List[Tuple[discord.Role, str]], only_one: bool) -> discord.Embed:
+    """Embed of a role selection message"""
+    embed = discord.Embed(
+        title="🎭 Vali oma rollid",
+        description="Kliki reaktsioonile, et rolli saada või eemaldada:",
+        color=0x00ff00,
+        timestamp=datetime.now()
+    )
+    
+    if only_one:
+        embed.add_field(
+            name="ℹ️ Märkus",
+            value="Saad valida ainult ühe rolli!",
+            inline=False
+        )
+    
+    for role, emoji in roles_data:
+        embed.add_field(
+            name=f"{emoji} {role.name}",
+            value=f"Kliki reaktsioonile, et rolli saada",
+            inline=False
+        )
+    
+    embed.set_footer(text="Kasuta !vota-rollid uue sõnumi loomiseks")
+    return embed
+
+async def publish_role_message(message: discord.Message, guild_id: str, channel_id: int, roles_data, only_one: bool):
+    """Add the reactions of a role selection message and store it"""
+    with tracer.span('send.reactions', count=len(roles_data)):
+        for role, emoji in roles_data:
+            try:
+                await message.add_reaction(emoji)
+            except discord.HTTPException:
+                pass
+    
+    roles_dict = {emoji: {'role_id': role.id, 'role_name': role.name} for role, emoji in roles_data}
+    await db.save_role_message(str(message.id), guild_id, channel_id, only_one, roles_dict)
 
 def setup_info_commands(bot):
     """Setup info-related commands"""
@@ -47,8 +144,16 @@ def setup_info_commands(bot):
                 "`!tunniplaan` - Näita tänaseid tunde\n"
                 "`!tunniplaan homme` - Näita homme tunde\n"
                 "`!tunniplaan DD.MM.YYYY` - Näita kindla kuupäeva tunde\n"
-                "`!grupp ITA25/ITS25` - (Admin) Määra serveri õppeprogramm\n"
+                "`!tunniplaan nädal` / `!tunniplaan järgmine nädal` - Näita terve nädala tunde\n"
+                "`!tunniplaan DD.MM.YYYY-DD.MM.YYYY` - Näita tunde kuupäevavahemikus\n"
+                "`!tunniplaan ical [nädalaid]` - Lae tunniplaan kalendrifailina (.ics)\n"
+                "`!grupp ITA25/ITS25/...` - (Admin) Määra serveri õppeprogramm (kõik VOCO grupid)\n"
+                "`!opetaja <nimi>` - Näita õpetaja tunde kõigis gruppides\n"
+                "`!ruum <ruum>` - Näita ruumi tunde, nt `!ruum A310`\n"
+                "`!vaba-ruum [HH:MM] [kestus]` - Leia praegu (või kellaajal) vabad ruumid, nt `!vaba-ruum 12:00 1h30`\n"
                 "`!tunniplaan-set [#kanal]` - (Admin) Määra automaatne tunniplaan kanal\n"
+                "`!tunniplaan-aeg HH:MM [ajavöönd]` - (Admin) Määra automaatse tunniplaani kellaaeg\n"
+                "`!meeldetuletus [minutid/väljas]` - (Admin) Tuleta tunde meelde N minutit enne algust\n"
                 "`!tunniplaan-remove` - (Admin) Eemalda tunniplaan kanal"
             ),
             inline=False
@@ -81,6 +186,7 @@ def setup_info_commands(bot):
             name="🔧 Muud",
             value=(
                 "`!hello` - Tervitus\n"
+                "`!mälu` - (Admin) Näita boti mälukasutust\n"
                 "`!help` - Näita seda abi sõnumit"
             ),
             inline=False
@@ -95,6 +201,7 @@ def setup_info_commands(bot):
                 "`!tunniplaan` - Tänased tunnid\n"
                 "`!tunniplaan homme` - Homse tunnid\n"
                 "`!tunniplaan 15.01.2025` - Tunnid 15. jaanuaril 2025\n"
+                "`!tunniplaan 01.10.2025-31.10.2025` - Kõik oktoobri tunnid\n"
                 "`!info Tähtis teade!` - Saada teade info kanalile\n"
                 "`!vota-rollid @Student 🎓 @Mentor 👨‍🏫 True` - Loo rollide valimine"
             ),
@@ -107,12 +214,12 @@ def setup_info_commands(bot):
 
     @bot.command(name='grupp')
     async def grupp_selection(ctx, program_code=None):
-        """Vali serveri õppeprogramm ITA25 või ITS25 (ainult administraatoritele)"""
+        """Vali serveri õppeprogramm, nt ITA25 või ITS25 (ainult administraatoritele)"""
         if program_code is None:
             # Show current program selection for the server
             server_program = await db.get_server_program(str(ctx.guild.id))
             if server_program:
-                program_name = "ITA25" if server_program == 'ITA25' else "ITS25 (2028)"
+                program_name = program_display(server_program)
                 await ctx.send(f"📚 **Serveri programm:** {program_name}")
             else:
                 await ctx.send("📚 **Serveri programm pole valitud!** Admin saab kasutada `!grupp ITA25` või `!grupp ITS25`")
@@ -125,141 +232,223 @@ def setup_info_commands(bot):
         
         # Validate program code
         program_code = program_code.upper()
-        if program_code not in ['ITA25', 'ITS25']:
-            await ctx.send("❌ **Vale programm!** Kasuta `ITA25` või `ITS25`")
+        if program_code not in registry:
+            # Suggest groups sharing the first letters of what was typed
+            suggestions = registry.complete(program_code[:3], limit=10) or registry.complete('', limit=10)
+            await ctx.send(f"❌ **Vale programm!** Näiteks: {', '.join(f'`{code}`' for code in suggestions)}")
             return
         
         # Save server's program preference
         await db.set_server_program(str(ctx.guild.id), program_code)
         
         # Send confirmation
-        program_name = "ITA25" if program_code == 'ITA25' else "ITS25 (2028)"
+        program_name = program_display(program_code)
         await ctx.send(f"✅ **Serveri programm määratud:** {program_name}\n"
                       f"📅 Kõik `!tunniplaan` käsud ja automaatsed teated näitavad nüüd {program_name} tunde")
 
     @bot.command(name='tunniplaan')
+    @traced('tunniplaan')
     async def tunniplaan(ctx, *, date_param=None):
-        """Näita tunde serveri programmile. Kasutamine: !tunniplaan, !tunniplaan homme, !tunniplaan 15.01.2025"""
+        """Näita tunde serveri programmile. Kasutamine: !tunniplaan, !tunniplaan homme, !tunniplaan 15.01.2025, !tunniplaan nädal, !tunniplaan järgmine nädal, !tunniplaan 01.10.2025-31.10.2025"""
         # Get server's program preference
         server_program = await db.get_server_program(str(ctx.guild.id))
         if not server_program:
             await ctx.send("📚 **Serveri programm pole valitud!** Admin saab kasutada `!grupp ITA25` või `!grupp ITS25`")
             return
         
-        await ctx.send("🔍 Laen tunde...")
+        # Calendar export: !tunniplaan ical [nädalaid]
+        if date_param and date_param.lower().split()[0] == 'ical':
+            await send_calendar(ctx, server_program, date_param.split()[1:])
+            return
         
+        # Determine which date or date range to fetch
         try:
-            scraper = VOCOScraper(server_program)
-            
-            # Determine which date to fetch
-            program_display = "ITA25" if server_program == 'ITA25' else "ITS25 (2028)"
-            
-            if date_param is None:
-                # Today
-                lessons = scraper.get_todays_lessons()
-                date_title = f"Tänased tunnid ({program_display})"
-            elif date_param.lower() == 'homme':
-                # Tomorrow
-                lessons = scraper.get_lessons_for_date('tomorrow')
-                date_title = f"Homsed tunnid ({program_display})"
-            else:
-                # Specific date
-                try:
-                    # Parse date in DD.MM.YYYY format
-                    parsed_date = datetime.strptime(date_param, '%d.%m.%Y')
-                    lessons = scraper.get_lessons_for_date(parsed_date.strftime('%d.%m.%Y'))
-                    date_title = f"Tunnid {date_param} ({program_display})"
-                except ValueError:
-                    await ctx.send("❌ Vale kuupäeva formaat! Kasuta: DD.MM.YYYY (nt. 15.01.2025)")
-                    return
-            
-            if not lessons:
-                if date_param is None:
-                    await ctx.send("📅 **Täna tunde ei ole** - Vaba päev! 🎉")
-                elif date_param.lower() == 'homme':
-                    await ctx.send("📅 **Homme tunde ei ole** - Vaba päev! 🎉")
-                else:
-                    await ctx.send(f"📅 **{date_param} tunde ei ole** - Vaba päev! 🎉")
-                return
-            
-            # Sort lessons by time
-            lessons.sort(key=lambda x: x.get('start_time', ''))
-            
-            # Create embed
-            embed = discord.Embed(
-                title=f"📅 {date_title}",
-                color=0x00ff00,
-                timestamp=datetime.now()
+            start, end = resolve_date_param(date_param)
+        except ValueError:
+            await ctx.send(
+                "❌ Vale kuupäeva formaat! Kasuta: DD.MM.YYYY (nt. 15.01.2025), "
+                f"DD.MM.YYYY-DD.MM.YYYY (kuni {MAX_RANGE_DAYS} päeva), `nädal` või `järgmine nädal`"
             )
+            return
+        
+        # Someone in this channel just asked for the same days: link to that post instead
+        dedup_key = (ctx.channel.id, server_program, start, end)
+        pending = schedule.claim_post(dedup_key)
+        if pending is not None:
+            url = await schedule.wait_post(pending)
+            if url:
+                await ctx.reply(f"📌 Sama tunniplaan on just postitatud: {url}", mention_author=False)
+                return
+        
+        message = None
+        try:
+            with tracer.span('send'):
+                await ctx.send("🔍 Laen tunde...")
             
-            # Add lessons to embed
-            for i, lesson in enumerate(lessons):
-                time = f"{lesson.get('start_time', '')}-{lesson.get('end_time', '')}"
-                
-                # Format lesson info
-                lesson_info = ""
-                
-                # Handle multiple subjects/teachers/rooms (grouped by time)
-                if 'teachers' in lesson and 'rooms' in lesson and 'subjects' in lesson:
-                    # Multiple subjects/teachers/rooms (grouped by time slot)
-                    teachers = lesson['teachers']
-                    rooms = lesson['rooms']
-                    subjects = lesson['subjects']
-                    
-                    for j, (teacher, room, subject) in enumerate(zip(teachers, rooms, subjects)):
-                        # Clean subject name for display
-                        clean_subject = re.sub(r'_\s*Rühm\s*\d+|_\s*R\d+', '', subject).strip()
-                        clean_subject = re.sub(r'\s*Rühm\s*\d+|\s*R\d+', '', clean_subject).strip()
-                        clean_subject = re.sub(r'_\s*$', '', clean_subject).strip()
-                        
-                        lesson_info += f"**{clean_subject}**\n"
-                        
-                        # Show group info if present
-                        group_suffix = re.search(r'_\s*Rühm\s*\d+|_\s*R\d+', subject)
-                        if group_suffix:
-                            lesson_info += f"📚 {group_suffix.group(0).replace('_', ' ').strip()}: "
-                        elif 'Rühm' in subject or 'R1' in subject or 'R2' in subject:
-                            # Extract group info from subject name
-                            group_match = re.search(r'(Rühm\s*\d+|R\d+)', subject)
-                            if group_match:
-                                lesson_info += f"📚 {group_match.group(0)}: "
-                        
-                        if teacher and teacher != 'Tundmatu':
-                            lesson_info += f"👨‍🏫 {teacher}"
-                        if room and room != 'Tundmatu ruum':
-                            lesson_info += f" - 🏫 {room}"
-                        if j < len(teachers) - 1:
-                            lesson_info += "\n\n"
-                else:
-                    # Single subject/teacher/room (original format)
-                    subject = lesson.get('subject', 'Tundmatu aine')
-                    clean_subject = re.sub(r'_\s*Rühm\s*\d+|_\s*R\d+', '', subject).strip()
-                    clean_subject = re.sub(r'\s*Rühm\s*\d+|\s*R\d+', '', clean_subject).strip()
-                    clean_subject = re.sub(r'_\s*$', '', clean_subject).strip()
-                    
-                    lesson_info += f"**{clean_subject}**\n"
-                    
-                    teacher = lesson.get('teacher', 'Tundmatu')
-                    room = lesson.get('room', 'Tundmatu ruum')
-                    if teacher and teacher != 'Tundmatu':
-                        lesson_info += f"👨‍🏫 {teacher}"
-                    if room and room != 'Tundmatu ruum':
-                        lesson_info += f" - 🏫 {room}"
-                
-                embed.add_field(
-                    name=f"Tund {i+1} - ⏰ {time}",
-                    value=lesson_info,
-                    inline=False
-                )
-            
-            embed.set_footer(text=f"Kokku {len(lessons)} tundi")
-            await ctx.send(embed=embed)
+            if start == end:
+                result = await schedule.render_day(server_program, start)
+                with tracer.span('send'):
+                    message = await ctx.send(content=result['content'], embed=result['embed'])
+            else:
+                result = await schedule.render_range(server_program, start, end)
+                with tracer.span('send', pages=len(result['embeds'])):
+                    if result['content']:
+                        message = await ctx.send(result['content'])
+                    for embed in result['embeds']:
+                        sent = await ctx.send(embed=embed)
+                        # Link to the first page when deduplicating
+                        message = message or sent
             
+        except ScheduleUnavailableError as e:
+            await ctx.send("❌ VOCO tunniplaan pole hetkel kättesaadav, proovi hiljem uuesti.")
+            print(f"Error in tunniplaan command: {e}")
         except Exception as e:
             await ctx.send(f"❌ Viga tundide laadimisel: {e}")
             print(f"Error in tunniplaan command: {e}")
+        finally:
+            if pending is None:
+                schedule.finish_post(dedup_key, message)
+
+    async def send_calendar(ctx, server_program, args):
+        """Attach an .ics file with the next weeks of the server's program"""
+        try:
+            weeks = int(args[0]) if args else ICAL_COMMAND_WEEKS
+        except ValueError:
+            await ctx.send("❌ Kasutamine: `!tunniplaan ical [nädalate arv]`")
+            return
+        weeks = min(max(weeks, 1), 26)
+        
+        buffer = io.BytesIO()
+        async for chunk in stream_calendar(server_program, date.today(), weeks):
+            buffer.write(chunk)
+        buffer.seek(0)
+        
+        with tracer.span('send'):
+            await ctx.send(
+                f"📆 {program_display(server_program)} tunniplaan järgmiseks {weeks} nädalaks. "
+                "Impordi fail oma kalendrisse (Google, Outlook, Apple).",
+                file=discord.File(buffer, filename=f"{server_program}-tunniplaan.ics")
+            )
+
+    async def send_lookup(ctx, title: str, days):
+        """Send lessons found in the teacher/room index"""
+        if schedule_index.built_at is None:
+            await ctx.send("⏳ Tunniplaanide indeks alles laeb, proovi hetke pärast uuesti.")
+            return
+        if not days:
+            await ctx.send(f"📅 **{title}**: järgmisel {LOOKUP_DAYS} päeval tunde ei ole.")
+            return
+        with tracer.span('send'):
+            for embed in build_range_embeds(title, days):
+                await ctx.send(embed=embed)
+
+    @bot.command(name='opetaja')
+    @traced('opetaja')
+    async def opetaja(ctx, *, name=None):
+        """Näita õpetaja tunde kõigis gruppides. Kasutamine: !opetaja Mari Maasikas"""
+        if not name:
+            await ctx.send("❌ Kasutamine: `!opetaja <nimi>`")
+            return
+        matches = schedule_index.find_teachers(name)
+        if not matches:
+            await ctx.send(f"❌ Õpetajat `{name}` ei leitud.")
+            return
+        if len(matches) > 1:
+            await ctx.send(f"🔍 Leidsin mitu õpetajat: {', '.join(matches)}. Täpsusta nime.")
+            return
+        start = date.today()
+        end = start + timedelta(days=LOOKUP_DAYS - 1)
+        await send_lookup(ctx, f"Õpetaja {matches[0]}", schedule_index.teacher_lessons(matches[0], start, end))
+
+    @bot.command(name='ruum')
+    @traced('ruum')
+    async def ruum(ctx, room=None):
+        """Näita ruumi tunde kõigis gruppides. Kasutamine: !ruum A310"""
+        if not room:
+            await ctx.send("❌ Kasutamine: `!ruum <ruum>`, nt `!ruum A310`")
+            return
+        code = schedule_index.find_room(room)
+        if code is None:
+            await ctx.send(f"❌ Ruumi `{room}` ei leitud.")
+            return
+        start = date.today()
+        end = start + timedelta(days=LOOKUP_DAYS - 1)
+        await send_lookup(ctx, f"Ruum {code}", schedule_index.room_lessons(code, start, end))
+
+    @bot.command(name='vaba-ruum')
+    @traced('vaba-ruum')
+    async def vaba_ruum(ctx, aeg=None, kestus=None):
+        """Leia vabad ruumid. Kasutamine: !vaba-ruum, !vaba-ruum 12:00, !vaba-ruum 12:00 1h30"""
+        if schedule_index.built_at is None:
+            await ctx.send("⏳ Tunniplaanide indeks alles laeb, proovi hetke pärast uuesti.")
+            return
+        # Lesson times are Tallinn time, the container clock usually is not
+        now = datetime.now(LESSON_TIMEZONE)
+        try:
+            if aeg is None or aeg.lower() in ('nüüd', 'nuud'):
+                start = now.hour * 60 + now.minute
+            else:
+                start = datetime.strptime(aeg, '%H:%M')
+                start = start.hour * 60 + start.minute
+            duration = parse_duration(kestus) if kestus else FREE_ROOM_MINUTES
+        except ValueError:
+            await ctx.send("❌ Kasutamine: `!vaba-ruum [HH:MM] [kestus]`, nt `!vaba-ruum 12:00 1h30`")
+            return
+        
+        free = schedule_index.free_rooms(now.date(), start, duration)
+        window = f"{start // 60:02d}:{start % 60:02d}-{(start + duration) // 60 % 24:02d}:{(start + duration) % 60:02d}"
+        if not free:
+            await ctx.send(f"🏫 Ajal {window} pole ühtegi vaba ruumi.")
+            return
+        
+        # Computer classrooms first, they are what people usually look for
+        free.sort(key=lambda room: ('arvuti' not in room[1].lower(), room[0]))
+        lines = []
+        for code, name, next_start in free[:30]:
+            until = f" (vaba kuni {next_start // 60:02d}:{next_start % 60:02d})" if next_start is not None else " (vaba päeva lõpuni)"
+            lines.append(f"🏫 **{name}**{until}")
+        if len(free) > 30:
+            lines.append(f"... ja veel {len(free) - 30} ruumi")
+        
+        embed = discord.Embed(
+            title=f"🏫 Vabad ruumid {window}",
+            description="\n".join(lines),
+            color=0x00ff00,
+            timestamp=now
+        )
+        embed.set_footer(text=f"Kokku {len(free)} vaba ruumi")
+        with tracer.span('send'):
+            await ctx.send(embed=embed)
+
+    @bot.command(name='mälu', aliases=['malu'])
+    async def malu(ctx):
+        """Näita boti mälukasutust ja vahemälu suurust"""
+        if not ctx.author.guild_permissions.manage_channels:
+            await ctx.send("❌ Sul on vaja 'Kanalite haldamine' õigust mälukasutuse vaatamiseks.")
+            return
+        
+        report = memory_report(bot)
+        embed = discord.Embed(
+            title="🧠 Mälukasutus",
+            description=f"**{report['rss_bytes'] / (1024 * 1024):.1f} MiB** (RSS)",
+            color=0x00ff00,
+            timestamp=datetime.now()
+        )
+        embed.add_field(
+            name="Vahemälu",
+            value=(
+                f"Serverid: {report['guilds']}\n"
+                f"Liikmed: {report['members']}\n"
+                f"Kasutajad: {report['users']}\n"
+                f"Kanalid: {report['channels']}\n"
+                f"Sõnumid: {report['messages']}"
+            ),
+            inline=False
+        )
+        await ctx.send(embed=embed)
 
     @bot.command(name='info')
+    @traced('info')
     async def info(ctx, *, message=None):
         """Saada olulist teavet info kanalile @everyone pingiga"""
         # Get info channel from database
@@ -298,16 +487,17 @@ def setup_info_commands(bot):
             pass
         
         # Check if there are attachments (images)
-        if ctx.message.attachments:
-            # If there are images, send them with @everyone ping
-            await info_channel.send("@everyone")
-            
-            # Send each attachment
-            for attachment in ctx.message.attachments:
-                await info_channel.send(file=await attachment.to_file())
-        else:
-            # If no images, send text with @everyone ping and attribution
-            await info_channel.send(f"@everyone {message} by {ctx.author.display_name}")
+        with tracer.span('send', attachments=len(ctx.message.attachments)):
+            if ctx.message.attachments:
+                # If there are images, send them with @everyone ping
+                await info_channel.send("@everyone")
+                
+                # Send each attachment
+                for attachment in ctx.message.attachments:
+                    await info_channel.send(file=await attachment.to_file())
+            else:
+                # If no images, send text with @everyone ping and attribution
+                await info_channel.send(f"@everyone {message} by {ctx.author.display_name}")
         
         # Send a confirmation message to the user (like info-set does)
         await ctx.send(f"✅ Info saadetud {info_channel.mention}")
@@ -377,12 +567,90 @@ def setup_info_commands(bot):
         # Get current channels and update tunniplaan channel
         info_channels, tunniplaan_channels = await db.get_channels()
         guild_id = str(ctx.guild.id)
+        if tunniplaan_channels.get(guild_id) != channel.id:
+            # The broadcast webhook belongs to the old channel
+            await webhooks.forget(guild_id)
         tunniplaan_channels[guild_id] = channel.id
         
         # Save to database
         await db.save_channels(info_channels, tunniplaan_channels)
+        await broadcaster.refresh_guild(guild_id)
+        settings = (await db.get_broadcast_settings()).get(guild_id, {})
         await ctx.send(f"✅ Tunniplaan kanal määratud {channel.mention}")
-        await ctx.send("📅 Automaatsed tunniplaan sõnumid saadetakse igal tööpäeval kell 06:00")
+        await ctx.send(
+            f"📅 Automaatsed tunniplaan sõnumid saadetakse igal tööpäeval kell "
+            f"{settings.get('broadcast_time', DEFAULT_BROADCAST_TIME)} ({settings.get('timezone', DEFAULT_TIMEZONE)})"
+        )
+
+    @bot.command(name='tunniplaan-aeg')
+    async def tunniplaan_aeg(ctx, broadcast_time: str = None, tz: str = DEFAULT_TIMEZONE):
+        """Määra automaatse tunniplaani kellaaeg, nt !tunniplaan-aeg 07:30 Europe/Tallinn"""
+        guild_id = str(ctx.guild.id)
+        if broadcast_time is None:
+            settings = (await db.get_broadcast_settings()).get(guild_id)
+            if not settings:
+                await ctx.send("❌ Tunniplaan kanal pole määratud. Kasuta `!tunniplaan-set`.")
+                return
+            await ctx.send(f"📅 Automaatne tunniplaan saadetakse kell {settings['broadcast_time']} ({settings['timezone']})")
+            return
+        
+        # Check if user has permission to manage channels
+        if not ctx.author.guild_permissions.manage_channels:
+            await ctx.send("❌ Sul on vaja 'Kanalite haldamine' õigust tunniplaani kellaaja määramiseks.")
+            return
+        
+        try:
+            broadcast_time = parse_broadcast_time(broadcast_time).strftime('%H:%M')
+        except ValueError:
+            await ctx.send("❌ Vale kellaaeg! Kasuta formaati HH:MM, nt `07:30`")
+            return
+        try:
+            ZoneInfo(tz)
+        except (ZoneInfoNotFoundError, ValueError):
+            await ctx.send(f"❌ Tundmatu ajavöönd `{tz}`! Näiteks `Europe/Tallinn`")
+            return
+        
+        await db.set_broadcast_time(guild_id, broadcast_time, tz)
+        await broadcaster.refresh_guild(guild_id)
+        await ctx.send(f"✅ Automaatne tunniplaan saadetakse igal tööpäeval kell {broadcast_time} ({tz})")
+
+    @bot.command(name='meeldetuletus')
+    async def meeldetuletus(ctx, minutes: str = None):
+        """Postita tunniplaan kanalile meeldetuletus N minutit enne iga tundi, nt !meeldetuletus 10"""
+        guild_id = str(ctx.guild.id)
+        settings = (await db.get_broadcast_settings()).get(guild_id)
+        if not settings:
+            await ctx.send("❌ Tunniplaan kanal pole määratud. Kasuta `!tunniplaan-set`.")
+            return
+        if minutes is None:
+            if settings['reminder_minutes']:
+                await ctx.send(f"⏰ Meeldetuletused tulevad {settings['reminder_minutes']} min enne iga tundi")
+            else:
+                await ctx.send("⏰ Meeldetuletused on väljas. Lülita sisse: `!meeldetuletus 10`")
+            return
+        
+        # Check if user has permission to manage channels
+        if not ctx.author.guild_permissions.manage_channels:
+            await ctx.send("❌ Sul on vaja 'Kanalite haldamine' õigust meeldetuletuste seadistamiseks.")
+            return
+        
+        if minutes.lower() in ('väljas', 'valjas', 'off', '0'):
+            value = 0
+        else:
+            try:
+                value = int(minutes)
+            except ValueError:
+                value = -1
+            if not 1 <= value <= 120:
+                await ctx.send("❌ Kasutamine: `!meeldetuletus [1-120]` või `!meeldetuletus väljas`")
+                return
+        
+        await db.set_reminder_minutes(guild_id, value)
+        await reminders.plan()
+        if value:
+            await ctx.send(f"✅ Meeldetuletused tulevad {value} min enne iga tundi")
+        else:
+            await ctx.send("✅ Meeldetuletused lülitatud välja")
 
     @bot.command(name='tunniplaan-remove')
     async def tunniplaan_remove(ctx):
@@ -407,13 +675,16 @@ def setup_info_commands(bot):
         
         # Clear the tunniplaan channel for this server
         del tunniplaan_channels[guild_id]
+        await webhooks.forget(guild_id)
         
         # Save updated channels to database
         await db.save_channels(info_channels, tunniplaan_channels)
+        await broadcaster.refresh_guild(guild_id)
         
         await ctx.send(f"✅ Tunniplaan kanal eemaldatud: {channel_mention}")
 
     @bot.command(name='vota-rollid')
+    @traced('vota-rollid')
     async def vota_rollid(ctx, *, args):
         """Loo rollide valimise sõnum. Kasutamine: !vota-rollid @roll1 🎭1 @roll2 🎭2 True"""
         # Check if user has permission to manage roles
@@ -432,137 +703,92 @@ def setup_info_commands(bot):
         if only_one:
             parts = [p for p in parts if p not in ["True", "true"]]
         
-        # Parse role-emoji pairs
-        roles_data = []
-        i = 0
-        while i < len(parts):
-            if parts[i].startswith('<@&') and parts[i].endswith('>'):
-                # Role mention found
-                role_id = int(parts[i][3:-1])
-                role = ctx.guild.get_role(role_id)
-                if not role:
-                    await ctx.send(f"❌ Rolli ID {role_id} ei leitud!")
-                    return
-                
-                # Check if bot can manage this role
-                if role.position >= ctx.guild.me.top_role.position:
-                    await ctx.send(f"❌ Ma ei saa hallata rolli {role.name} - see on minu rollist kõrgemal!")
-                    return
-                
-                # Get emoji
-                if i + 1 < len(parts):
-                    emoji = parts[i + 1]
-                    roles_data.append((role, emoji))
-                    i += 2
-                else:
-                    await ctx.send(f"❌ Emoji puudub rolli {role.name} jaoks!")
-                    return
-            else:
-                await ctx.send(f"❌ Vale formaat: {parts[i]} - kasuta @roll formaati!")
-                return
-        
-        if not roles_data:
-            await ctx.send("❌ Pole ühtegi kehtivat rolli-emoji paari!")
+        roles_data, error = parse_role_pairs(ctx.guild, parts)
+        if error:
+            await ctx.send(error)
             return
         
-        # Create embed
-        embed = discord.Embed(
-            title="🎭 Vali oma rollid",
-            description="Kliki reaktsioonile, et rolli saada või eemaldada:",
-            color=0x00ff00,
-            timestamp=datetime.now()
-        )
-        
-        if only_one:
-            embed.add_field(
-                name="ℹ️ Märkus",
-                value="Saad valida ainult ühe rolli!",
-                inline=False
-            )
+        embed = build_roles_embed(roles_data, only_one)
         
-        for role, emoji in roles_data:
-            embed.add_field(
-                name=f"{emoji} {role.name}",
-                value=f"Kliki reaktsioonile, et rolli saada",
-                inline=False
-            )
+        with tracer.span('send'):
+            message = await ctx.send(embed=embed)
         
-        embed.set_footer(text="Kasuta !vota-rollid uue sõnumi loomiseks")
-        
-        message = await ctx.send(embed=embed)
-        
-        # Add reactions for each role
-        for role, emoji in roles_data:
+        # Add reactions for each role and store role data for this message in database
+        await publish_role_message(message, str(ctx.guild.id), ctx.channel.id, roles_data, only_one)
+
+    async def resolve_member(guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+        """Member from the cache, or fetched lazily when the member cache is off (LOW_MEMORY)"""
+        member = guild.get_member(user_id)
+        if member is None:
             try:
-                await message.add_reaction(emoji)
+                with tracer.span('fetch_member'):
+                    member = await guild.fetch_member(user_id)
             except discord.HTTPException:
-                pass
-        
-        # Store role data for this message in database
-        guild_id = str(ctx.guild.id)
-        roles_dict = {emoji: {'role_id': role.id, 'role_name': role.name} for role, emoji in roles_data}
-        
-        await db.save_role_message(
-            str(message.id),
-            guild_id,
-            ctx.channel.id,
-            only_one,
-            roles_dict
-        )
+                return None
+        return member
 
-    @bot.event
-    async def on_reaction_add(reaction, user):
-        """Handle role assignment when user reacts"""
-        if user.bot:
-            return
-        
-        # Check if this is a role selection message
-        if not reaction.message.embeds:
-            return
-        
-        embed = reaction.message.embeds[0]
-        if embed.title != "🎭 Vali oma rollid":
-            return
+    async def role_for_reaction(payload) -> Tuple[Optional[discord.Guild], Optional[Dict], Optional[discord.Role]]:
+        """Return (guild, role message data, role) if the reaction is on a role selection message"""
+        if payload.guild_id is None or payload.user_id == bot.user.id:
+            return None, None, None
         
-        # Get role message data from database
-        message_data = await db.get_role_message(str(reaction.message.id))
+        # Raw events work for messages that are not in the message cache
+        message_data = await db.get_role_message(str(payload.message_id))
         if not message_data:
-            return
-        emoji_str = str(reaction.emoji)
+            return None, None, None
+        role_info = message_data['roles'].get(str(payload.emoji))
+        guild = bot.get_guild(payload.guild_id)
+        if not role_info or not guild:
+            return None, None, None
         
-        if emoji_str not in message_data['roles']:
+        role = guild.get_role(role_info['role_id'])
+        if not role:
+            print(f"❌ Role not found: {role_info['role_id']}")
+            return None, None, None
+        return guild, message_data, role
+
+    @bot.event
+    @traced('on_raw_reaction_add')
+    async def on_raw_reaction_add(payload):
+        """Handle role assignment when user reacts"""
+        guild, message_data, role = await role_for_reaction(payload)
+        if role is None:
             return
         
-        role_id = message_data['roles'][emoji_str]
-        role = reaction.message.guild.get_role(role_id)
-        
-        if not role:
+        # The add event carries the member, so it works without a member cache
+        user = payload.member or await resolve_member(guild, payload.user_id)
+        if user is None or user.bot:
             return
+        emoji_str = str(payload.emoji)
         
         try:
             # Check if user already has this role (toggle behavior)
             if role in user.roles:
                 # User already has the role, remove it
-                await user.remove_roles(role)
+                with tracer.span('send.roles'):
+                    await user.remove_roles(role)
                 print(f"✅ Toggled off role {role.name} for {user.name}")
                 return
             
             # If only one role allowed, remove other roles first
             if message_data['only_one']:
+                message = guild.get_channel(payload.channel_id).get_partial_message(payload.message_id)
                 # Remove all other roles from this message first
-                for other_emoji, other_role_id in message_data['roles'].items():
+                for other_emoji, other_info in message_data['roles'].items():
                     if other_emoji != emoji_str:
-                        other_role = reaction.message.guild.get_role(other_role_id)
+                        other_role = guild.get_role(other_info['role_id'])
                         if other_role and other_role in user.roles:
-                            await user.remove_roles(other_role)
+                            with tracer.span('send.roles'):
+                                await user.remove_roles(other_role)
                             # Remove the reaction for the other role
                             try:
-                                await reaction.message.remove_reaction(other_emoji, user)
-                            except:
+                                await message.remove_reaction(other_emoji, user)
+                            except discord.HTTPException:
                                 pass
             
             # Add the role to the user
-            await user.add_roles(role)
+            with tracer.span('send.roles'):
+                await user.add_roles(role)
             print(f"✅ Added role {role.name} to {user.name}")
         except discord.Forbidden:
             print(f"❌ Forbidden: Cannot manage role {role.name}")
@@ -570,114 +796,40 @@ def setup_info_commands(bot):
             print(f"❌ Error managing role: {e}")
 
     @bot.event
-    async def on_reaction_remove(reaction, user):
+    @traced('on_raw_reaction_remove')
+    async def on_raw_reaction_remove(payload):
         """Handle role removal when user removes reaction"""
-        if user.bot:
-            return
-        
-        print(f"🔍 Reaction removed: {reaction.emoji} by {user.name}")
-        
-        # Check if this is a role selection message
-        if not reaction.message.embeds:
-            print("❌ No embeds in message")
-            return
-        
-        embed = reaction.message.embeds[0]
-        if embed.title != "🎭 Vali oma rollid":
-            print(f"❌ Wrong embed title: {embed.title}")
-            return
-        
-        # Get role message data from database
-        message_data = await db.get_role_message(str(reaction.message.id))
-        if not message_data:
-            print(f"❌ Message not found in database: {reaction.message.id}")
+        guild, _, role = await role_for_reaction(payload)
+        if role is None:
             return
-        emoji_str = str(reaction.emoji)
         
-        if emoji_str not in message_data['roles']:
-            print(f"❌ Emoji not found in roles: {emoji_str}")
+        # Remove events carry no member; fetch it only for role selection messages
+        user = await resolve_member(guild, payload.user_id)
+        if user is None:
+            print(f"❌ User {payload.user_id} not found and cannot fetch")
             return
         
-        role_id = message_data['roles'][emoji_str]
-        role = reaction.message.guild.get_role(role_id)
-        
-        if not role:
-            print(f"❌ Role not found: {role_id}")
-            return
-        
-        print(f"✅ Removing role {role.name} from {user.name}")
-        
         try:
-            # Remove the role from the user
-            await user.remove_roles(role)
-            print(f"✅ Successfully removed role {role.name} from {user.name}")
+            with tracer.span('send.roles'):
+                await user.remove_roles(role)
+            print(f"✅ Removed role {role.name} from {user.name}")
         except discord.Forbidden:
             print(f"❌ Forbidden: Cannot remove role {role.name} from {user.name}")
         except Exception as e:
             print(f"❌ Error removing role: {e}")
 
     @bot.event
-    async def on_raw_reaction_remove(payload):
-        """Handle raw reaction removal - more reliable than on_reaction_remove"""
-        if payload.user_id == bot.user.id:
-            return
-        
-        print(f"🔍 Raw reaction removed: {payload.emoji} by user {payload.user_id}")
-        
-        guild = bot.get_guild(payload.guild_id)
-        if not guild:
-            print("❌ Raw: Guild not found")
+    async def on_raw_message_delete(payload):
+        """Forget role selection messages that were deleted"""
+        # Most deleted messages are ordinary chat; a primary key lookup is cheaper than two DELETEs
+        message_id = str(payload.message_id)
+        if await db.get_role_message(message_id) is None:
             return
-        
-        user = guild.get_member(payload.user_id)
-        if not user:
-            # Try to fetch the user if not in cache
-            try:
-                user = await guild.fetch_member(payload.user_id)
-                print(f"✅ Raw: Fetched user {user.name}")
-            except:
-                print("❌ Raw: User not found and cannot fetch")
-                return
-        
-        message = await guild.get_channel(payload.channel_id).fetch_message(payload.message_id)
-        if not message or not message.embeds:
-            print("❌ Raw: Message or embeds not found")
-            return
-        
-        embed = message.embeds[0]
-        if embed.title != "🎭 Vali oma rollid":
-            print(f"❌ Raw: Wrong embed title: {embed.title}")
-            return
-        
-        # Get role message data from database
-        message_data = await db.get_role_message(str(payload.message_id))
-        if not message_data:
-            print(f"❌ Raw: Message not found in database: {payload.message_id}")
-            return
-        emoji_str = str(payload.emoji)
-        
-        print(f"🔍 Raw: Looking for emoji: {emoji_str}")
-        print(f"🔍 Raw: Available emojis: {list(message_data['roles'].keys())}")
-        
-        if emoji_str not in message_data['roles']:
-            print(f"❌ Raw: Emoji not found in roles: {emoji_str}")
-            return
-        
-        role_id = message_data['roles'][emoji_str]
-        role = guild.get_role(role_id)
-        
-        if not role:
-            print(f"❌ Raw: Role not found: {role_id}")
-            return
-        
-        print(f"✅ Raw: Removing role {role.name} from {user.name}")
-        
-        try:
-            await user.remove_roles(role)
-            print(f"✅ Raw: Successfully removed role {role.name} from {user.name}")
-        except discord.Forbidden:
-            print(f"❌ Raw: Forbidden: Cannot remove role {role.name} from {user.name}")
-        except Exception as e:
-            print(f"❌ Raw: Error removing role: {e}")
+        await db.delete_role_message(message_id)
+
+    @bot.event
+    async def on_guild_remove(guild):
+        """Forget role selection messages of guilds the bot left"""
+        await db.delete_guild_role_messages(str(guild.id))
 
     # Load channels on startup will be called from main.py
@@ -2,9 +2,75 @@
 SQLite Database Management for ITA25 Bot
 """
 import aiosqlite
+import asyncio
+import itertools
 import os
 import json
-from typing import Dict, List, Optional, Tuple
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+from .metrics import metrics
+from .tracing import spanned
+
+queued_writes = metrics.gauge('db_write_queue_pending', 'Statements waiting in the write-behind queue')
+flushed_writes = metrics.counter('db_write_batches_total', 'Write-behind batches committed')
+flushed_statements = metrics.counter('db_write_statements_total', 'Statements committed by write-behind batches')
+dead_letters = metrics.counter('db_write_dead_letters_total', 'Queued statements dropped after repeated failures')
+
+# Queued writes are committed after this many milliseconds; 0 writes through immediately
+WRITE_BEHIND_MS = int(os.getenv('DB_WRITE_BEHIND_MS', '200'))
+# A batch is committed at once when this many statements are queued
+WRITE_BATCH_SIZE = int(os.getenv('DB_WRITE_BATCH_SIZE', '100'))
+# After this many failed commits the queue is committed statement by statement and failing ones are dropped
+WRITE_MAX_ATTEMPTS = int(os.getenv('DB_WRITE_MAX_ATTEMPTS', '5'))
+
+# Overlay value of a row deleted by a queued write
+DELETED = object()
+
+class _MigrationLock:
+    """Exclusive lock file held across processes while migrations run (fcntl/msvcrt)"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+    
+    def _acquire(self):
+        self._file = open(self.path, 'a+')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            # msvcrt.LK_LOCK gives up after 10 attempts, so keep trying
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+    
+    def _release(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+    
+    async def __aenter__(self):
+        # Waiting for another process's migrations must not block the event loop
+        await asyncio.to_thread(self._acquire)
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self._release()
 
 class Database:
     def __init__(self, db_path: str = None):
@@ -13,6 +79,263 @@ class Database:
             data_dir = os.getenv('DATA_DIR', '.')
             db_path = os.getenv('DB_PATH', os.path.join(data_dir, 'bot_data.db'))
         self.db_path = db_path
+        self.write_delay = WRITE_BEHIND_MS / 1000
+        self.batch_size = WRITE_BATCH_SIZE
+        self.max_attempts = max(1, WRITE_MAX_ATTEMPTS)
+        # Dropped statements are appended here as JSON lines
+        self.dead_letter_path = f"{db_path}.deadletter.jsonl"
+        # Write-behind queue of (sql, params) in submission order
+        self._pending: List[Tuple[str, tuple]] = []
+        # Rows written by queued (or currently committing) statements: {(kind, key): value}
+        self._overlay: Dict[Tuple[str, str], object] = {}
+        self._flushing: Dict[Tuple[str, str], object] = {}
+        # Created in the running loop on first use: the global db is built at import time,
+        # and on Python 3.9 asyncio primitives bind to the loop current when they are created
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+    
+    def _primitives(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+            self._batch_full = asyncio.Event()
+    
+    async def _write(self, statements: List[Tuple[str, tuple]], overlay: Dict[Tuple[str, str], object] = None):
+        """Queue statements for the next batch, or run them at once when write-behind is off.
+        
+        overlay holds the rows the statements write, so reads see them before the batch commits.
+        """
+        if self.write_delay <= 0:
+            async with aiosqlite.connect(self.db_path) as db:
+                await self._execute_batch(db, statements)
+                await db.commit()
+            return
+        
+        self._primitives()
+        self._pending.extend(statements)
+        self._overlay.update(overlay or {})
+        queued_writes.set(len(self._pending))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._run_writer())
+        elif len(self._pending) >= self.batch_size:
+            self._batch_full.set()
+    
+    async def _run_writer(self):
+        # Exits once the queue is empty; the next write starts a new writer
+        failures = 0
+        while self._pending:
+            if len(self._pending) < self.batch_size:
+                self._batch_full.clear()
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.write_delay)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                if failures >= self.max_attempts:
+                    print(f"⚠️ Database write batch failed {failures} times, committing statements one by one: {e}")
+                    await self._flush_each()
+                    failures = 0
+                else:
+                    print(f"⚠️ Database write batch failed, retrying: {e}")
+                    await asyncio.sleep(max(1.0, self.write_delay))
+    
+    @staticmethod
+    async def _execute_batch(db, statements: List[Tuple[str, tuple]]):
+        # Consecutive runs of the same statement become one executemany
+        for sql, group in itertools.groupby(statements, key=lambda statement: statement[0]):
+            await db.executemany(sql, [params for _, params in group])
+    
+    @spanned('db.flush')
+    async def flush(self):
+        """Commit all queued writes in a single transaction"""
+        self._primitives()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            self._flushing, self._overlay = self._overlay, {}
+            try:
+                async with aiosqlite.connect(self.db_path) as db:
+                    await self._execute_batch(db, batch)
+                    await db.commit()
+            except Exception:
+                # Keep the batch ahead of anything queued meanwhile
+                self._pending = batch + self._pending
+                self._overlay = {**self._flushing, **self._overlay}
+                raise
+            finally:
+                self._flushing = {}
+                queued_writes.set(len(self._pending))
+            flushed_writes.inc()
+            flushed_statements.inc(len(batch))
+    
+    async def _flush_each(self):
+        """Commit queued writes one statement at a time, dead-lettering the ones that fail"""
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            self._flushing, self._overlay = self._overlay, {}
+            failed: List[Tuple[str, tuple, str]] = []
+            done = 0
+            try:
+                async with aiosqlite.connect(self.db_path) as db:
+                    for sql, params in batch:
+                        try:
+                            await db.execute(sql, params)
+                            await db.commit()
+                        except aiosqlite.Error as e:
+                            await db.rollback()
+                            failed.append((sql, params, str(e)))
+                        done += 1
+            except Exception as e:
+                # The database itself is unusable; drop the rest of the batch
+                failed.extend((sql, params, str(e)) for sql, params in batch[done:])
+            finally:
+                # Reads fall back to the database, which now holds everything that could be committed
+                self._flushing = {}
+                queued_writes.set(len(self._pending))
+            if failed:
+                self._dead_letter(failed)
+    
+    def _dead_letter(self, failed: List[Tuple[str, tuple, str]]):
+        dead_letters.inc(len(failed))
+        print(f"❌ Dropped {len(failed)} database writes, see {self.dead_letter_path}")
+        try:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                for sql, params, error in failed:
+                    f.write(json.dumps({'sql': ' '.join(sql.split()), 'params': params, 'error': error, 'failed_at': time.time()}, default=str) + '\n')
+        except OSError as e:
+            print(f"⚠️ Could not write the dead-letter file: {e}")
+    
+    def _overlaid(self, kind: str, key: str, default=None):
+        """Value of a row written by a queued statement, or default if there is none"""
+        for layer in (self._overlay, self._flushing):
+            if (kind, key) in layer:
+                return layer[(kind, key)]
+        return default
+    
+    def migrations(self, json_file_path: str = None) -> List[Tuple[int, str, Callable[[], Awaitable]]]:
+        """Ordered schema migrations as (version, name, step)"""
+        return [
+            (1, 'initial schema', self.init_db),
+            (2, 'import channels.json', lambda: self.migrate_from_json(json_file_path)),
+            (3, 'add indexes', self._sql_step("""
+                CREATE INDEX IF NOT EXISTS idx_role_assignments_message ON role_assignments(message_id);
+                CREATE INDEX IF NOT EXISTS idx_role_messages_guild ON role_messages(guild_id);
+            """)),
+            (4, 'drop user_programs', self._sql_step("""
+                DROP TABLE IF EXISTS user_programs;
+            """)),
+            # auto_vacuum only changes after a full VACUUM; later space is reclaimed incrementally
+            (5, 'incremental auto_vacuum', self._sql_step("""
+                PRAGMA auto_vacuum = INCREMENTAL;
+                VACUUM;
+            """)),
+            # WAL lets several bot processes share the database without blocking readers
+            (6, 'WAL journal', self._sql_step("""
+                PRAGMA journal_mode = WAL;
+            """)),
+            (7, 'leases and broadcast log', self._sql_step("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS broadcast_log (
+                    job TEXT NOT NULL,
+                    guild_id TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (job, guild_id, day)
+                );
+            """)),
+            # Per-guild daily post time in the guild's own time zone
+            (8, 'broadcast time and timezone', self._add_columns_step('channels', {
+                'broadcast_time': "TEXT NOT NULL DEFAULT '06:00'",
+                'timezone': "TEXT NOT NULL DEFAULT 'Europe/Tallinn'",
+            })),
+            (9, 'program registry', self._sql_step("""
+                CREATE TABLE IF NOT EXISTS programs (
+                    code TEXT PRIMARY KEY,
+                    oppegrupp INTEGER NOT NULL,
+                    label TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)),
+            # Last announced state of each polled week, for change notifications
+            (10, 'schedule snapshots', self._sql_step("""
+                CREATE TABLE IF NOT EXISTS schedule_snapshots (
+                    oppegrupp INTEGER NOT NULL,
+                    monday TEXT NOT NULL,
+                    payload_hash TEXT NOT NULL,
+                    events TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (oppegrupp, monday)
+                );
+            """)),
+            # Minutes before each lesson to post a reminder; 0 = off
+            (11, 'lesson reminders', self._add_columns_step('channels', {
+                'reminder_minutes': 'INTEGER NOT NULL DEFAULT 0',
+            })),
+            (12, 'broadcast webhooks', self._add_columns_step('channels', {
+                'webhook_channel_id': 'INTEGER',
+                'webhook_url': 'TEXT',
+            })),
+        ]
+    
+    def _sql_step(self, script: str) -> Callable[[], Awaitable]:
+        """Wrap a SQL script as a migration step"""
+        async def step():
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.executescript(script)
+                await db.commit()
+        return step
+    
+    def _add_columns_step(self, table: str, columns: Dict[str, str]) -> Callable[[], Awaitable]:
+        """Migration step adding columns that are still missing, so a half-applied step can be rerun"""
+        async def step():
+            async with aiosqlite.connect(self.db_path) as db:
+                async with db.execute(f"PRAGMA table_info({table})") as cursor:
+                    existing = {row[1] async for row in cursor}
+                for column, definition in columns.items():
+                    if column not in existing:
+                        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                await db.commit()
+        return step
+    
+    async def migrate(self, json_file_path: str = None):
+        """Apply pending migrations once, recording each in the schema_version table.
+        
+        Processes sharing the database (shard clusters, replicas) migrate one at a time under a lock file;
+        the others wait and then find the migrations applied.
+        """
+        async with _MigrationLock(f"{self.db_path}.migrate.lock"):
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                await db.commit()
+                async with db.execute("SELECT version FROM schema_version") as cursor:
+                    applied = {row[0] async for row in cursor}
+            
+            for version, name, step in self.migrations(json_file_path):
+                if version in applied:
+                    continue
+                started = time.perf_counter()
+                await step()
+                async with aiosqlite.connect(self.db_path) as db:
+                    await db.execute(
+                        "INSERT OR IGNORE INTO schema_version (version, name) VALUES (?, ?)", (version, name)
+                    )
+                    await db.commit()
+                print(f"🗄️ Applied migration {version} ({name}) in {(time.perf_counter() - started) * 1000:.0f}ms")
     
     async def init_db(self):
         """Initialize the database with required tables"""
@@ -70,6 +393,7 @@ class Database:
             
             await db.commit()
     
+    @spanned('db.get_channels')
     async def get_channels(self) -> Tuple[Dict[str, int], Dict[str, int]]:
         """Get info and tunniplaan channels for all guilds"""
         info_channels = {}
@@ -86,50 +410,111 @@ class Database:
         
         return info_channels, tunniplaan_channels
     
+    @spanned('db.save_channels')
     async def save_channels(self, info_channels: Dict[str, int], tunniplaan_channels: Dict[str, int]):
         """Save info and tunniplaan channels for all guilds"""
+        all_guild_ids = set(info_channels.keys()) | set(tunniplaan_channels.keys())
+        
         async with aiosqlite.connect(self.db_path) as db:
-            # Clear existing data
-            await db.execute("DELETE FROM channels")
-            
-            # Get all unique guild IDs
-            all_guild_ids = set(info_channels.keys()) | set(tunniplaan_channels.keys())
+            # Upsert instead of rewriting the table so per-guild settings in other columns survive
+            await db.executemany("""
+                INSERT INTO channels (guild_id, info_channel_id, tunniplaan_channel_id)
+                VALUES (?, ?, ?)
+                ON CONFLICT(guild_id) DO UPDATE SET
+                    info_channel_id = excluded.info_channel_id,
+                    tunniplaan_channel_id = excluded.tunniplaan_channel_id
+            """, [(guild_id, info_channels.get(guild_id), tunniplaan_channels.get(guild_id)) for guild_id in all_guild_ids])
             
-            # Insert data for each guild
-            for guild_id in all_guild_ids:
-                info_channel_id = info_channels.get(guild_id)
-                tunniplaan_channel_id = tunniplaan_channels.get(guild_id)
-                
-                await db.execute("""
-                    INSERT INTO channels (guild_id, info_channel_id, tunniplaan_channel_id)
-                    VALUES (?, ?, ?)
-                """, (guild_id, info_channel_id, tunniplaan_channel_id))
+            # Guilds missing from both dicts have no channels any more
+            placeholders = ','.join('?' * len(all_guild_ids))
+            await db.execute(f"""
+                UPDATE channels SET info_channel_id = NULL, tunniplaan_channel_id = NULL
+                WHERE guild_id NOT IN ({placeholders})
+            """, tuple(all_guild_ids))
             
             await db.commit()
     
+    @spanned('db.get_broadcast_settings')
+    async def get_broadcast_settings(self) -> Dict[str, Dict]:
+        """Daily post settings of all guilds with a tunniplaan channel"""
+        settings = {}
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("""
+                SELECT guild_id, tunniplaan_channel_id, broadcast_time, timezone, reminder_minutes FROM channels
+                WHERE tunniplaan_channel_id IS NOT NULL
+            """) as cursor:
+                async for guild_id, channel_id, broadcast_time, tz, reminder_minutes in cursor:
+                    settings[guild_id] = {
+                        'channel_id': channel_id,
+                        'broadcast_time': broadcast_time,
+                        'timezone': tz,
+                        'reminder_minutes': reminder_minutes,
+                    }
+        return settings
+    
+    @spanned('db.set_broadcast_time')
+    async def set_broadcast_time(self, guild_id: str, broadcast_time: str, tz: str):
+        """Set the local time (HH:MM) and time zone of a guild's daily post"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                INSERT INTO channels (guild_id, broadcast_time, timezone) VALUES (?, ?, ?)
+                ON CONFLICT(guild_id) DO UPDATE SET
+                    broadcast_time = excluded.broadcast_time,
+                    timezone = excluded.timezone
+            """, (guild_id, broadcast_time, tz))
+            await db.commit()
+    
+    @spanned('db.get_webhook')
+    async def get_webhook(self, guild_id: str) -> Optional[Tuple[int, str]]:
+        """(channel_id, url) of the webhook used for a guild's tunniplaan posts"""
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("""
+                SELECT webhook_channel_id, webhook_url FROM channels
+                WHERE guild_id = ? AND webhook_url IS NOT NULL
+            """, (guild_id,)) as cursor:
+                row = await cursor.fetchone()
+                return (row[0], row[1]) if row else None
+    
+    @spanned('db.set_webhook')
+    async def set_webhook(self, guild_id: str, channel_id: Optional[int], url: Optional[str]):
+        """Store (or with None, forget) the webhook of a guild's tunniplaan channel"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                UPDATE channels SET webhook_channel_id = ?, webhook_url = ? WHERE guild_id = ?
+            """, (channel_id, url, guild_id))
+            await db.commit()
+    
+    @spanned('db.save_role_message')
     async def save_role_message(self, message_id: str, guild_id: str, channel_id: int, only_one: bool, roles_data: Dict[str, Dict]):
         """Save a role management message and its role assignments"""
-        async with aiosqlite.connect(self.db_path) as db:
+        statements = [
             # Insert the message
-            await db.execute("""
+            ("""
                 INSERT OR REPLACE INTO role_messages (message_id, guild_id, channel_id, only_one)
                 VALUES (?, ?, ?, ?)
-            """, (message_id, guild_id, channel_id, only_one))
-            
+            """, (message_id, guild_id, channel_id, only_one)),
             # Remove existing role assignments for this message
-            await db.execute("DELETE FROM role_assignments WHERE message_id = ?", (message_id,))
-            
-            # Insert new role assignments
-            for emoji, role_info in roles_data.items():
-                await db.execute("""
-                    INSERT INTO role_assignments (message_id, emoji, role_id, role_name)
-                    VALUES (?, ?, ?, ?)
-                """, (message_id, emoji, role_info['role_id'], role_info.get('role_name', '')))
-            
-            await db.commit()
+            ("DELETE FROM role_assignments WHERE message_id = ?", (message_id,)),
+        ]
+        # Insert new role assignments
+        roles = {}
+        for emoji, role_info in roles_data.items():
+            statements.append(("""
+                INSERT INTO role_assignments (message_id, emoji, role_id, role_name)
+                VALUES (?, ?, ?, ?)
+            """, (message_id, emoji, role_info['role_id'], role_info.get('role_name', ''))))
+            roles[emoji] = {'role_id': role_info['role_id'], 'role_name': role_info.get('role_name', '')}
+        
+        message = {'guild_id': guild_id, 'channel_id': channel_id, 'only_one': bool(only_one), 'roles': roles}
+        await self._write(statements, {('role_message', message_id): message})
     
+    @spanned('db.get_role_message')
     async def get_role_message(self, message_id: str) -> Optional[Dict]:
         """Get role message data by message ID"""
+        pending = self._overlaid('role_message', message_id)
+        if pending is not None:
+            return None if pending is DELETED else {**pending, 'roles': {emoji: dict(role) for emoji, role in pending['roles'].items()}}
+        
         async with aiosqlite.connect(self.db_path) as db:
             # Get message info
             async with db.execute("""
@@ -141,6 +526,8 @@ class Database:
                     return None
                 
                 guild_id, channel_id, only_one = row
+                if self._overlaid('guild_role_messages', guild_id) is DELETED:
+                    return None
                 
                 # Get role assignments
                 roles = {}
@@ -162,15 +549,18 @@ class Database:
                     'roles': roles
                 }
     
+    @spanned('db.delete_role_message')
     async def delete_role_message(self, message_id: str):
         """Delete a role message and its assignments"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("DELETE FROM role_assignments WHERE message_id = ?", (message_id,))
-            await db.execute("DELETE FROM role_messages WHERE message_id = ?", (message_id,))
-            await db.commit()
+        await self._write([
+            ("DELETE FROM role_assignments WHERE message_id = ?", (message_id,)),
+            ("DELETE FROM role_messages WHERE message_id = ?", (message_id,)),
+        ], {('role_message', message_id): DELETED})
     
     async def migrate_from_json(self, json_file_path: str):
-        """Migrate data from existing JSON file to SQLite (if exists)"""
+        """Migrate data from existing JSON file to SQLite (if exists); raises if the import fails"""
+        if not json_file_path:
+            return
         try:
             with open(json_file_path, 'r') as f:
                 data = json.load(f)
@@ -194,50 +584,213 @@ class Database:
                             message_data.get('roles', {})
                         )
             
+            await self.flush()
             print(f"✅ Migrated data from {json_file_path} to SQLite")
             
         except FileNotFoundError:
             print(f"📢 No JSON file found at {json_file_path}, starting with empty database")
-        except Exception as e:
-            print(f"⚠️ Error migrating from JSON: {e}")
+        # Other errors propagate so the migration is not recorded and runs again on the next start
+    
+    @spanned('db.set_server_program')
+    async def set_server_program(self, guild_id: str, program_code: str):
+        """Set server's program preference"""
+        await self._write([("""
+            INSERT OR REPLACE INTO server_programs (guild_id, program_code, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        """, (guild_id, program_code))], {('server_program', guild_id): program_code})
     
-    async def set_user_program(self, user_id: str, guild_id: str, program_code: str):
-        """Set user's program preference"""
+    @spanned('db.get_server_program')
+    async def get_server_program(self, guild_id: str) -> Optional[str]:
+        """Get server's program preference"""
+        pending = self._overlaid('server_program', guild_id)
+        if pending is not None:
+            return pending
+        
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("""
+                SELECT program_code FROM server_programs 
+                WHERE guild_id = ?
+            """, (guild_id,)) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    @spanned('db.set_reminder_minutes')
+    async def set_reminder_minutes(self, guild_id: str, minutes: int):
+        """Set how many minutes before each lesson a reminder is posted (0 turns reminders off)"""
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute("""
-                INSERT OR REPLACE INTO user_programs (user_id, guild_id, program_code, updated_at)
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-            """, (user_id, guild_id, program_code))
+                INSERT INTO channels (guild_id, reminder_minutes) VALUES (?, ?)
+                ON CONFLICT(guild_id) DO UPDATE SET reminder_minutes = excluded.reminder_minutes
+            """, (guild_id, minutes))
             await db.commit()
     
-    async def get_user_program(self, user_id: str, guild_id: str) -> Optional[str]:
-        """Get user's program preference (deprecated - use get_server_program)"""
+    @spanned('db.get_server_programs')
+    async def get_server_programs(self) -> Dict[str, str]:
+        """Program preference of every server as {guild_id: program_code}"""
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("SELECT guild_id, program_code FROM server_programs") as cursor:
+                programs = {guild_id: program_code async for guild_id, program_code in cursor}
+        # Queued preferences win over committed ones
+        for layer in (self._flushing, self._overlay):
+            programs.update({key: value for (kind, key), value in layer.items() if kind == 'server_program'})
+        return programs
+    
+    @spanned('db.get_snapshot')
+    async def get_snapshot(self, oppegrupp: int, monday: str) -> Optional[Dict]:
+        """Last stored snapshot of a week as {'hash', 'events'}"""
         async with aiosqlite.connect(self.db_path) as db:
             async with db.execute("""
-                SELECT program_code FROM user_programs 
-                WHERE user_id = ? AND guild_id = ?
-            """, (user_id, guild_id)) as cursor:
+                SELECT payload_hash, events FROM schedule_snapshots WHERE oppegrupp = ? AND monday = ?
+            """, (oppegrupp, monday)) as cursor:
                 row = await cursor.fetchone()
-                return row[0] if row else None
+                return {'hash': row[0], 'events': json.loads(row[1])} if row else None
     
-    async def set_server_program(self, guild_id: str, program_code: str):
-        """Set server's program preference"""
+    @spanned('db.save_snapshot')
+    async def save_snapshot(self, oppegrupp: int, monday: str, payload_hash: str, events: List[Dict]):
+        """Store the current state of a week"""
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute("""
-                INSERT OR REPLACE INTO server_programs (guild_id, program_code, updated_at)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            """, (guild_id, program_code))
+                INSERT OR REPLACE INTO schedule_snapshots (oppegrupp, monday, payload_hash, events)
+                VALUES (?, ?, ?, ?)
+            """, (oppegrupp, monday, payload_hash, json.dumps(events, ensure_ascii=False)))
             await db.commit()
     
-    async def get_server_program(self, guild_id: str) -> Optional[str]:
-        """Get server's program preference"""
+    @spanned('db.get_programs')
+    async def get_programs(self) -> Dict[str, Tuple[int, str]]:
+        """All registered programs as {code: (oppegrupp, label)}"""
         async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("""
-                SELECT program_code FROM server_programs 
-                WHERE guild_id = ?
-            """, (guild_id,)) as cursor:
+            async with db.execute("SELECT code, oppegrupp, label FROM programs") as cursor:
+                return {code: (oppegrupp, label) async for code, oppegrupp, label in cursor}
+    
+    @spanned('db.save_programs')
+    async def save_programs(self, programs: Dict[str, Tuple[int, str]]):
+        """Insert or update programs; groups missing from the list are kept for servers still using them"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany("""
+                INSERT INTO programs (code, oppegrupp, label) VALUES (?, ?, ?)
+                ON CONFLICT(code) DO UPDATE SET
+                    oppegrupp = excluded.oppegrupp,
+                    label = excluded.label,
+                    updated_at = CURRENT_TIMESTAMP
+            """, [(code, oppegrupp, label) for code, (oppegrupp, label) in programs.items()])
+            await db.commit()
+    
+    @spanned('db.get_role_message_guild_ids')
+    async def get_role_message_guild_ids(self) -> List[str]:
+        """Guild IDs that have at least one role selection message"""
+        await self.flush()
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("SELECT DISTINCT guild_id FROM role_messages") as cursor:
+                return [row[0] async for row in cursor]
+    
+    @spanned('db.delete_guild_role_messages')
+    async def delete_guild_role_messages(self, guild_id: str):
+        """Delete all role messages (and their assignments) of a guild"""
+        # Queued like single deletes, so a role message saved earlier in the queue cannot come back after it
+        overlay = {
+            key: DELETED for layer in (self._flushing, self._overlay) for key, value in layer.items()
+            if key[0] == 'role_message' and value is not DELETED and value['guild_id'] == guild_id
+        }
+        # Hides the guild's committed messages until the batch commits
+        overlay[('guild_role_messages', guild_id)] = DELETED
+        await self._write([
+            ("""
+                DELETE FROM role_assignments WHERE message_id IN
+                    (SELECT message_id FROM role_messages WHERE guild_id = ?)
+            """, (guild_id,)),
+            ("DELETE FROM role_messages WHERE guild_id = ?", (guild_id,)),
+        ], overlay)
+    
+    async def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """Take or renew a named lease; returns True if holder owns it afterwards"""
+        now = time.time()
+        async with aiosqlite.connect(self.db_path) as db:
+            # Only overwrite the row if we already hold it or the previous holder's lease expired
+            await db.execute("""
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+            """, (name, holder, now + ttl, now))
+            await db.commit()
+            async with db.execute("SELECT holder FROM leases WHERE name = ?", (name,)) as cursor:
                 row = await cursor.fetchone()
-                return row[0] if row else None
+                return bool(row) and row[0] == holder
+    
+    async def release_lease(self, name: str, holder: str):
+        """Give up a lease so another replica can take over immediately"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+            await db.commit()
+    
+    @spanned('db.is_broadcast_done')
+    async def is_broadcast_done(self, job: str, guild_id: str, day: str) -> bool:
+        """Whether a scheduled post was already sent to the guild on day"""
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("""
+                SELECT 1 FROM broadcast_log WHERE job = ? AND guild_id = ? AND day = ?
+            """, (job, guild_id, day)) as cursor:
+                return await cursor.fetchone() is not None
+    
+    @spanned('db.mark_broadcast_done')
+    async def mark_broadcast_done(self, job: str, guild_id: str, day: str):
+        """Record that a scheduled post was sent to the guild on day"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                INSERT OR IGNORE INTO broadcast_log (job, guild_id, day) VALUES (?, ?, ?)
+            """, (job, guild_id, day))
+            await db.commit()
+    
+    async def _checkpointed_size(self) -> int:
+        """Size of the database file after moving the WAL into it"""
+        if not os.path.exists(self.db_path):
+            return 0
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("PRAGMA wal_checkpoint(TRUNCATE)") as cursor:
+                await cursor.fetchall()
+        return os.path.getsize(self.db_path)
+    
+    async def run_maintenance(self, departed_guild_ids: List[str] = ()) -> Dict[str, int]:
+        """Prune orphaned rows, refresh planner statistics and reclaim free pages"""
+        size_before = await self._checkpointed_size()
+        for guild_id in departed_guild_ids:
+            await self.delete_guild_role_messages(guild_id)
+        await self.flush()
+        
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("""
+                DELETE FROM role_assignments
+                WHERE message_id NOT IN (SELECT message_id FROM role_messages)
+            """)
+            orphans = cursor.rowcount
+            # Broadcast markers and snapshots of past weeks are only needed for a few days
+            await db.execute("DELETE FROM broadcast_log WHERE day < date('now', '-7 days')")
+            await db.execute("DELETE FROM schedule_snapshots WHERE monday < date('now', '-14 days')")
+            await db.commit()
+            
+            previous_free = None
+            await db.execute("ANALYZE")
+            await db.execute("PRAGMA optimize")
+            # Each step of the pragma frees one page; keep stepping until the freelist is empty
+            while True:
+                async with db.execute("PRAGMA incremental_vacuum") as cursor:
+                    await cursor.fetchall()
+                await db.commit()
+                async with db.execute("PRAGMA freelist_count") as cursor:
+                    free_pages = (await cursor.fetchone())[0]
+                if free_pages == 0:
+                    break
+                if free_pages == previous_free:
+                    # Not in incremental auto_vacuum mode; nothing more to reclaim this way
+                    break
+                previous_free = free_pages
+        
+        size_after = await self._checkpointed_size()
+        return {
+            'departed_guilds': len(departed_guild_ids),
+            'orphaned_assignments': orphans,
+            'bytes_before': size_before,
+            'bytes_after': size_after,
+        }
 
 # Global database instance
 db = Database()
@@ -0,0 +1,140 @@
+"""
+iCalendar (.ics) export built week by week from the schedule cache
+"""
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .scraper import VOCOScraper, ScheduleUnavailableError
+
+# A cached week younger than this is used for calendar exports without asking VOCO
+ICAL_MAX_AGE = float(os.getenv('ICAL_MAX_AGE', str(6 * 3600)))
+
+# Precomputed week blocks kept, least recently used evicted first
+ICAL_BLOCK_CACHE = int(os.getenv('ICAL_BLOCK_CACHE', '512'))
+
+# Precomputed VEVENT text per (oppegrupp, monday) -> (fetched_at of the source week, text)
+_week_blocks: 'OrderedDict[Tuple[int, str], Tuple[float, str]]' = OrderedDict()
+_blocks_lock = threading.Lock()
+
+
+def _escape(text: str) -> str:
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def _fold(line: str) -> str:
+    """Fold a content line to 75 octets as required by RFC 5545"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _utc(value: str) -> str:
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        # VOCO times without an offset are Estonian local time
+        return dt.strftime('%Y%m%dT%H%M%S')
+    return dt.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def vevent(event: Dict, stamp: str) -> str:
+    """Render one scraped event as a VEVENT block"""
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:{event['plan_id']}-{_utc(event['start'])}@ita25-bot",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{_utc(event['start'])}",
+        f"DTEND:{_utc(event['end'])}",
+        f"SUMMARY:{_escape(event.get('subject', ''))}",
+    ]
+    room = event.get('room')
+    if room and room != 'Tundmatu ruum':
+        lines.append(f"LOCATION:{_escape(room)}")
+    teacher = event.get('teacher')
+    if teacher and teacher != 'Tundmatu':
+        lines.append(f"DESCRIPTION:{_escape('Õpetaja: ' + teacher)}")
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def week_block(oppegrupp: int, monday: date, events: List[Dict], fetched_at: float) -> str:
+    """Return the VEVENT blocks of one week, reusing the precomputed text if unchanged"""
+    key = (oppegrupp, monday.isoformat())
+    with _blocks_lock:
+        cached = _week_blocks.get(key)
+        if cached:
+            _week_blocks.move_to_end(key)
+    if cached and cached[0] == fetched_at:
+        return cached[1]
+
+    stamp = datetime.fromtimestamp(fetched_at, timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    parts = []
+    for event in events:
+        subject = event.get('subject', '')
+        if not subject.strip() or subject == 'Tegevuspäev':
+            continue
+        try:
+            parts.append(vevent(event, stamp))
+        except (KeyError, ValueError):
+            continue
+    text = ''.join(parts)
+    with _blocks_lock:
+        _week_blocks[key] = (fetched_at, text)
+        _week_blocks.move_to_end(key)
+        while len(_week_blocks) > ICAL_BLOCK_CACHE:
+            _week_blocks.popitem(last=False)
+    return text
+
+
+async def stream_calendar(program: str, start: date, weeks: int, max_fetches: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Yield an .ics calendar for weeks starting at the week of start, one week at a time.
+    
+    At most max_fetches weeks are fetched from VOCO; further uncached weeks are left out.
+    """
+    name = f"{program} tunniplaan"
+    yield (
+        'BEGIN:VCALENDAR\r\n'
+        'VERSION:2.0\r\n'
+        'PRODID:-//ITA25 Bot//Tunniplaan//ET\r\n'
+        'CALSCALE:GREGORIAN\r\n'
+        f'X-WR-CALNAME:{_escape(name)}\r\n'
+        'X-WR-TIMEZONE:Europe/Tallinn\r\n'
+    ).encode('utf-8')
+
+    scraper = VOCOScraper(program)
+    monday = start - timedelta(days=start.weekday())
+    fetches = 0
+    for _ in range(weeks):
+        day = datetime.combine(monday, datetime.min.time())
+        # Cache reads hit SQLite and decode the week, so they run in a worker thread
+        entry = await asyncio.to_thread(scraper.cached_entry, day, ICAL_MAX_AGE)
+        if entry is None and (max_fetches is None or fetches < max_fetches):
+            fetches += 1
+            # Only weeks missing from the cache (or very old) go to VOCO
+            try:
+                await asyncio.to_thread(scraper.get_week_events, day)
+            except ScheduleUnavailableError as e:
+                print(f"⚠️ Skipping week {monday} in calendar export: {e}")
+            entry = await asyncio.to_thread(scraper.cached_entry, day)
+        elif entry is None:
+            # Over the fetch budget: an old snapshot is better than nothing
+            entry = await asyncio.to_thread(scraper.cached_entry, day)
+        if entry is not None:
+            yield week_block(scraper.oppegrupp, monday, entry['events'], entry['fetched_at']).encode('utf-8')
+        monday += timedelta(weeks=1)
+
+    yield b'END:VCALENDAR\r\n'
@@ -0,0 +1,256 @@
+"""
+In-memory teacher, room and free-room index over the cached schedules of all registered programs
+"""
+import asyncio
+import bisect
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import metrics
+from .programs import registry
+from .schedule import schedule
+from .scraper import VOCOScraper
+
+index_entries = metrics.gauge('schedule_index_lessons', 'Lessons in the teacher/room index')
+index_build_seconds = metrics.gauge('schedule_index_build_seconds', 'Duration of the last index rebuild')
+
+# Weeks indexed, starting with the current one
+INDEX_WEEKS = int(os.getenv('INDEX_WEEKS', '2'))
+
+ROOM_CODE = re.compile(r'[A-Z]\d+[A-Z]?')
+
+UNKNOWN_TEACHER = 'Tundmatu'
+UNKNOWN_ROOM = 'Tundmatu ruum'
+
+# {name or room code: {ISO date: [lesson, ...]}}
+DayIndex = Dict[str, Dict[str, List[Dict]]]
+
+# {ISO date: {room code: (sorted starts, ends)}} of merged, non-overlapping busy intervals in minutes
+BusyIndex = Dict[str, Dict[str, Tuple[List[int], List[int]]]]
+
+
+def room_code(room: str) -> str:
+    """Normalize a room string like 'A310 (Arvutiklass)' to its code ('A310')"""
+    match = ROOM_CODE.search(room.upper())
+    return match.group(0) if match else room.strip().upper()
+
+
+def minutes(hhmm: str) -> int:
+    """'08:30' -> 510"""
+    hours, mins = hhmm.split(':')[:2]
+    return int(hours) * 60 + int(mins)
+
+
+def merge_intervals(intervals: List[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+    """Merge overlapping (start, end) intervals into parallel sorted start and end lists"""
+    starts: List[int] = []
+    ends: List[int] = []
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+def split_teachers(teacher: str) -> List[str]:
+    return [name.strip() for name in teacher.split(',') if name.strip() and name.strip() != UNKNOWN_TEACHER]
+
+
+class ScheduleIndex:
+    """Teacher -> lessons and room -> lessons by date, rebuilt from the week cache"""
+
+    def __init__(self, weeks: int = None):
+        self.weeks = weeks if weeks is not None else INDEX_WEEKS
+        self._teachers: DayIndex = {}
+        self._rooms: DayIndex = {}
+        # Casefolded teacher name -> display name
+        self._teacher_names: Dict[str, str] = {}
+        self._busy: BusyIndex = {}
+        # Room code -> full room name, e.g. 'A310' -> 'A310 (Arvutiklass)'
+        self._room_names: Dict[str, str] = {}
+        self.built_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def mondays(self, today: date = None) -> List[date]:
+        today = today or date.today()
+        monday = today - timedelta(days=today.weekday())
+        return [monday + timedelta(weeks=i) for i in range(self.weeks)]
+
+    async def warm(self):
+        """Fetch weeks missing from the cache for every program, at most SCHEDULE_FETCH_CONCURRENCY at a time.
+
+        Weeks cached within SCHEDULE_REVALIDATE_AGE are left alone: lookups revalidate them on use,
+        so the index never refetches every program on each refresh.
+        """
+        semaphore = asyncio.Semaphore(max(1, schedule.fetch_concurrency))
+        mondays = self.mondays()
+
+        def uncached(code: str) -> List[date]:
+            scraper = VOCOScraper(code)
+            return [
+                monday for monday in mondays
+                if scraper.cached_entry(datetime.combine(monday, datetime.min.time()), max_age=VOCOScraper.REVALIDATE_AGE) is None
+            ]
+
+        async def warm_program(code: str):
+            # Cache reads decode whole weeks; keep them off the event loop
+            missing = await asyncio.to_thread(uncached, code)
+            if not missing:
+                return
+            async with semaphore:
+                await schedule.fetch_weeks(code, missing)
+
+        results = await asyncio.gather(*(warm_program(code) for code in registry.codes()), return_exceptions=True)
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        if failed:
+            print(f"⚠️ Index warm-up: {failed} of {len(results)} programs could not be loaded")
+
+    async def rebuild(self):
+        """Rebuild the index from cached weeks in a worker thread and swap it in"""
+        await asyncio.to_thread(self._rebuild)
+
+    def _rebuild(self):
+        started = time.perf_counter()
+        # Identical lessons shared by several groups become one entry listing all groups
+        lessons: Dict[Tuple, Dict] = {}
+        for code in registry.codes():
+            scraper = VOCOScraper(code)
+            for monday in self.mondays():
+                entry = scraper.cached_entry(datetime.combine(monday, datetime.min.time()))
+                if entry is None:
+                    continue
+                for event in entry['events']:
+                    subject = event.get('subject', '')
+                    if not subject.strip() or subject == 'Tegevuspäev':
+                        continue
+                    key = (event.get('date'), event.get('start_time'), event.get('end_time'),
+                           subject, event.get('teacher'), event.get('room'))
+                    lesson = lessons.get(key)
+                    if lesson is None:
+                        lesson = lessons[key] = {
+                            'date': event.get('date', ''),
+                            'start_time': event.get('start_time', ''),
+                            'end_time': event.get('end_time', ''),
+                            'subject': subject,
+                            'teacher': event.get('teacher', UNKNOWN_TEACHER),
+                            'room': event.get('room', UNKNOWN_ROOM),
+                            'programs': [],
+                        }
+                    if code not in lesson['programs']:
+                        lesson['programs'].append(code)
+
+        teachers: DayIndex = {}
+        rooms: DayIndex = {}
+        names: Dict[str, str] = {}
+        for lesson in lessons.values():
+            for name in split_teachers(lesson['teacher']):
+                names.setdefault(name.casefold(), name)
+                teachers.setdefault(name.casefold(), {}).setdefault(lesson['date'], []).append(lesson)
+            if lesson['room'] and lesson['room'] != UNKNOWN_ROOM:
+                rooms.setdefault(room_code(lesson['room']), {}).setdefault(lesson['date'], []).append(lesson)
+
+        for index in (teachers, rooms):
+            for days in index.values():
+                for day_lessons in days.values():
+                    day_lessons.sort(key=lambda lesson: lesson['start_time'])
+
+        busy: BusyIndex = {}
+        room_names: Dict[str, str] = {}
+        for code, days in rooms.items():
+            # Prefer the longest spelling, it usually carries the room type
+            room_names[code] = max((lesson['room'] for lessons in days.values() for lesson in lessons), key=len)
+            for day, day_lessons in days.items():
+                intervals = []
+                for lesson in day_lessons:
+                    try:
+                        intervals.append((minutes(lesson['start_time']), minutes(lesson['end_time'])))
+                    except ValueError:
+                        continue
+                busy.setdefault(day, {})[code] = merge_intervals(intervals)
+
+        with self._lock:
+            self._teachers, self._rooms, self._teacher_names = teachers, rooms, names
+            self._busy, self._room_names = busy, room_names
+            self.built_at = time.time()
+        index_entries.set(len(lessons))
+        index_build_seconds.set(time.perf_counter() - started)
+
+    def find_teachers(self, query: str, limit: int = 5) -> List[str]:
+        """Display names of teachers matching query (exact name first, then substring)"""
+        folded = query.casefold().strip()
+        names = self._teacher_names
+        if folded in names:
+            return [names[folded]]
+        return sorted(names[key] for key in names if folded in key)[:limit]
+
+    def find_room(self, query: str) -> Optional[str]:
+        """Room code matching query, or None"""
+        code = room_code(query)
+        if code in self._rooms:
+            return code
+        matches = sorted(key for key in self._rooms if key.startswith(code))
+        return matches[0] if matches else None
+
+    def complete_teachers(self, current: str, limit: int = 25) -> List[str]:
+        """Teacher names for autocomplete, prefix matches first"""
+        folded = current.casefold().strip()
+        names = self._teacher_names
+        prefix = sorted(names[key] for key in names if key.startswith(folded))
+        if len(prefix) >= limit:
+            return prefix[:limit]
+        rest = sorted(names[key] for key in names if folded in key and not key.startswith(folded))
+        return (prefix + rest)[:limit]
+
+    def complete_rooms(self, current: str, limit: int = 25) -> List[str]:
+        """Room codes starting with current, for autocomplete"""
+        prefix = current.upper().strip()
+        return sorted(code for code in self._room_names if code.startswith(prefix))[:limit]
+
+    def teacher_lessons(self, name: str, start: date, end: date) -> List[Tuple[date, List[Dict]]]:
+        return self._days(self._teachers.get(name.casefold(), {}), start, end)
+
+    def room_lessons(self, code: str, start: date, end: date) -> List[Tuple[date, List[Dict]]]:
+        return self._days(self._rooms.get(code, {}), start, end)
+
+    def free_rooms(self, day: date, start: int, duration: int) -> List[Tuple[str, str, Optional[int]]]:
+        """Rooms free on day from minute start for duration minutes.
+
+        Returns (code, room name, minute the next lesson starts or None) sorted by code.
+        Each room is checked with two binary searches over its merged busy intervals.
+        """
+        day_busy = self._busy.get(day.isoformat(), {})
+        end = start + duration
+        free = []
+        for code in sorted(self._room_names):
+            starts, ends = day_busy.get(code, ([], []))
+            # Last busy interval starting at or before start must have ended
+            i = bisect.bisect_right(starts, start) - 1
+            if i >= 0 and ends[i] > start:
+                continue
+            # The next busy interval must not begin before the wanted end
+            j = bisect.bisect_right(starts, start)
+            next_start = starts[j] if j < len(starts) else None
+            if next_start is not None and next_start < end:
+                continue
+            free.append((code, self._room_names[code], next_start))
+        return free
+
+    def _days(self, days: Dict[str, List[Dict]], start: date, end: date) -> List[Tuple[date, List[Dict]]]:
+        result = []
+        day = start
+        while day <= end:
+            lessons = days.get(day.isoformat())
+            if lessons:
+                result.append((day, lessons))
+            day += timedelta(days=1)
+        return result
+
+
+# Global schedule index
+schedule_index = ScheduleIndex()
@@ -0,0 +1,400 @@
+"""
+Single-pass scanner for the JavaScript `events: [...]` literal on VOCO schedule pages.
+
+Every character is visited once: strings honour quotes and escapes, nested
+brackets are matched on a stack, and unknown values are skipped as balanced
+text, so run time is linear in the page size even on malformed input.
+Plain arrays without nested literals are read by a regex fast path instead.
+
+Usage:
+    python -m src.jsliteral fuzz [--iterations N] [--seed S]
+    python -m src.jsliteral bench [--events N] [--repeat N]
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Deepest nesting accepted inside an event value
+MAX_DEPTH = 64
+
+EVENTS_KEY = re.compile(r'\bevents\s*:\s*\[')
+WHITESPACE = re.compile(r'\s*')
+IDENTIFIER = re.compile(r'[A-Za-z_$][\w$]*')
+# Runs of characters that need no attention inside a string or a skipped value
+STRING_RUN = {quote: re.compile(rf'[^{quote}\\\\]*') for quote in ("'", '"', '`')}
+VALUE_RUN = re.compile(r'[^\'"`()\[\]{},/]*')
+
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
+CLOSERS = {'(': ')', '[': ']', '{': '}'}
+
+# Plain arrays: objects of identifier keys whose values are quoted strings without escapes,
+# brackets or braces, or bare values without quotes, brackets, parentheses, commas or slashes.
+# The regexes below parse these exactly and several times faster than the scanner.
+_PLAIN_STRING = r"'[^'\\\n{}\[\]]*'" + r'|"[^"\\\n{}\[\]]*"'
+_PLAIN_BARE = r"""[^'"`{}\[\]()\\,/]*"""
+_PLAIN_FIELD = rf"\s*[A-Za-z_$][\w$]*\s*:\s*(?:(?:{_PLAIN_STRING})\s*|{_PLAIN_BARE})"
+_PLAIN_OBJECT = rf"\{{(?:{_PLAIN_FIELD}(?:,{_PLAIN_FIELD})*,?\s*)?\}}"
+PLAIN_ARRAY = re.compile(rf"\s*(?:{_PLAIN_OBJECT}\s*(?:,\s*{_PLAIN_OBJECT}\s*)*,?\s*)?\]")
+PLAIN_OBJECTS = re.compile(r"\{([^}]*)\}")
+PLAIN_FIELDS = re.compile(r"""([A-Za-z_$][\w$]*)\s*:\s*(?:'([^']*)'|"([^"]*)"|([^,]*))""")
+
+
+class JSScanError(ValueError):
+    """The text is not a literal the scanner understands.
+
+    position is where scanning stopped; no `events: [` before it can start a
+    well-formed array, so find_events resumes its search from there.
+    """
+
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} at {position}")
+        self.position = position
+
+
+def _skip_ws(source: str, i: int) -> int:
+    while True:
+        i = WHITESPACE.match(source, i).end()
+        if source.startswith('//', i):
+            end = source.find('\n', i)
+            i = len(source) if end == -1 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            if end == -1:
+                # Everything up to EOF was searched: report there so nothing is rescanned
+                raise JSScanError(f"unterminated comment from {i}", len(source))
+            i = end + 2
+        else:
+            return i
+
+
+def read_string(source: str, i: int) -> Tuple[str, int]:
+    """Decode the quoted string starting at source[i]; returns (value, index after it)"""
+    quote = source[i]
+    run = STRING_RUN[quote]
+    parts = []
+    start = i
+    i += 1
+    n = len(source)
+    while True:
+        end = run.match(source, i).end()
+        parts.append(source[i:end])
+        # An unterminated string runs to EOF, which is where the error is reported
+        if end >= n:
+            raise JSScanError(f"unterminated string from {start}", n)
+        if source[end] == quote:
+            return ''.join(parts), end + 1
+        # Backslash escape
+        if end + 1 >= n:
+            raise JSScanError(f"unterminated string from {start}", n)
+        char = source[end + 1]
+        i = end + 2
+        if char == 'u' and source[i:i + 4].isalnum() and len(source[i:i + 4]) == 4:
+            try:
+                parts.append(chr(int(source[i:i + 4], 16)))
+                i += 4
+                continue
+            except ValueError:
+                pass
+        elif char == 'x' and len(source[i:i + 2]) == 2:
+            try:
+                parts.append(chr(int(source[i:i + 2], 16)))
+                i += 2
+                continue
+            except ValueError:
+                pass
+        elif char == '\n':
+            # Line continuation
+            continue
+        parts.append(ESCAPES.get(char, char))
+
+
+def skip_value(source: str, i: int) -> int:
+    """Index of the ',', '}' or ']' that ends the value starting at i"""
+    stack = []
+    n = len(source)
+    while i < n:
+        i = VALUE_RUN.match(source, i).end()
+        if i >= n:
+            break
+        char = source[i]
+        if char in '\'"`':
+            _, i = read_string(source, i)
+        elif char == '/':
+            i = _skip_ws(source, i) if source.startswith(('//', '/*'), i) else i + 1
+        elif char in CLOSERS:
+            if len(stack) >= MAX_DEPTH:
+                raise JSScanError(f"nesting deeper than {MAX_DEPTH}", i)
+            stack.append(CLOSERS[char])
+            i += 1
+        elif char in ')]}':
+            if not stack:
+                return i
+            if stack.pop() != char:
+                raise JSScanError(f"mismatched {char!r}", i)
+            i += 1
+        else:
+            # ','
+            if not stack:
+                return i
+            i += 1
+    raise JSScanError("unexpected end of input", i)
+
+
+def read_object(source: str, i: int) -> Tuple[Dict[str, str], int]:
+    """Read the object literal at source[i] == '{'.
+
+    String values are decoded; any other value is kept as its stripped source text.
+    """
+    fields: Dict[str, str] = {}
+    i = _skip_ws(source, i + 1)
+    while True:
+        if i >= len(source):
+            raise JSScanError("unterminated object", i)
+        char = source[i]
+        if char == '}':
+            return fields, i + 1
+        if char in '\'"':
+            key, i = read_string(source, i)
+        else:
+            match = IDENTIFIER.match(source, i)
+            if not match:
+                raise JSScanError("expected a key", i)
+            key, i = match.group(0), match.end()
+        i = _skip_ws(source, i)
+        if not source.startswith(':', i):
+            raise JSScanError("expected ':'", i)
+        i = _skip_ws(source, i + 1)
+        if i < len(source) and source[i] in '\'"`':
+            value, i = read_string(source, i)
+            i = _skip_ws(source, i)
+            if i < len(source) and source[i] not in ',}':
+                # String expression such as 'a' + b: keep its text
+                end = skip_value(source, i)
+                value, i = value + source[i:end].strip(), end
+        else:
+            end = skip_value(source, i)
+            value, i = source[i:end].strip(), end
+        fields[key] = value
+        i = _skip_ws(source, i)
+        if source.startswith(',', i):
+            i = _skip_ws(source, i + 1)
+        elif not source.startswith('}', i):
+            raise JSScanError("expected ',' or '}'", i)
+
+
+def read_array(source: str, i: int) -> Tuple[List[Dict[str, str]], int]:
+    """Read the array whose '[' is at source[i - 1]; returns its object elements"""
+    items = []
+    i = _skip_ws(source, i)
+    while True:
+        if i >= len(source):
+            raise JSScanError("unterminated array", i)
+        if source[i] == ']':
+            return items, i + 1
+        if source[i] == '{':
+            item, i = read_object(source, i)
+            items.append(item)
+        else:
+            i = skip_value(source, i)
+        i = _skip_ws(source, i)
+        if source.startswith(',', i):
+            i = _skip_ws(source, i + 1)
+        elif not source.startswith(']', i):
+            raise JSScanError("expected ',' or ']'", i)
+
+
+def find_events(source: str) -> Optional[List[Dict[str, str]]]:
+    """Objects of the first well-formed `events: [...]` array in source, or None.
+
+    Plain arrays (no nested literals, escapes or comments) are read with regexes;
+    anything else goes through the scanner.
+    """
+    match = EVENTS_KEY.search(source)
+    if match is None:
+        return None
+    plain = PLAIN_ARRAY.match(source, match.end())
+    if plain is not None:
+        return read_plain_array(source[match.end():plain.end()])
+    return scan_events(source)
+
+
+def read_plain_array(text: str) -> List[Dict[str, str]]:
+    """Objects of an array body that matched PLAIN_ARRAY"""
+    items = []
+    for body in PLAIN_OBJECTS.finditer(text):
+        fields = {}
+        for field in PLAIN_FIELDS.finditer(body.group(1)):
+            key, single, double, bare = field.groups()
+            fields[key] = single if single is not None else double if double is not None else bare.strip()
+        items.append(fields)
+    return items
+
+
+def scan_events(source: str) -> Optional[List[Dict[str, str]]]:
+    """find_events using the scanner only"""
+    position = 0
+    while True:
+        match = EVENTS_KEY.search(source, position)
+        if match is None:
+            return None
+        try:
+            items, _ = read_array(source, match.end())
+            return items
+        except JSScanError as e:
+            # Text up to the failure cannot hold a complete array; never rescan it
+            position = max(match.end(), e.position)
+
+
+# --- fuzz and benchmark against the previous regex parser ---
+
+def regex_events(source: str) -> List[Dict[str, str]]:
+    """The regex parser this scanner replaced, kept for comparison"""
+    match = re.search(r'events:\s*\[(.*?)\]', source, re.DOTALL)
+    if not match:
+        return []
+    events = []
+    for text in re.findall(r"\{[^}]*plan_id:'[^']*'[^}]*\}", match.group(1)):
+        fields = {}
+        for key in ('plan_id', 'title', 'start', 'end'):
+            value = re.search(rf"{key}:'([^']*)'", text)
+            if value is None:
+                break
+            fields[key] = value.group(1)
+        else:
+            events.append(fields)
+    return events
+
+
+# Characters that broke the regex parser when they appeared in a title
+TRICKY = ['}', ']', '{', '[', "'", '"', '`', ',', ':', '//', '/*', 'events: [', '\\', '\n', 'ä']
+
+
+def js_string(text: str, rng: random.Random, escape_unicode: bool) -> str:
+    """Encode text as a single-quoted JS string, optionally \\u-escaping some characters at random"""
+    out = []
+    for char in text:
+        if char in "'\\":
+            out.append('\\' + char)
+        elif char == '\n':
+            out.append('\\n')
+        elif escape_unicode and ord(char) > 127 and rng.random() < 0.5:
+            out.append(f'\\u{ord(char):04x}')
+        else:
+            out.append(char)
+    return "'" + ''.join(out) + "'"
+
+
+def random_page(rng: random.Random, count: int, tricky: bool) -> Tuple[str, List[Dict[str, str]]]:
+    """A schedule-like script with count events and the fields a parser must recover"""
+    expected, objects = [], []
+    for n in range(count):
+        title = f"Aine {n}<br/>;Õpetaja {rng.randint(1, 50)};A{rng.randint(100, 450)}"
+        if tricky:
+            title += ''.join(rng.choice('x ä') + rng.choice(TRICKY) for _ in range(rng.randint(0, 4)))
+        event = {'plan_id': str(rng.randint(1, 10 ** 6)), 'title': title,
+                 'start': f'2025-01-{13 + n % 5}T08:30:00+03:00', 'end': f'2025-01-{13 + n % 5}T10:00:00+03:00'}
+        expected.append(event)
+        parts = [f"{key}:{js_string(value, rng, tricky)}" for key, value in event.items()]
+        parts += ["allDay:false", f"color:\"#{rng.randint(0, 0xffffff):06x}\""]
+        if tricky:
+            parts.append("extra:{tags:['a', 'b]'], nested:[[1, 2], {x: '}'}]}")
+        rng.shuffle(parts)
+        objects.append('{' + ', '.join(parts) + '}')
+    source = ("$('#calendar').fullCalendar({\n  header: {left: 'prev'},\n  events: [\n    "
+              + ',\n    '.join(objects) + "\n  ]\n});")
+    return source, expected
+
+
+def _fields(events: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+    return [{key: event.get(key) for key in ('plan_id', 'title', 'start', 'end')} for event in events or []]
+
+
+def fuzz(iterations: int, seed: int) -> int:
+    """Check the scanner against generated pages, mutated pages and adversarial input"""
+    rng = random.Random(seed)
+    failures = 0
+    regex_losses = 0
+    for iteration in range(iterations):
+        tricky = iteration % 2 == 1
+        source, expected = random_page(rng, rng.randint(0, 30), tricky)
+        if _fields(find_events(source)) != expected:
+            failures += 1
+            print(f"MISMATCH (seed {seed}, iteration {iteration})")
+        if find_events(source) != scan_events(source):
+            failures += 1
+            print(f"FAST PATH DIFFERS from the scanner (seed {seed}, iteration {iteration})")
+        if not tricky and _fields(regex_events(source)) != expected:
+            failures += 1
+            print(f"REGEX DIFFERS on a plain page (seed {seed}, iteration {iteration})")
+        elif tricky and _fields(regex_events(source)) != expected:
+            regex_losses += 1
+
+        # Truncated or corrupted pages must fail cleanly, never raise or hang
+        cut = source[:rng.randint(0, len(source))]
+        position = rng.randint(0, max(0, len(source) - 1))
+        corrupted = source[:position] + rng.choice(TRICKY) + source[position + 1:]
+        for mutated in (cut, corrupted):
+            try:
+                if find_events(mutated) != scan_events(mutated):
+                    failures += 1
+                    print(f"FAST PATH DIFFERS on a mutated page (seed {seed}, iteration {iteration})")
+            except Exception as e:
+                failures += 1
+                print(f"CRASH {type(e).__name__}: {e} (seed {seed}, iteration {iteration})")
+
+    # Adversarial input: time must stay linear, so 4x the input may take at most ~4x as long
+    size = 200_000
+    patterns = [('open braces', 'events: [', '{a:[', ''), ('quotes', 'events: [', "{a:'\\", ''),
+                ('unclosed', '', 'events: [{a:', ''), ('brackets', 'events: [', '[', ']'),
+                ('open comments', '', 'events: [/*', ''), ('open strings', '', "events: ['", ''),
+                ('unclosed plain objects', 'events: [', "{a:'b', c:1},", '')]
+    for name, head, repeated, tail in patterns:
+        timings = []
+        for count in (size // 4, size):
+            source = head + repeated * count + tail * count
+            started = time.perf_counter()
+            find_events(source)
+            timings.append(time.perf_counter() - started)
+        print(f"adversarial {name} ({len(source)} chars): {timings[1] * 1000:.0f} ms")
+        # Quadratic growth would be 16x; allow noise on very fast runs
+        if timings[1] > 0.05 and timings[1] > 8 * timings[0]:
+            failures += 1
+            print(f"NOT LINEAR {name}: {timings[0] * 1000:.0f} ms -> {timings[1] * 1000:.0f} ms for 4x the input")
+
+    print(f"{iterations} pages, {failures} failures; the regex parser got {regex_losses} of {iterations // 2} tricky pages wrong")
+    return 1 if failures else 0
+
+
+def bench(count: int, repeat: int) -> int:
+    """Compare find_events (plain fast path), the scanner and the old regex on a page of count plain events"""
+    source, expected = random_page(random.Random(0), count, tricky=False)
+    for name, parse in (('plain', find_events), ('scanner', scan_events), ('regex', regex_events)):
+        assert _fields(parse(source)) == expected, name
+        started = time.perf_counter()
+        for _ in range(repeat):
+            parse(source)
+        elapsed = (time.perf_counter() - started) / repeat
+        print(f"{name:8} {count} events, {len(source) / 1024:.0f} KiB: {elapsed * 1000:.2f} ms/page")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.jsliteral', description='VOCO events scanner checks')
+    commands = parser.add_subparsers(dest='command', required=True)
+    fuzz_parser = commands.add_parser('fuzz', help='compare the scanner with generated and corrupted pages')
+    fuzz_parser.add_argument('--iterations', type=int, default=2000)
+    fuzz_parser.add_argument('--seed', type=int, default=random.randrange(2 ** 32))
+    bench_parser = commands.add_parser('bench', help='time the scanner against the old regex parser')
+    bench_parser.add_argument('--events', type=int, default=60)
+    bench_parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args(argv)
+    if args.command == 'fuzz':
+        return fuzz(args.iterations, args.seed)
+    return bench(args.events, args.repeat)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Lease-based leader election so only one replica runs scheduled jobs
+"""
+import os
+import socket
+from typing import Awaitable, Callable, List
+
+from .database import db
+from .metrics import metrics
+
+leader_gauge = metrics.gauge('leader', 'Whether this process holds a lease (1) or not (0), by lease name')
+
+
+class LeaderLease:
+    """Holds a named lease in the shared database, renewed by a heartbeat"""
+
+    def __init__(self, name: str = None, ttl: float = None):
+        cluster = os.getenv('CLUSTER_ID', '0')
+        # Replicas of the same shard cluster compete for the same lease
+        self.name = name or f"scheduler:{cluster}"
+        self.ttl = ttl if ttl is not None else float(os.getenv('LEADER_LEASE_TTL', '15'))
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self._on_elected: List[Callable[[], Awaitable]] = []
+
+    @property
+    def heartbeat_interval(self) -> float:
+        # Renew well before expiry so a slow heartbeat does not lose the lease
+        return max(1.0, self.ttl / 3)
+
+    def on_elected(self, callback: Callable[[], Awaitable]):
+        """Register a coroutine to run whenever this replica becomes leader"""
+        self._on_elected.append(callback)
+        return callback
+
+    async def heartbeat(self):
+        """Acquire or renew the lease; call every heartbeat_interval seconds"""
+        try:
+            leader = await db.acquire_lease(self.name, self.holder, self.ttl)
+        except Exception as e:
+            # Without a confirmed renewal we must assume someone else may take over
+            print(f"⚠️ Lease heartbeat failed: {e}")
+            leader = False
+
+        was_leader, self.is_leader = self.is_leader, leader
+        leader_gauge.set(1 if leader else 0, lease=self.name)
+        if leader and not was_leader:
+            print(f"👑 {self.holder} is now the leader for {self.name}")
+            for callback in self._on_elected:
+                try:
+                    await callback()
+                except Exception as e:
+                    print(f"⚠️ Error in leader election callback: {e}")
+        elif was_leader and not leader:
+            print(f"⚠️ {self.holder} lost the lease for {self.name}")
+
+    async def release(self):
+        if self.is_leader:
+            self.is_leader = False
+            leader_gauge.set(0, lease=self.name)
+            await db.release_lease(self.name, self.holder)
+
+
+# Global lease for scheduled jobs
+lease = LeaderLease()
+
+# One lease across all clusters, for jobs that cover every guild (schedule change polling, index warm-up)
+global_lease = LeaderLease('scheduler:global')
@@ -0,0 +1,49 @@
+"""
+Process memory and Discord cache usage report
+"""
+import os
+import sys
+from typing import Dict
+
+from .metrics import metrics
+
+resident_bytes = metrics.gauge('process_resident_memory_bytes', 'Resident set size of the bot process')
+cached_objects = metrics.gauge('discord_cached_objects', 'Objects held in the discord.py caches')
+
+
+def rss_bytes() -> int:
+    """Current resident set size; falls back to the peak RSS where /proc is missing"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return 0
+
+
+def memory_report(bot) -> Dict[str, int]:
+    """Collect RSS and cache sizes and publish them as metrics"""
+    report = {
+        'rss_bytes': rss_bytes(),
+        'guilds': len(bot.guilds),
+        'members': sum(len(guild.members) for guild in bot.guilds),
+        'users': len(bot.users),
+        'channels': sum(len(guild.channels) for guild in bot.guilds),
+        'messages': len(bot.cached_messages),
+    }
+    resident_bytes.set(report['rss_bytes'])
+    for kind in ('guilds', 'members', 'users', 'channels', 'messages'):
+        cached_objects.set(report[kind], kind=kind)
+    return report
+
+
+def low_memory_enabled() -> bool:
+    return os.getenv('LOW_MEMORY', '').lower() in ('1', 'true', 'yes')
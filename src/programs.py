@@ -0,0 +1,82 @@
+"""
+Registry of VOCO study groups (programs) with an in-memory name -> group ID index
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .database import db
+from .metrics import metrics
+
+programs_known = metrics.gauge('programs_known', 'Study groups in the program registry')
+
+DEFAULT_PROGRAM = 'ITA25'
+
+# Always available, also before the first VOCO group list has been loaded
+BUILTIN_PROGRAMS: Dict[str, Tuple[int, str]] = {
+    'ITA25': (2078, 'ITA25'),
+    'ITS25': (2028, 'ITS25 (2028)'),
+}
+
+
+class ProgramRegistry:
+    """Resolves program codes to VOCO group IDs in O(1) and completes prefixes via bisect"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index(dict(BUILTIN_PROGRAMS))
+
+    def _index(self, programs: Dict[str, Tuple[int, str]]):
+        # Swap complete structures so readers in other threads never see a half-built index
+        by_code = {code.upper(): entry for code, entry in programs.items()}
+        codes = sorted(by_code)
+        with self._lock:
+            self._by_code, self._codes = by_code, codes
+        programs_known.set(len(codes))
+
+    def __contains__(self, code: str) -> bool:
+        return code.upper() in self._by_code
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def resolve(self, code: str) -> Optional[int]:
+        """VOCO group ID (oppegrupp) of a program code, or None"""
+        entry = self._by_code.get(code.upper())
+        return entry[0] if entry else None
+
+    def label(self, code: str) -> str:
+        """Display name of a program code (the code itself if unknown)"""
+        entry = self._by_code.get(code.upper())
+        return entry[1] if entry else code
+
+    def codes(self) -> List[str]:
+        return list(self._codes)
+
+    def complete(self, prefix: str, limit: int = 25) -> List[str]:
+        """Program codes starting with prefix, in sorted order"""
+        prefix = prefix.upper()
+        codes = self._codes
+        start = bisect.bisect_left(codes, prefix)
+        matches = []
+        for code in codes[start:]:
+            if not code.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(code)
+        return matches
+
+    async def load(self):
+        """Rebuild the index from the programs table"""
+        programs = dict(BUILTIN_PROGRAMS)
+        programs.update(await db.get_programs())
+        self._index(programs)
+
+    async def update(self, programs: Dict[str, Tuple[int, str]]):
+        """Store a freshly scraped group list and reload the index"""
+        if programs:
+            await db.save_programs(programs)
+        await self.load()
+
+
+# Global program registry
+registry = ProgramRegistry()
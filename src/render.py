@@ -0,0 +1,186 @@
+"""
+Rendering of lesson schedules into Discord embeds
+"""
+import re
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+
+import discord
+
+from .programs import registry
+
+
+def program_display(program_code: str) -> str:
+    """Human readable program name"""
+    return registry.label(program_code)
+
+
+def stale_notice(scraper) -> str:
+    """Return a warning line if the scraper served a cached schedule, else an empty string"""
+    if not scraper.stale or not scraper.fetched_at:
+        return ""
+    return f"⚠️ VOCO ei vasta - näitan viimati salvestatud tunniplaani ({scraper.fetched_at.strftime('%d.%m %H:%M')})"
+
+
+def clean_subject(subject: str) -> str:
+    """Strip group suffixes (Rühm 1, R2, ...) from a subject name"""
+    cleaned = re.sub(r'_\s*Rühm\s*\d+|_\s*R\d+', '', subject).strip()
+    cleaned = re.sub(r'\s*Rühm\s*\d+|\s*R\d+', '', cleaned).strip()
+    return re.sub(r'_\s*$', '', cleaned).strip()
+
+
+def format_lesson(lesson: Dict) -> str:
+    """Format one (possibly time-slot grouped) lesson as embed field text"""
+    lesson_info = ""
+
+    # Handle multiple subjects/teachers/rooms (grouped by time)
+    if 'teachers' in lesson and 'rooms' in lesson and 'subjects' in lesson:
+        teachers = lesson['teachers']
+        rooms = lesson['rooms']
+        subjects = lesson['subjects']
+
+        for j, (teacher, room, subject) in enumerate(zip(teachers, rooms, subjects)):
+            lesson_info += f"**{clean_subject(subject)}**\n"
+
+            # Show group info if present
+            group_suffix = re.search(r'_\s*Rühm\s*\d+|_\s*R\d+', subject)
+            if group_suffix:
+                lesson_info += f"📚 {group_suffix.group(0).replace('_', ' ').strip()}: "
+            elif 'Rühm' in subject or 'R1' in subject or 'R2' in subject:
+                # Extract group info from subject name
+                group_match = re.search(r'(Rühm\s*\d+|R\d+)', subject)
+                if group_match:
+                    lesson_info += f"📚 {group_match.group(0)}: "
+
+            if teacher and teacher != 'Tundmatu':
+                lesson_info += f"👨‍🏫 {teacher}"
+            if room and room != 'Tundmatu ruum':
+                lesson_info += f" - 🏫 {room}"
+            if j < len(teachers) - 1:
+                lesson_info += "\n\n"
+    else:
+        # Single subject/teacher/room (original format)
+        subject = lesson.get('subject', 'Tundmatu aine')
+        lesson_info += f"**{clean_subject(subject)}**\n"
+
+        teacher = lesson.get('teacher', 'Tundmatu')
+        room = lesson.get('room', 'Tundmatu ruum')
+        if teacher and teacher != 'Tundmatu':
+            lesson_info += f"👨‍🏫 {teacher}"
+        if room and room != 'Tundmatu ruum':
+            lesson_info += f" - 🏫 {room}"
+
+    # Lessons from the teacher/room index list the groups attending
+    if lesson.get('programs'):
+        lesson_info += f"\n👥 {', '.join(lesson['programs'])}"
+
+    return lesson_info
+
+
+def format_reminder(lesson: Dict, minutes: int) -> str:
+    """Text of an upcoming-lesson reminder"""
+    return (f"⏰ **Järgmine tund {minutes} min pärast** ({lesson.get('start_time', '')}-{lesson.get('end_time', '')})\n"
+            f"{format_lesson(lesson)}")
+
+
+def build_lessons_embed(title: str, lessons: List[Dict], notice: str = "") -> discord.Embed:
+    """Build the lessons embed; notice marks a stale (cached) schedule"""
+    lessons = sorted(lessons, key=lambda x: x.get('start_time', ''))
+
+    embed = discord.Embed(
+        title=f"📅 {title}",
+        color=0xffa500 if notice else 0x00ff00,
+        timestamp=datetime.now()
+    )
+    if notice:
+        embed.description = notice
+
+    for i, lesson in enumerate(lessons):
+        time_str = f"{lesson.get('start_time', '')}-{lesson.get('end_time', '')}"
+        embed.add_field(
+            name=f"Tund {i+1} - ⏰ {time_str}",
+            value=format_lesson(lesson),
+            inline=False
+        )
+
+    embed.set_footer(text=f"Kokku {len(lessons)} tundi")
+    return embed
+
+
+WEEKDAYS = ['Esmaspäev', 'Teisipäev', 'Kolmapäev', 'Neljapäev', 'Reede', 'Laupäev', 'Pühapäev']
+
+# Stay well below Discord's limits of 25 fields and 6000 characters per embed
+MAX_FIELDS_PER_PAGE = 20
+MAX_CHARS_PER_PAGE = 5000
+
+
+def build_range_embeds(title: str, days: List[Tuple[date, List[Dict]]], notice: str = "") -> List[discord.Embed]:
+    """Build paginated embeds for lessons over several days"""
+    total = sum(len(lessons) for _, lessons in days)
+    pages: List[List[Tuple[str, str]]] = [[]]
+    page_chars = 0
+
+    for day, lessons in days:
+        day_name = f"{WEEKDAYS[day.weekday()]} {day.strftime('%d.%m')}"
+        for lesson in sorted(lessons, key=lambda x: x.get('start_time', '')):
+            name = f"{day_name} - ⏰ {lesson.get('start_time', '')}-{lesson.get('end_time', '')}"
+            value = format_lesson(lesson)[:1024]
+            if len(pages[-1]) >= MAX_FIELDS_PER_PAGE or page_chars + len(name) + len(value) > MAX_CHARS_PER_PAGE:
+                pages.append([])
+                page_chars = 0
+            pages[-1].append((name, value))
+            page_chars += len(name) + len(value)
+
+    embeds = []
+    for number, fields in enumerate(pages, start=1):
+        embed = discord.Embed(
+            title=f"📅 {title}",
+            color=0xffa500 if notice else 0x00ff00,
+            timestamp=datetime.now()
+        )
+        if notice and number == 1:
+            embed.description = notice
+        for name, value in fields:
+            embed.add_field(name=name, value=value, inline=False)
+        footer = f"Kokku {total} tundi"
+        if len(pages) > 1:
+            footer = f"Leht {number}/{len(pages)} • {footer}"
+        embed.set_footer(text=footer)
+        embeds.append(embed)
+
+    return embeds
+
+
+def _change_slot(event: Dict) -> str:
+    day = date.fromisoformat(event['date'])
+    room = event.get('room', '')
+    where = f" 🏫 {room}" if room and room != 'Tundmatu ruum' else ""
+    return f"{WEEKDAYS[day.weekday()]} {day.strftime('%d.%m')} {event.get('start_time', '')}-{event.get('end_time', '')}{where}"
+
+
+def build_changes_embed(program: str, changes: Dict[str, list]) -> discord.Embed:
+    """Embed listing lessons that were added, moved or cancelled"""
+    lines = []
+    for old, new in changes.get('moved', []):
+        lines.append(f"🔀 **{clean_subject(new.get('subject', ''))}**: {_change_slot(old)} → {_change_slot(new)}")
+    for event in changes.get('cancelled', []):
+        lines.append(f"❌ **{clean_subject(event.get('subject', ''))}** jääb ära: {_change_slot(event)}")
+    for event in changes.get('added', []):
+        lines.append(f"➕ **{clean_subject(event.get('subject', ''))}** lisandus: {_change_slot(event)}")
+
+    # Discord allows 4096 characters in an embed description
+    description = ""
+    for i, line in enumerate(lines):
+        if len(description) + len(line) + 40 > 4096:
+            description += f"... ja veel {len(lines) - i} muudatust"
+            break
+        description += line + "\n"
+
+    embed = discord.Embed(
+        title=f"🔔 Tunniplaani muudatused ({program_display(program)})",
+        description=description,
+        color=0xffa500,
+        timestamp=datetime.now()
+    )
+    embed.set_footer(text=f"Kokku {len(lines)} muudatust")
+    return embed
@@ -0,0 +1,112 @@
+"""
+Fault-tolerance helpers for upstream (VOCO) requests
+"""
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from .metrics import metrics
+
+breaker_state = metrics.gauge('circuit_breaker_open', 'Whether a circuit breaker is open (1) or closed (0)')
+breaker_rejected = metrics.counter('circuit_breaker_rejected_total', 'Requests rejected by an open circuit breaker')
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is rejected because the circuit is open"""
+
+
+class CircuitBreaker:
+    """Classic closed / open / half-open circuit breaker (thread-safe)"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Return True if a request may go upstream right now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let exactly one trial request through
+                self._state = self.HALF_OPEN
+                return True
+            breaker_rejected.inc(breaker=self.name)
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                print(f"✅ Circuit {self.name} closed, upstream recovered")
+            self._state = self.CLOSED
+            self._failures = 0
+            breaker_state.set(0, breaker=self.name)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    print(f"⚠️ Circuit {self.name} opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                breaker_state.set(1, breaker=self.name)
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter, bounded by an overall deadline"""
+
+    def __init__(self, attempts: int = 3, base: float = 0.5, cap: float = 4.0, deadline: float = 20.0):
+        self.attempts = max(1, attempts)
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait after the given (0-based) failed attempt"""
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def next_delay(self, attempt: int, started: float) -> Optional[float]:
+        """Delay before the next attempt, or None when no attempt is left within the deadline"""
+        if attempt + 1 >= self.attempts:
+            return None
+        delay = self.backoff(attempt)
+        if time.monotonic() - started + delay >= self.deadline:
+            return None
+        return delay
+
+
+class LatencyWindow:
+    """Recent request durations, for percentile-based hedging delays (thread-safe)"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """The given percentile (0..1) of the window, or None until enough samples were seen"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
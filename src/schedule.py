@@ -0,0 +1,246 @@
+"""
+Schedule service: coalesces concurrent lookups and deduplicates channel posts
+"""
+import asyncio
+import os
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import metrics
+from .render import build_lessons_embed, build_range_embeds, program_display, stale_notice
+from .scraper import VOCOScraper
+
+coalesced_requests = metrics.counter('schedule_coalesced_total', 'Schedule lookups served by an in-flight request')
+deduplicated_posts = metrics.counter('schedule_dedup_total', 'Schedule posts replaced by a link to a recent post')
+
+
+# Longest range a single !tunniplaan range query may cover
+MAX_RANGE_DAYS = int(os.getenv('TUNNIPLAAN_MAX_RANGE_DAYS', '93'))
+
+RANGE_PATTERN = re.compile(r'^(\d{1,2}\.\d{1,2}\.\d{4})\s*-\s*(\d{1,2}\.\d{1,2}\.\d{4})$')
+
+
+def resolve_date_param(date_param: Optional[str]) -> Tuple[date, date]:
+    """Resolve a !tunniplaan argument to an inclusive (start, end) date range.
+
+    Accepts nothing (today), 'homme', 'nädal', 'järgmine nädal', 'DD.MM.YYYY' and
+    'DD.MM.YYYY-DD.MM.YYYY'. Raises ValueError for anything else.
+    """
+    today = date.today()
+    if date_param is None:
+        return today, today
+
+    param = ' '.join(date_param.lower().split())
+    if param == 'homme':
+        tomorrow = today + timedelta(days=1)
+        return tomorrow, tomorrow
+    if param in ('nädal', 'nadal'):
+        monday = today - timedelta(days=today.weekday())
+        return monday, monday + timedelta(days=6)
+    if param in ('järgmine nädal', 'jargmine nadal'):
+        monday = today - timedelta(days=today.weekday()) + timedelta(weeks=1)
+        return monday, monday + timedelta(days=6)
+
+    match = RANGE_PATTERN.match(param)
+    if match:
+        start = datetime.strptime(match.group(1), '%d.%m.%Y').date()
+        end = datetime.strptime(match.group(2), '%d.%m.%Y').date()
+        if end < start:
+            raise ValueError("range end before start")
+        if (end - start).days + 1 > MAX_RANGE_DAYS:
+            raise ValueError("range too long")
+        return start, end
+
+    day = datetime.strptime(param, '%d.%m.%Y').date()
+    return day, day
+
+
+def iso_weeks(start: date, end: date) -> List[date]:
+    """Mondays of all ISO weeks overlapping the inclusive range"""
+    monday = start - timedelta(days=start.weekday())
+    weeks = []
+    while monday <= end:
+        weeks.append(monday)
+        monday += timedelta(weeks=1)
+    return weeks
+
+
+def day_labels(day: date) -> Tuple[str, str]:
+    """Return (embed title, empty-day label) for a date"""
+    today = date.today()
+    if day == today:
+        return "Tänased tunnid", "Täna"
+    if day == today + timedelta(days=1):
+        return "Homsed tunnid", "Homme"
+    return f"Tunnid {day.strftime('%d.%m.%Y')}", day.strftime('%d.%m.%Y')
+
+
+class ScheduleService:
+    """Shares one fetch and one render between simultaneous requests for the same day"""
+
+    def __init__(self, dedup_window: float = None, fetch_concurrency: int = None):
+        if dedup_window is None:
+            dedup_window = float(os.getenv('TUNNIPLAAN_DEDUP_SECONDS', '30'))
+        if fetch_concurrency is None:
+            fetch_concurrency = int(os.getenv('SCHEDULE_FETCH_CONCURRENCY', '4'))
+        self.dedup_window = dedup_window
+        self.fetch_concurrency = fetch_concurrency
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        # (channel_id, program, day) -> (future resolving to the message URL, posted at)
+        self._recent_posts: Dict[tuple, Tuple[asyncio.Future, float]] = {}
+
+    async def _coalesce(self, key: tuple, factory: Callable[[], Awaitable]):
+        """Run factory once per key; concurrent callers await the same task"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            coalesced_requests.inc()
+        # Shield so one caller being cancelled does not cancel the shared work
+        return await asyncio.shield(task)
+
+    async def render_day(self, program: str, day: date, automatic: bool = False) -> Dict:
+        """Fetch and render the lessons of one day.
+
+        Returns a dict with 'lessons' plus either 'content' (no lessons) or 'embed'.
+        Raises ScheduleUnavailableError when VOCO is down and nothing is cached.
+        """
+        key = ('day', program, day, automatic)
+        return await self._coalesce(key, lambda: self._render_day(program, day, automatic))
+
+    async def _render_day(self, program: str, day: date, automatic: bool) -> Dict:
+        scraper = VOCOScraper(program)
+        lessons = await asyncio.to_thread(scraper.get_lessons_on, datetime.combine(day, datetime.min.time()))
+        notice = stale_notice(scraper)
+        title, empty_label = day_labels(day)
+
+        if not lessons:
+            content = f"📅 **{empty_label} tunde ei ole** - Vaba päev! 🎉"
+            if notice:
+                content += f"\n{notice}"
+            return {'lessons': lessons, 'content': content, 'embed': None}
+
+        title = f"{title} ({program_display(program)})"
+        if automatic:
+            title += " - Automaatne"
+        embed = build_lessons_embed(title, lessons, notice)
+        return {'lessons': lessons, 'content': None, 'embed': embed}
+
+    async def render_range(self, program: str, start: date, end: date) -> Dict:
+        """Fetch and render the lessons of an inclusive date range.
+
+        Returns a dict with 'lessons' plus either 'content' (no lessons) or 'embeds'.
+        """
+        key = ('range', program, start, end)
+        return await self._coalesce(key, lambda: self._render_range(program, start, end))
+
+    async def _render_range(self, program: str, start: date, end: date) -> Dict:
+        weeks, stale = await self.fetch_weeks(program, iso_weeks(start, end))
+
+        grouper = VOCOScraper(program)
+        days = []
+        day = start
+        while day <= end:
+            monday = day - timedelta(days=day.weekday())
+            lessons = grouper.group_lessons(weeks[monday], day.isoformat())
+            if lessons:
+                days.append((day, lessons))
+            day += timedelta(days=1)
+
+        notice = stale_notice(stale) if stale else ""
+        label = f"{start.strftime('%d.%m.%Y')}-{end.strftime('%d.%m.%Y')}"
+        all_lessons = [lesson for _, lessons in days for lesson in lessons]
+        if not all_lessons:
+            content = f"📅 **{label} tunde ei ole** - Vaba aeg! 🎉"
+            if notice:
+                content += f"\n{notice}"
+            return {'lessons': all_lessons, 'content': content, 'embeds': []}
+
+        title = f"Tunnid {label} ({program_display(program)})"
+        return {'lessons': all_lessons, 'content': None, 'embeds': build_range_embeds(title, days, notice)}
+
+    async def fetch_weeks(self, program: str, mondays: List[date]) -> Tuple[Dict[date, List[Dict]], Optional[VOCOScraper]]:
+        """Load several weeks, reusing cached ones and fetching the rest concurrently.
+
+        Returns ({monday: events}, scraper that served stale data or None).
+        """
+        weeks: Dict[date, List[Dict]] = {}
+        missing = []
+
+        def read_cached():
+            # SQLite reads and zlib/JSON decoding, run in a worker thread
+            cache_reader = VOCOScraper(program)
+            for monday in mondays:
+                events = cache_reader.cached_week(datetime.combine(monday, datetime.min.time()))
+                if events is None:
+                    missing.append(monday)
+                else:
+                    weeks[monday] = events
+
+        await asyncio.to_thread(read_cached)
+
+        semaphore = asyncio.Semaphore(max(1, self.fetch_concurrency))
+        stale = None
+
+        async def fetch(monday: date):
+            nonlocal stale
+            async with semaphore:
+                # One scraper per week: requests sessions are not shared between threads
+                scraper = VOCOScraper(program)
+                weeks[monday] = await asyncio.to_thread(
+                    scraper.get_week_events, datetime.combine(monday, datetime.min.time())
+                )
+                if scraper.stale:
+                    stale = scraper
+
+        await asyncio.gather(*(fetch(monday) for monday in missing))
+        return weeks, stale
+
+    def claim_post(self, key: tuple) -> Optional[asyncio.Future]:
+        """Claim the right to post for key.
+
+        Returns None if the caller should post (it must then call finish_post), or a
+        future resolving to the URL of the identical message posted moments ago.
+        """
+        if self.dedup_window <= 0:
+            return None
+
+        now = time.monotonic()
+        if len(self._recent_posts) > 256:
+            self._recent_posts = {
+                k: v for k, v in self._recent_posts.items() if now - v[1] < self.dedup_window
+            }
+
+        entry = self._recent_posts.get(key)
+        if entry and now - entry[1] < self.dedup_window:
+            deduplicated_posts.inc()
+            return entry[0]
+
+        self._recent_posts[key] = (asyncio.get_running_loop().create_future(), now)
+        return None
+
+    def finish_post(self, key: tuple, message=None):
+        """Publish the posted message (or None on failure) to callers waiting on claim_post"""
+        entry = self._recent_posts.get(key)
+        if entry is None:
+            return
+        future = entry[0]
+        if not future.done():
+            future.set_result(message.jump_url if message else None)
+        if message is None:
+            del self._recent_posts[key]
+
+    async def wait_post(self, future: asyncio.Future, timeout: float = 30) -> Optional[str]:
+        """Wait for the URL of a post claimed by another invocation"""
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+# Global schedule service instance
+schedule = ScheduleService()
@@ -0,0 +1,310 @@
+"""
+Single-timer scheduling: a min-heap of fire times, the per-guild daily broadcast and lesson reminders
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from .database import db
+from .metrics import metrics
+from .programs import DEFAULT_PROGRAM
+from .scraper import VOCOScraper
+
+timers_pending = metrics.gauge('timers_pending', 'Timers waiting in the scheduler heap')
+
+DEFAULT_BROADCAST_TIME = '06:00'
+DEFAULT_TIMEZONE = 'Europe/Tallinn'
+
+# VOCO lesson times are Estonian local time
+LESSON_TIMEZONE = ZoneInfo('Europe/Tallinn')
+
+# Never sleep longer than this, so wall clock jumps are noticed
+MAX_SLEEP = 60.0
+
+
+class TimerHeap:
+    """Runs callbacks at given wall clock times using one asyncio task.
+
+    Scheduling and cancelling cost O(log n); replaced or cancelled entries are
+    dropped lazily when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        # key -> (seq, fire_at, callback); seq identifies the live heap entry of a key
+        self._entries: Dict[Hashable, Tuple[int, float, Callable[[], Awaitable]]] = {}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Callbacks currently running; the loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        """Start the timer task on the running loop (idempotent)"""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the timer task and cancel callbacks that are still running"""
+        tasks = [task for task in (self._task, *self._tasks) if task is not None and not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._tasks.clear()
+
+    def schedule(self, key: Hashable, fire_at: float, callback: Callable[[], Awaitable]):
+        """Run callback at epoch time fire_at, replacing any timer with the same key"""
+        seq = next(self._seq)
+        self._entries[key] = (seq, fire_at, callback)
+        heapq.heappush(self._heap, (fire_at, seq, key))
+        timers_pending.set(len(self._entries))
+        # Wake the runner if the new timer is now the earliest
+        if self._wakeup is not None and self._heap[0][1] == seq:
+            self._wakeup.set()
+        self._compact()
+
+    def cancel(self, key: Hashable):
+        if self._entries.pop(key, None) is not None:
+            timers_pending.set(len(self._entries))
+
+    def fire_time(self, key: Hashable) -> Optional[float]:
+        entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    def _is_live(self, item: Tuple[float, int, Hashable]) -> bool:
+        entry = self._entries.get(item[2])
+        return entry is not None and entry[0] == item[1]
+
+    def _compact(self):
+        # Rebuild when dead entries dominate, keeping memory proportional to live timers
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [item for item in self._heap if self._is_live(item)]
+            heapq.heapify(self._heap)
+
+    async def _run(self):
+        while True:
+            while self._heap and not self._is_live(self._heap[0]):
+                heapq.heappop(self._heap)
+
+            timeout = MAX_SLEEP
+            if self._heap:
+                timeout = min(MAX_SLEEP, max(0.0, self._heap[0][0] - time.time()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                item = heapq.heappop(self._heap)
+                if not self._is_live(item):
+                    continue
+                _, _, callback = self._entries.pop(item[2])
+                task = asyncio.create_task(self._call(item[2], callback))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            timers_pending.set(len(self._entries))
+
+    async def _call(self, key: Hashable, callback: Callable[[], Awaitable]):
+        try:
+            await callback()
+        except Exception as e:
+            print(f"⚠️ Error in timer {key}: {e}")
+
+
+def parse_broadcast_time(value: str) -> dtime:
+    """Parse HH:MM; raises ValueError"""
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def load_timezone(name: str) -> ZoneInfo:
+    """Return the zone, falling back to Estonian time for unknown names"""
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def next_weekday_run(after: datetime, at: dtime, tz: ZoneInfo) -> datetime:
+    """First weekday occurrence of local time at strictly after the aware datetime after"""
+    local = after.astimezone(tz)
+    for offset in range(8):
+        day = local.date() + timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        candidate = datetime.combine(day, at, tzinfo=tz)
+        if candidate > local:
+            return candidate
+    raise ValueError("no weekday found")
+
+
+def previous_weekday_run(before: datetime, at: dtime, tz: ZoneInfo) -> datetime:
+    """Last weekday occurrence of local time at on or before the aware datetime before"""
+    local = before.astimezone(tz)
+    for offset in range(8):
+        day = local.date() - timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        candidate = datetime.combine(day, at, tzinfo=tz)
+        if candidate <= local:
+            return candidate
+    raise ValueError("no weekday found")
+
+
+class BroadcastScheduler:
+    """Schedules each guild's daily lessons post at its own local time"""
+
+    JOB = 'daily_lessons'
+
+    def __init__(self, timers: TimerHeap):
+        self.timers = timers
+        self.catchup = timedelta(hours=float(os.getenv('BROADCAST_CATCHUP_HOURS', '3')))
+        # async sender(guild_id, channel_id, day) set by main.py
+        self.sender: Optional[Callable[[str, int, date], Awaitable]] = None
+
+    async def load(self, catch_up: bool = True):
+        """(Re)plan all guilds; with catch_up, runs missed during downtime fire right away"""
+        settings = await db.get_broadcast_settings()
+        planned = set()
+        for guild_id, guild_settings in settings.items():
+            await self._plan(guild_id, guild_settings, catch_up)
+            planned.add(('broadcast', guild_id))
+        # Drop guilds whose channel was removed meanwhile
+        for key in [k for k in list(self.timers._entries) if k[0] == 'broadcast' and k not in planned]:
+            self.timers.cancel(key)
+        print(f"⏰ Planned daily lessons for {len(planned)} guilds")
+
+    async def refresh_guild(self, guild_id: str):
+        """Re-plan one guild after its channel or time changed"""
+        settings = (await db.get_broadcast_settings()).get(guild_id)
+        if settings is None:
+            self.timers.cancel(('broadcast', guild_id))
+        else:
+            await self._plan(guild_id, settings, catch_up=False)
+
+    async def _plan(self, guild_id: str, settings: Dict, catch_up: bool):
+        due = self.timers.fire_time(('broadcast', guild_id))
+        if not catch_up and due is not None and due <= time.time():
+            # A catch-up run is about to fire; re-planning now would skip it
+            return
+        tz = load_timezone(settings['timezone'])
+        try:
+            at = parse_broadcast_time(settings['broadcast_time'])
+        except (TypeError, ValueError):
+            at = parse_broadcast_time(DEFAULT_BROADCAST_TIME)
+        now = datetime.now(timezone.utc)
+
+        if catch_up:
+            last = previous_weekday_run(now, at, tz)
+            if now - last <= self.catchup and not await db.is_broadcast_done(self.JOB, guild_id, last.date().isoformat()):
+                self._schedule(guild_id, settings['channel_id'], now, last.date())
+                return
+
+        run = next_weekday_run(now, at, tz)
+        self._schedule(guild_id, settings['channel_id'], run, run.date())
+
+    def _schedule(self, guild_id: str, channel_id: int, run: datetime, day: date):
+        async def fire():
+            try:
+                if self.sender is not None:
+                    await self.sender(guild_id, channel_id, day)
+            finally:
+                # Plan the following run unless the guild was re-planned meanwhile
+                if self.timers.fire_time(('broadcast', guild_id)) is None:
+                    settings = (await db.get_broadcast_settings()).get(guild_id)
+                    if settings is not None:
+                        await self._plan(guild_id, settings, catch_up=False)
+
+        self.timers.schedule(('broadcast', guild_id), run.timestamp(), fire)
+
+
+class ReminderScheduler:
+    """Schedules "next lesson in N minutes" reminders from the cached schedule of the day"""
+
+    def __init__(self, timers: TimerHeap):
+        self.timers = timers
+        # Timer keys per guild, so disabling reminders can cancel them
+        self._keys: Dict[str, set] = {}
+        # async sender(guild_id, channel_id, lesson, minutes) set by main.py
+        self.sender: Optional[Callable[[str, int, Dict, int], Awaitable]] = None
+
+    async def plan(self, day: date = None):
+        """(Re)plan today's reminders of all guilds; costs no VOCO requests.
+
+        Lessons are read from the week cache only, which the daily post, the index
+        warm-up and the change poller keep fresh. Already passed reminders are skipped,
+        so planning again is harmless.
+        """
+        day = day or datetime.now(LESSON_TIMEZONE).date()
+        settings = await db.get_broadcast_settings()
+        server_programs = await db.get_server_programs()
+        lessons_by_program: Dict[str, List[Dict]] = {}
+        planned = 0
+        for guild_id, guild_settings in settings.items():
+            minutes = guild_settings['reminder_minutes']
+            if not minutes:
+                self.cancel_guild(guild_id)
+                continue
+            program = server_programs.get(guild_id, DEFAULT_PROGRAM)
+            if program not in lessons_by_program:
+                # Reads and decompresses a cached week; keep it off the event loop
+                lessons_by_program[program] = await asyncio.to_thread(self._cached_lessons, program, day)
+            planned += self._plan_guild(guild_id, guild_settings['channel_id'], minutes, lessons_by_program[program], day)
+        for guild_id in [g for g in self._keys if g not in settings]:
+            self.cancel_guild(guild_id)
+        print(f"⏰ Planned {planned} lesson reminders")
+
+    def _cached_lessons(self, program: str, day: date) -> List[Dict]:
+        scraper = VOCOScraper(program)
+        entry = scraper.cached_entry(datetime.combine(day, datetime.min.time()))
+        if entry is None:
+            return []
+        return scraper.group_lessons(entry['events'], day.isoformat())
+
+    def _plan_guild(self, guild_id: str, channel_id: int, minutes: int, lessons: List[Dict], day: date) -> int:
+        now = time.time()
+        keys = set()
+        for lesson in lessons:
+            try:
+                start = datetime.combine(day, parse_broadcast_time(lesson['start_time']), tzinfo=LESSON_TIMEZONE)
+            except (KeyError, ValueError):
+                continue
+            fire_at = start.timestamp() - minutes * 60
+            if fire_at <= now:
+                continue
+            key = ('reminder', guild_id, day.isoformat(), lesson['start_time'])
+            self.timers.schedule(key, fire_at, self._reminder(guild_id, channel_id, lesson, minutes))
+            keys.add(key)
+        # Lessons that disappeared from the schedule lose their reminder
+        for key in self._keys.get(guild_id, set()) - keys:
+            self.timers.cancel(key)
+        self._keys[guild_id] = keys
+        return len(keys)
+
+    def _reminder(self, guild_id: str, channel_id: int, lesson: Dict, minutes: int):
+        async def fire():
+            if self.sender is not None:
+                await self.sender(guild_id, channel_id, lesson, minutes)
+        return fire
+
+    def cancel_guild(self, guild_id: str):
+        for key in self._keys.pop(guild_id, set()):
+            self.timers.cancel(key)
+
+
+# Global timer heap, broadcast scheduler and reminder scheduler
+timers = TimerHeap()
+broadcaster = BroadcastScheduler(timers)
+reminders = ReminderScheduler(timers)
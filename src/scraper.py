@@ -1,160 +1,440 @@
 """
 Simplified VOCO Scraper for Discord Bot
+
+Bulk scrape without Discord:
+    python -m src.scraper [PROGRAM ...] [--from DATE] [--weeks N] [--concurrency N] [--output ndjson|sqlite]
 """
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
 import requests
 import re
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from bs4 import BeautifulSoup
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed, wait
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Optional, TYPE_CHECKING
+from .archive import archive
+from .cache import MemoryWeekCache, SQLiteWeekCache, create_week_cache
+from .database import db
+from .jsliteral import find_events
+from .metrics import metrics
+from .programs import registry, DEFAULT_PROGRAM
+from .resilience import CircuitBreaker, LatencyWindow, RetryPolicy
+from .tracing import tracer
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+cache_lookups = metrics.counter('schedule_cache_lookups_total', 'Week lookups by outcome (fresh, revalidate, fetch, stale)')
+attempt_seconds = metrics.histogram('voco_request_attempt_seconds', 'Duration of single VOCO requests by attempt, kind (primary, hedge) and outcome')
+retries = metrics.counter('voco_retries_total', 'VOCO requests retried after a transient error')
+hedge_wins = metrics.counter('voco_hedge_wins_total', 'Hedged VOCO requests by the request that answered first')
+
+
+def is_retryable(error: Exception) -> bool:
+    """Connection errors, timeouts, 429 and 5xx responses are worth another attempt"""
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class ScheduleUnavailableError(Exception):
+    """Raised when VOCO is unreachable and no cached schedule exists"""
+
 
 class VOCOScraper:
-    """Simplified VOCO scraper for ITA25 and ITS25 lessons"""
+    """Simplified VOCO scraper for the lessons of one study group"""
+    
+    # Seconds a fetched week is considered fresh
+    CACHE_TTL = float(os.getenv('SCHEDULE_CACHE_TTL', '600'))
+    
+    # Older weeks up to this age are served at once and refreshed in the background
+    # (e.g. the previous snapshot right after a restart)
+    REVALIDATE_AGE = float(os.getenv('SCHEDULE_REVALIDATE_AGE', str(6 * 3600)))
+    
+    # Weeks before the current one kept in the cache; older ones are pruned by the daily maintenance
+    CACHE_KEEP_WEEKS = int(os.getenv('SCHEDULE_CACHE_KEEP_WEEKS', '8'))
+    
+    # Last known good schedule per (oppegrupp, week monday), shared by all instances
+    # (and by all processes with SCHEDULE_CACHE_BACKEND=sqlite)
+    _week_cache = create_week_cache()
+    
+    # Weeks being refreshed in the background, and a cap on concurrent background fetches
+    _revalidating = set()
+    _revalidating_lock = threading.Lock()
+    _revalidate_slots = threading.BoundedSemaphore(int(os.getenv('SCHEDULE_FETCH_CONCURRENCY', '4')))
     
-    # Program codes mapping
-    PROGRAM_CODES = {
-        'ITA25': 2078,  # ITA25
-        'ITS25': 2028   # ITS25 (2028)
-    }
+    # Retries of transient errors with capped exponential backoff and jitter
+    retry_policy = RetryPolicy(
+        attempts=int(os.getenv('VOCO_RETRIES', '2')) + 1,
+        base=float(os.getenv('VOCO_RETRY_BASE', '0.5')),
+        cap=float(os.getenv('VOCO_RETRY_CAP', '4')),
+        deadline=float(os.getenv('VOCO_DEADLINE', '20'))
+    )
     
-    def __init__(self, program_code='ITA25'):
+    # Hedging: a second request goes out when the first is slower than the recent p95
+    HEDGE = os.getenv('VOCO_HEDGE', '').lower() in ('1', 'true', 'yes')
+    latency = LatencyWindow()
+    _hedge_slots = threading.BoundedSemaphore(int(os.getenv('VOCO_HEDGE_MAX', '2')))
+    _hedge_executor: Optional[ThreadPoolExecutor] = None
+    _hedge_executor_lock = threading.Lock()
+    
+    # Shared breaker for all VOCO requests
+    breaker = CircuitBreaker(
+        'voco',
+        failure_threshold=int(os.getenv('VOCO_BREAKER_FAILURES', '3')),
+        reset_timeout=float(os.getenv('VOCO_BREAKER_RESET', '60'))
+    )
+    
+    def __init__(self, program_code=DEFAULT_PROGRAM):
         self.base_url = "https://siseveeb.voco.ee/veebivormid/tunniplaan"
         self.program_code = program_code
-        self.oppegrupp = self.PROGRAM_CODES.get(program_code, 2078)  # Default to ITA25
+        # Unknown codes fall back to the default program
+        self.oppegrupp = registry.resolve(program_code) or registry.resolve(DEFAULT_PROGRAM)
         self.session = requests.Session()
-        self.session.timeout = 30
+        self.timeout = float(os.getenv('VOCO_TIMEOUT', '10'))
+        # Set when the last result came from the cache because VOCO was unavailable
+        self.stale = False
+        self.fetched_at: Optional[datetime] = None
+        # SHA-256 of the last fetched page and whether it differed from the cached one
+        self.payload_hash: Optional[str] = None
+        self.payload_changed = False
     
     def get_todays_lessons(self) -> List[Dict]:
         """Get today's lessons for the selected program"""
-        today = datetime.now().strftime('%d.%m.%Y')
+        return self.get_lessons_on(datetime.now())
+    
+    def get_lessons_for_date(self, date_str: str) -> List[Dict]:
+        """Get lessons for a specific date for the selected program"""
+        # Handle 'tomorrow' parameter
+        if date_str == 'tomorrow':
+            target = datetime.now() + timedelta(days=1)
+        else:
+            try:
+                target = datetime.strptime(date_str, '%d.%m.%Y')
+            except ValueError:
+                print(f"Invalid date format: {date_str}")
+                return []
+        
+        return self.get_lessons_on(target)
+    
+    def get_lessons_on(self, day: datetime) -> List[Dict]:
+        """Get lessons for the given day for the selected program"""
+        events = self.get_week_events(day)
+        return self.group_lessons(events, day.strftime('%Y-%m-%d'))
+    
+    def cached_entry(self, day: datetime, max_age: Optional[float] = None) -> Optional[Dict]:
+        """Return the cache entry ({'events', 'fetched_at'}) for the week containing day.
+        
+        With max_age, entries older than max_age seconds are treated as missing.
+        """
+        cached = self._week_cache.get(self._cache_key(day))
+        if cached and (max_age is None or time.time() - cached['fetched_at'] < max_age):
+            return cached
+        return None
+    
+    def cached_week(self, day: datetime) -> Optional[List[Dict]]:
+        """Return the week containing day from the cache if it is still fresh, else None"""
+        cached = self.cached_entry(day, max_age=self.CACHE_TTL)
+        return cached['events'] if cached else None
+    
+    def get_week_events(self, day: datetime) -> List[Dict]:
+        """Get parsed events for the week containing day, using the cache when possible.
         
+        Serves the last known good week (and sets self.stale) when VOCO fails or the
+        circuit breaker is not closed. Raises ScheduleUnavailableError if nothing is cached.
+        """
+        key = self._cache_key(day)
+        cached = self._week_cache.get(key)
+        
+        # Cached answers count as stale while VOCO is failing, however young the snapshot
+        self.stale = self.breaker.state != self.breaker.CLOSED
+        age = time.time() - cached['fetched_at'] if cached else None
+        if cached and age < self.CACHE_TTL:
+            cache_lookups.inc(result='fresh')
+            self.fetched_at = datetime.fromtimestamp(cached['fetched_at'])
+            return cached['events']
+        
+        if cached and age < self.REVALIDATE_AGE:
+            # Answer from the snapshot now, refresh it for the next caller
+            cache_lookups.inc(result='revalidate')
+            self._revalidate(day)
+            self.fetched_at = datetime.fromtimestamp(cached['fetched_at'])
+            return cached['events']
+        
+        error = None
+        if self.breaker.allow_request():
+            try:
+                cache_lookups.inc(result='fetch')
+                return self.refresh_week(day)
+            except Exception as e:
+                error = e
+                print(f"Error fetching lessons: {e}")
+        else:
+            error = 'circuit open'
+        
+        if cached:
+            # VOCO is down: serve the last known good schedule
+            cache_lookups.inc(result='stale')
+            self.stale = True
+            self.fetched_at = datetime.fromtimestamp(cached['fetched_at'])
+            return cached['events']
+        raise ScheduleUnavailableError(f"VOCO unavailable ({error})")
+    
+    def _revalidate(self, day: datetime):
+        """Refresh the week containing day in a background thread, once at a time per week"""
+        key = self._cache_key(day)
+        with self._revalidating_lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+        
+        def run():
+            try:
+                with self._revalidate_slots:
+                    if self.breaker.allow_request():
+                        # Own instance: requests sessions are not shared between threads
+                        scraper = VOCOScraper(self.program_code)
+                        scraper.oppegrupp = self.oppegrupp
+                        scraper.refresh_week(day)
+            except Exception as e:
+                print(f"⚠️ Background refresh of {key} failed: {e}")
+            finally:
+                with self._revalidating_lock:
+                    self._revalidating.discard(key)
+        
+        threading.Thread(target=run, name=f"revalidate-{key[0]}-{key[1]}", daemon=True).start()
+    
+    def refresh_week(self, day: datetime) -> List[Dict]:
+        """Fetch the week containing day from VOCO, update the cache and the breaker.
+        
+        Parsing is skipped when the page is byte-identical to the cached one;
+        self.payload_hash and self.payload_changed describe the fetched page.
+        """
+        key = self._cache_key(day)
         try:
-            # Fetch the schedule page
-            url = f"{self.base_url}/tunniplaan"
-            params = {
-                "oppegrupp": self.oppegrupp,
-                "nadal": today,
-                "no_export": 1
-            }
-            
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            
-            # Parse the HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
-            events = self._parse_events(soup)
-            
-            # Filter for today's lessons and remove "Tegevuspäev"
-            today_lessons = []
-            seen_lessons = set()
-            
-            for event in events:
-                event_date = event.get('date', '')
-                # Convert today's date to ISO format for comparison
-                today_iso = datetime.now().strftime('%Y-%m-%d')
-                if event_date == today_iso:
-                    subject = event.get('subject', '')
-                    # Skip "Tegevuspäev" and empty subjects
-                    if subject and subject != 'Tegevuspäev' and subject.strip():
-                        # Group by time slot only (not subject name)
-                        start_time = event.get('start_time', '')
-                        end_time = event.get('end_time', '')
-                        lesson_key = f"{start_time}_{end_time}"
-                        if lesson_key not in seen_lessons:
-                            today_lessons.append(event)
-                            seen_lessons.add(lesson_key)
-                        else:
-                            # If same time slot, merge with existing lesson
-                            for i, existing_lesson in enumerate(today_lessons):
-                                if (existing_lesson.get('start_time') == start_time and
-                                    existing_lesson.get('end_time') == end_time):
-                                    # Add teacher and room to existing lesson
-                                    if 'teachers' not in existing_lesson:
-                                        existing_lesson['teachers'] = [existing_lesson.get('teacher', '')]
-                                        existing_lesson['rooms'] = [existing_lesson.get('room', '')]
-                                        existing_lesson['subjects'] = [existing_lesson.get('subject', '')]
-                                    existing_lesson['teachers'].append(event.get('teacher', ''))
-                                    existing_lesson['rooms'].append(event.get('room', ''))
-                                    existing_lesson['subjects'].append(subject)
-                                    break
-            
-            return today_lessons
-            
+            page = self._fetch_page(day.strftime('%d.%m.%Y'))
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        
+        if archive.enabled:
+            try:
+                archive.store(page, self.oppegrupp, key[1])
+            except OSError as e:
+                print(f"⚠️ Could not archive page {key}: {e}")
+        
+        self.payload_hash = hashlib.sha256(page).hexdigest()
+        cached = self._week_cache.get(key)
+        self.payload_changed = not (cached and cached.get('hash') == self.payload_hash)
+        if self.payload_changed:
+            events = self._parse_page(page)
+        else:
+            events = cached['events']
+        
+        fetched_at = time.time()
+        self._week_cache.put(key, {'events': events, 'fetched_at': fetched_at, 'hash': self.payload_hash})
+        self.stale = False
+        self.fetched_at = datetime.fromtimestamp(fetched_at)
+        return events
+    
+    @classmethod
+    def probe(cls) -> bool:
+        """Background probe while the breaker is not closed; returns True once VOCO answers"""
+        if cls.breaker.state == CircuitBreaker.CLOSED:
+            return True
+        
+        # Revalidate the most recently cached program, or the default one
+        keys = cls._week_cache.keys()
+        scraper = cls()
+        if keys:
+            scraper.oppegrupp = keys[-1][0]
+        try:
+            scraper.refresh_week(datetime.now())
+            return True
         except Exception as e:
-            print(f"Error fetching lessons: {e}")
-            return []
+            print(f"⚠️ VOCO probe failed: {e}")
+            return False
     
-    def get_lessons_for_date(self, date_str: str) -> List[Dict]:
-        """Get lessons for a specific date for the selected program"""
+    @classmethod
+    def prune_cache(cls) -> int:
+        """Drop cached weeks older than SCHEDULE_CACHE_KEEP_WEEKS; returns how many"""
+        today = date.today()
+        cutoff = today - timedelta(days=today.weekday(), weeks=cls.CACHE_KEEP_WEEKS)
+        return cls._week_cache.prune(cutoff.isoformat())
+    
+    @classmethod
+    def fetch_programs(cls) -> Dict[str, tuple]:
+        """Scrape VOCO's study group list as {code: (oppegrupp, label)}"""
+        scraper = cls()
+        if not cls.breaker.allow_request():
+            raise ScheduleUnavailableError("VOCO unavailable (circuit open)")
+        try:
+            with tracer.span('scrape.programs'):
+                response = scraper._get(f"{scraper.base_url}/tunniplaan")
+        except Exception:
+            cls.breaker.record_failure()
+            raise
+        cls.breaker.record_success()
+        
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(response.text, 'html.parser')
+        programs = {}
+        select = soup.find('select', attrs={'name': 'oppegrupp'})
+        for option in select.find_all('option') if select else []:
+            value = (option.get('value') or '').strip()
+            label = option.get_text(' ', strip=True)
+            if not value.isdigit() or not label:
+                continue
+            code = label.split()[0].upper()
+            # Keep the first group if VOCO lists a code twice
+            programs.setdefault(code, (int(value), label))
+        return programs
+    
+    def _cache_key(self, day: datetime) -> tuple:
+        monday = (day - timedelta(days=day.weekday())).strftime('%Y-%m-%d')
+        return (self.oppegrupp, monday)
+    
+    def group_lessons(self, events: List[Dict], target_date_iso: str) -> List[Dict]:
+        """Filter events for one date, drop "Tegevuspäev" and merge lessons sharing a time slot"""
+        lessons = []
+        seen_lessons = set()
+        
+        for event in events:
+            event_date = event.get('date', '')
+            if event_date == target_date_iso:
+                subject = event.get('subject', '')
+                # Skip "Tegevuspäev" and empty subjects
+                if subject and subject != 'Tegevuspäev' and subject.strip():
+                    # Group by time slot only (not subject name)
+                    start_time = event.get('start_time', '')
+                    end_time = event.get('end_time', '')
+                    lesson_key = f"{start_time}_{end_time}"
+                    if lesson_key not in seen_lessons:
+                        # Copy so merging never mutates the cached events
+                        lessons.append(dict(event))
+                        seen_lessons.add(lesson_key)
+                    else:
+                        # If same time slot, merge with existing lesson
+                        for existing_lesson in lessons:
+                            if (existing_lesson.get('start_time') == start_time and
+                                existing_lesson.get('end_time') == end_time):
+                                # Add teacher and room to existing lesson
+                                if 'teachers' not in existing_lesson:
+                                    existing_lesson['teachers'] = [existing_lesson.get('teacher', '')]
+                                    existing_lesson['rooms'] = [existing_lesson.get('room', '')]
+                                    existing_lesson['subjects'] = [existing_lesson.get('subject', '')]
+                                existing_lesson['teachers'].append(event.get('teacher', ''))
+                                existing_lesson['rooms'].append(event.get('room', ''))
+                                existing_lesson['subjects'].append(subject)
+                                break
+        
+        return lessons
+    
+    def _fetch_page(self, week_date: str) -> bytes:
+        """Fetch the raw schedule page for the week containing week_date"""
+        url = f"{self.base_url}/tunniplaan"
+        params = {
+            "oppegrupp": self.oppegrupp,
+            "nadal": week_date,
+            "no_export": 1
+        }
+        
+        with tracer.span('scrape', program=self.program_code, week=week_date) as span:
+            response = self._get(url, params)
+            if span:
+                span.set(status=response.status_code, bytes=len(response.content))
+        return response.content
+    
+    def _get(self, url: str, params: Dict = None) -> requests.Response:
+        """GET from VOCO, retrying transient errors within the retry policy; raises the last error"""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return self._hedged_get(url, params, attempt)
+            except Exception as e:
+                delay = self.retry_policy.next_delay(attempt, started) if is_retryable(e) else None
+                if delay is None:
+                    raise
+                retries.inc()
+                time.sleep(delay)
+                attempt += 1
+    
+    def _attempt(self, client, url: str, params: Optional[Dict], attempt: int, kind: str) -> requests.Response:
+        """A single request through client (a session, or the requests module itself)"""
+        started = time.perf_counter()
+        outcome = 'error'
         try:
-            # Handle 'tomorrow' parameter
-            if date_str == 'tomorrow':
-                tomorrow = datetime.now() + timedelta(days=1)
-                date_str = tomorrow.strftime('%d.%m.%Y')
-            
-            # Fetch the schedule page
-            url = f"{self.base_url}/tunniplaan"
-            params = {
-                "oppegrupp": self.oppegrupp,
-                "nadal": date_str,
-                "no_export": 1
-            }
-            
-            response = self.session.get(url, params=params)
+            response = client.get(url, params=params, timeout=self.timeout)
+            outcome = str(response.status_code)
             response.raise_for_status()
-            
-            # Parse the HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
+            return response
+        except requests.Timeout:
+            outcome = 'timeout'
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            attempt_seconds.observe(elapsed, attempt=str(attempt + 1), kind=kind, outcome=outcome)
+            if outcome == '200':
+                self.latency.record(elapsed)
+    
+    @classmethod
+    def _executor(cls) -> ThreadPoolExecutor:
+        with cls._hedge_executor_lock:
+            if cls._hedge_executor is None:
+                cls._hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='voco-hedge')
+            return cls._hedge_executor
+    
+    def _hedged_get(self, url: str, params: Optional[Dict], attempt: int) -> requests.Response:
+        """One attempt; with hedging on, a second request races the first once it exceeds the p95"""
+        hedge_after = self.latency.percentile(0.95) if self.HEDGE else None
+        if hedge_after is None:
+            return self._attempt(self.session, url, params, attempt, 'primary')
+        
+        executor = self._executor()
+        primary = executor.submit(self._attempt, self.session, url, params, attempt, 'primary')
+        try:
+            return primary.result(timeout=hedge_after)
+        except FutureTimeout:
+            pass
+        # Cap concurrent hedges so a slow VOCO does not get twice the load
+        if not self._hedge_slots.acquire(blocking=False):
+            return primary.result()
+        # Sessions are not thread-safe, so the hedge goes through the requests module
+        hedge = executor.submit(self._attempt, requests, url, params, attempt, 'hedge')
+        hedge.add_done_callback(lambda _: self._hedge_slots.release())
+        
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    hedge_wins.inc(winner='hedge' if future is hedge else 'primary')
+                    return future.result()
+                error = future.exception()
+        raise error
+    
+    def _parse_page(self, page: bytes) -> List[Dict]:
+        """Parse the events of a raw schedule page"""
+        with tracer.span('parse') as span:
+            # Imported lazily: bs4 is only needed once the first page is scraped
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(page, 'html.parser')
             events = self._parse_events(soup)
-            
-            # Convert date_str to ISO format for comparison
-            if date_str == 'tomorrow':
-                target_date_iso = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
-            else:
-                try:
-                    target_date_iso = datetime.strptime(date_str, '%d.%m.%Y').strftime('%Y-%m-%d')
-                except ValueError:
-                    print(f"Invalid date format: {date_str}")
-                    return []
-            
-            # Filter for target date's lessons and remove "Tegevuspäev"
-            lessons = []
-            seen_lessons = set()
-            
-            for event in events:
-                event_date = event.get('date', '')
-                if event_date == target_date_iso:
-                    subject = event.get('subject', '')
-                    # Skip "Tegevuspäev" and empty subjects
-                    if subject and subject != 'Tegevuspäev' and subject.strip():
-                        # Group by time slot only (not subject name)
-                        start_time = event.get('start_time', '')
-                        end_time = event.get('end_time', '')
-                        lesson_key = f"{start_time}_{end_time}"
-                        if lesson_key not in seen_lessons:
-                            lessons.append(event)
-                            seen_lessons.add(lesson_key)
-                        else:
-                            # If same time slot, merge with existing lesson
-                            for i, existing_lesson in enumerate(lessons):
-                                if (existing_lesson.get('start_time') == start_time and
-                                    existing_lesson.get('end_time') == end_time):
-                                    # Add teacher and room to existing lesson
-                                    if 'teachers' not in existing_lesson:
-                                        existing_lesson['teachers'] = [existing_lesson.get('teacher', '')]
-                                        existing_lesson['rooms'] = [existing_lesson.get('room', '')]
-                                        existing_lesson['subjects'] = [existing_lesson.get('subject', '')]
-                                    existing_lesson['teachers'].append(event.get('teacher', ''))
-                                    existing_lesson['rooms'].append(event.get('room', ''))
-                                    existing_lesson['subjects'].append(subject)
-                                    break
-            
-            return lessons
-            
-        except Exception as e:
-            print(f"Error fetching lessons for {date_str}: {e}")
-            return []
+            if span:
+                span.set(events=len(events))
+        return events
     
-    def _parse_events(self, soup: BeautifulSoup) -> List[Dict]:
+    def _parse_events(self, soup: 'BeautifulSoup') -> List[Dict]:
         """Parse events from HTML content"""
         events = []
         
@@ -163,25 +443,20 @@ class VOCOScraper:
         
         for script in script_tags:
             if script.string and 'events:' in script.string:
-                events_match = re.search(r'events:\s*\[(.*?)\]', script.string, re.DOTALL)
-                if events_match:
-                    events_text = events_match.group(1)
-                    events = self._parse_events_from_js(events_text)
+                objects = find_events(script.string)
+                if objects is not None:
+                    events = self._parse_event_objects(objects)
                     break
         
         return events
     
-    def _parse_events_from_js(self, events_text: str) -> List[Dict]:
-        """Parse individual events from JavaScript events array"""
+    def _parse_event_objects(self, objects: List[Dict[str, str]]) -> List[Dict]:
+        """Turn the scanned JavaScript event objects into events"""
         events = []
         
-        # Find all event objects in the JavaScript
-        event_pattern = r"\{[^}]*plan_id:'[^']*'[^}]*\}"
-        event_matches = re.findall(event_pattern, events_text)
-        
-        for event_match in event_matches:
+        for fields in objects:
             try:
-                event = self._extract_event_data(event_match)
+                event = self._extract_event_data(fields)
                 if event:
                     events.append(event)
             except Exception as e:
@@ -190,28 +465,29 @@ class VOCOScraper:
         
         return events
     
-    def _extract_event_data(self, event_text: str) -> Optional[Dict]:
+    def _extract_event_data(self, fields: Dict[str, str]) -> Optional[Dict]:
         """Extract structured data from a single event"""
         # Extract basic fields
-        plan_id = re.search(r"plan_id:'([^']*)'", event_text)
-        title = re.search(r"title:'([^']*)'", event_text)
-        start = re.search(r"start:'([^']*)'", event_text)
-        end = re.search(r"end:'([^']*)'", event_text)
+        plan_id = fields.get('plan_id')
+        title = fields.get('title')
+        start = fields.get('start')
+        end = fields.get('end')
         
-        if not all([plan_id, title, start, end]):
+        # Empty values are kept (an untitled lesson is still a lesson), missing ones are not
+        if any(value is None for value in (plan_id, title, start, end)):
             return None
         
         # Clean and process the data
-        clean_title = self._clean_html(title.group(1))
+        clean_title = self._clean_html(title)
         
         event = {
-            'plan_id': plan_id.group(1),
+            'plan_id': plan_id,
             'title': clean_title,
-            'start': start.group(1),
-            'end': end.group(1),
-            'start_time': self._extract_time(start.group(1)),
-            'end_time': self._extract_time(end.group(1)),
-            'date': self._extract_date(start.group(1)),
+            'start': start,
+            'end': end,
+            'start_time': self._extract_time(start),
+            'end_time': self._extract_time(end),
+            'date': self._extract_date(start),
             'subject': self._extract_subject_name(clean_title),
             'teacher': self._extract_teacher_name(clean_title),
             'room': self._extract_room_info(clean_title)
@@ -266,3 +542,120 @@ class VOCOScraper:
             return dt.strftime('%Y-%m-%d')
         except:
             return datetime_str.split('T')[0]
+
+
+def _parse_cli_date(value: str) -> datetime:
+    for fmt in ('%d.%m.%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"invalid date {value!r}, use DD.MM.YYYY or YYYY-MM-DD")
+
+
+def bulk_scrape(programs: List[str], mondays: List[datetime], concurrency: int, out=None) -> Dict[str, float]:
+    """Fetch every (program, week) with at most concurrency requests in flight.
+    
+    Weeks land in the week cache; with out set, events are also written there as NDJSON.
+    Returns throughput figures.
+    """
+    local = threading.local()
+    
+    def fetch(code: str, monday: datetime):
+        # One scraper (and HTTP session) per worker thread and program
+        scrapers = local.__dict__.setdefault('scrapers', {})
+        scraper = scrapers.get(code)
+        if scraper is None:
+            scraper = scrapers[code] = VOCOScraper(code)
+        started = time.perf_counter()
+        events = scraper.refresh_week(monday)
+        return events, time.perf_counter() - started
+    
+    report = {'weeks': 0, 'failed': 0, 'events': 0}
+    durations = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='bulk-scrape') as executor:
+        jobs = {executor.submit(fetch, code, monday): (code, monday) for code in programs for monday in mondays}
+        for job in as_completed(jobs):
+            code, monday = jobs[job]
+            week = monday.strftime('%Y-%m-%d')
+            try:
+                events, duration = job.result()
+            except Exception as e:
+                report['failed'] += 1
+                print(f"⚠️ {code} {week}: {e}", file=sys.stderr)
+                continue
+            report['weeks'] += 1
+            report['events'] += len(events)
+            durations.append(duration)
+            if out is not None:
+                for event in events:
+                    out.write(json.dumps({'program': code, 'week': week, **event}, ensure_ascii=False) + '\n')
+    
+    elapsed = time.perf_counter() - started
+    durations.sort()
+    report['seconds'] = elapsed
+    report['weeks_per_second'] = report['weeks'] / elapsed if elapsed else 0.0
+    report['events_per_second'] = report['events'] / elapsed if elapsed else 0.0
+    report['p50_seconds'] = durations[len(durations) // 2] if durations else 0.0
+    report['p95_seconds'] = durations[min(len(durations) - 1, int(len(durations) * 0.95))] if durations else 0.0
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.scraper', description='Scrape VOCO schedules in bulk')
+    parser.add_argument('programs', nargs='*', help='program codes (default: all known programs)')
+    parser.add_argument('--discover', action='store_true', help="load VOCO's study group list first")
+    parser.add_argument('--from', dest='start', type=_parse_cli_date, default=datetime.now(),
+                        help='first week, DD.MM.YYYY or YYYY-MM-DD (default: this week)')
+    parser.add_argument('--weeks', type=int, default=1, help='number of weeks (default: 1)')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('SCHEDULE_FETCH_CONCURRENCY', '4')),
+                        help='requests in flight at once (default: SCHEDULE_FETCH_CONCURRENCY)')
+    parser.add_argument('--output', choices=('ndjson', 'sqlite'), default='ndjson',
+                        help='ndjson: one event per line; sqlite: load the schedule cache (default: ndjson)')
+    parser.add_argument('--file', default='-', help='NDJSON output file (default: stdout)')
+    parser.add_argument('--cache-path', help='SQLite schedule cache to load (default: SCHEDULE_CACHE_PATH)')
+    args = parser.parse_args(argv)
+    
+    async def load_registry():
+        # Migration progress goes to stderr so it never mixes with NDJSON on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            await db.migrate()
+        if args.discover:
+            await registry.update(await asyncio.to_thread(VOCOScraper.fetch_programs))
+        else:
+            await registry.load()
+    
+    asyncio.run(load_registry())
+    
+    codes = [code.upper() for code in args.programs] or registry.codes()
+    unknown = [code for code in codes if code not in registry]
+    if unknown:
+        parser.error(f"unknown programs: {', '.join(unknown)} (try --discover)")
+    
+    # NDJSON runs leave the persistent cache alone
+    if args.output == 'sqlite':
+        VOCOScraper._week_cache = SQLiteWeekCache(args.cache_path)
+    else:
+        VOCOScraper._week_cache = MemoryWeekCache(max_entries=len(codes) * max(1, args.weeks))
+    
+    first_monday = args.start - timedelta(days=args.start.weekday())
+    mondays = [first_monday + timedelta(weeks=week) for week in range(max(1, args.weeks))]
+    
+    out = None
+    if args.output == 'ndjson':
+        out = sys.stdout if args.file == '-' else open(args.file, 'w', encoding='utf-8')
+    try:
+        report = bulk_scrape(codes, mondays, args.concurrency, out)
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+    
+    print(f"📊 {report['weeks']} weeks ({report['failed']} failed), {report['events']} events in {report['seconds']:.1f}s: "
+          f"{report['weeks_per_second']:.1f} weeks/s, {report['events_per_second']:.0f} events/s, "
+          f"p50 {report['p50_seconds'] * 1000:.0f} ms, p95 {report['p95_seconds'] * 1000:.0f} ms per week", file=sys.stderr)
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
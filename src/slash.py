@@ -0,0 +1,257 @@
+"""
+Slash (application) command versions of the main commands
+"""
+import hashlib
+import json
+import os
+from datetime import date, timedelta
+from typing import List, Optional
+
+import discord
+from discord import app_commands
+
+from .commands import build_roles_embed, parse_role_pairs, publish_role_message, LOOKUP_DAYS
+from .database import db
+from .index import schedule_index
+from .programs import registry
+from .render import build_range_embeds, program_display
+from .schedule import schedule, resolve_date_param, MAX_RANGE_DAYS
+from .scraper import ScheduleUnavailableError
+from .tracing import tracer, traced
+
+DATE_KEYWORDS = ['homme', 'nädal', 'järgmine nädal']
+
+
+def date_suggestions(current: str, today: date = None) -> List[str]:
+    """Date argument suggestions: keywords and the next two weeks of school days"""
+    today = today or date.today()
+    options = list(DATE_KEYWORDS)
+    for offset in range(14):
+        day = today + timedelta(days=offset)
+        if day.weekday() < 5:
+            options.append(day.strftime('%d.%m.%Y'))
+    current = current.lower().strip()
+    return [option for option in options if option.startswith(current)][:25]
+
+
+def choices(values: List[str]) -> List[app_commands.Choice[str]]:
+    return [app_commands.Choice(name=value, value=value) for value in values[:25]]
+
+
+async def autocomplete_date(interaction: discord.Interaction, current: str):
+    return choices(date_suggestions(current))
+
+
+async def autocomplete_program(interaction: discord.Interaction, current: str):
+    return choices(registry.complete(current))
+
+
+async def autocomplete_teacher(interaction: discord.Interaction, current: str):
+    return choices(schedule_index.complete_teachers(current))
+
+
+async def autocomplete_room(interaction: discord.Interaction, current: str):
+    return choices(schedule_index.complete_rooms(current))
+
+
+def setup_slash_commands(bot):
+    """Register slash commands on the bot's command tree"""
+
+    @bot.tree.command(name='tunniplaan', description='Näita serveri programmi tunde')
+    @app_commands.describe(paev='homme, nädal, järgmine nädal, DD.MM.YYYY või DD.MM.YYYY-DD.MM.YYYY')
+    @app_commands.autocomplete(paev=autocomplete_date)
+    @app_commands.guild_only()
+    @traced('slash.tunniplaan')
+    async def tunniplaan(interaction: discord.Interaction, paev: Optional[str] = None):
+        # Acknowledge at once; Discord shows "thinking" until the result is edited in
+        await interaction.response.defer(thinking=True)
+
+        server_program = await db.get_server_program(str(interaction.guild_id))
+        if not server_program:
+            await interaction.edit_original_response(
+                content="📚 **Serveri programm pole valitud!** Admin saab kasutada `/grupp`"
+            )
+            return
+
+        try:
+            start, end = resolve_date_param(paev)
+        except ValueError:
+            await interaction.edit_original_response(
+                content="❌ Vale kuupäeva formaat! Kasuta: DD.MM.YYYY (nt. 15.01.2025), "
+                        f"DD.MM.YYYY-DD.MM.YYYY (kuni {MAX_RANGE_DAYS} päeva), `nädal` või `järgmine nädal`"
+            )
+            return
+
+        try:
+            if start == end:
+                result = await schedule.render_day(server_program, start)
+                with tracer.span('send'):
+                    await interaction.edit_original_response(content=result['content'], embed=result['embed'])
+                return
+
+            result = await schedule.render_range(server_program, start, end)
+            with tracer.span('send', pages=len(result['embeds'])):
+                if result['content']:
+                    await interaction.edit_original_response(content=result['content'])
+                    return
+                first, *rest = result['embeds']
+                await interaction.edit_original_response(embed=first)
+                for embed in rest:
+                    await interaction.followup.send(embed=embed)
+        except ScheduleUnavailableError as e:
+            await interaction.edit_original_response(content="❌ VOCO tunniplaan pole hetkel kättesaadav, proovi hiljem uuesti.")
+            print(f"Error in /tunniplaan: {e}")
+        except Exception as e:
+            print(f"Error in /tunniplaan: {e}")
+            try:
+                await interaction.edit_original_response(content=f"❌ Viga tundide laadimisel: {e}")
+            except discord.HTTPException:
+                # The interaction response itself failed; a followup still reaches the user
+                await interaction.followup.send(f"❌ Viga tundide laadimisel: {e}")
+
+    @bot.tree.command(name='grupp', description='Näita või määra serveri õppeprogramm')
+    @app_commands.describe(programm='VOCO grupi kood, nt ITA25')
+    @app_commands.autocomplete(programm=autocomplete_program)
+    @app_commands.guild_only()
+    async def grupp(interaction: discord.Interaction, programm: Optional[str] = None):
+        await interaction.response.defer(thinking=True)
+        guild_id = str(interaction.guild_id)
+
+        if programm is None:
+            server_program = await db.get_server_program(guild_id)
+            if server_program:
+                await interaction.edit_original_response(content=f"📚 **Serveri programm:** {program_display(server_program)}")
+            else:
+                await interaction.edit_original_response(content="📚 **Serveri programm pole valitud!** Admin saab kasutada `/grupp`")
+            return
+
+        if not interaction.user.guild_permissions.manage_channels:
+            await interaction.edit_original_response(content="❌ Sul on vaja 'Kanalite haldamine' õigust serveri programmi määramiseks.")
+            return
+
+        programm = programm.upper()
+        if programm not in registry:
+            suggestions = registry.complete(programm[:3], limit=10) or registry.complete('', limit=10)
+            await interaction.edit_original_response(
+                content=f"❌ **Vale programm!** Näiteks: {', '.join(f'`{code}`' for code in suggestions)}"
+            )
+            return
+
+        await db.set_server_program(guild_id, programm)
+        program_name = program_display(programm)
+        await interaction.edit_original_response(
+            content=f"✅ **Serveri programm määratud:** {program_name}\n"
+                    f"📅 Kõik tunniplaani käsud ja automaatsed teated näitavad nüüd {program_name} tunde"
+        )
+
+    @bot.tree.command(name='info', description='Saada teade info kanalile @everyone pingiga')
+    @app_commands.describe(sonum='Teate tekst', pilt='Pilt, mis saadetakse teatega')
+    @app_commands.guild_only()
+    @traced('slash.info')
+    async def info(interaction: discord.Interaction, sonum: Optional[str] = None, pilt: Optional[discord.Attachment] = None):
+        # Only the author sees the confirmation
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        info_channels, _ = await db.get_channels()
+        info_channel_id = info_channels.get(str(interaction.guild_id))
+        if info_channel_id is None:
+            await interaction.edit_original_response(content="❌ Info kanal pole määratud! Kasuta `!info-set` kanali määramiseks.")
+            return
+        info_channel = bot.get_channel(info_channel_id)
+        if info_channel is None:
+            await interaction.edit_original_response(content="❌ Info kanalit ei leitud! Kasuta `!info-set` kehtiva kanali määramiseks.")
+            return
+        if not info_channel.permissions_for(interaction.user).send_messages:
+            await interaction.edit_original_response(content="❌ Sul pole õigust sõnumeid saata info kanalisse.")
+            return
+        if not sonum and pilt is None:
+            await interaction.edit_original_response(content="❌ Palun anna sõnum või pilt!")
+            return
+
+        with tracer.span('send', attachments=1 if pilt else 0):
+            if pilt is not None:
+                text = f"@everyone {sonum} by {interaction.user.display_name}" if sonum else "@everyone"
+                await info_channel.send(text, file=await pilt.to_file())
+            else:
+                await info_channel.send(f"@everyone {sonum} by {interaction.user.display_name}")
+
+        await interaction.edit_original_response(content=f"✅ Info saadetud {info_channel.mention}")
+
+    @bot.tree.command(name='vota-rollid', description='Loo rollide valimise sõnum')
+    @app_commands.describe(rollid='@roll1 🎭1 @roll2 🎭2', ainult_uks='Kas kasutaja saab valida ainult ühe rolli')
+    @app_commands.guild_only()
+    @traced('slash.vota-rollid')
+    async def vota_rollid(interaction: discord.Interaction, rollid: str, ainult_uks: bool = False):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        if not interaction.user.guild_permissions.manage_roles:
+            await interaction.edit_original_response(content="❌ Sul on vaja 'Rollide haldamine' õigust rollide valimise sõnumi loomiseks.")
+            return
+
+        roles_data, error = parse_role_pairs(interaction.guild, rollid.split())
+        if error:
+            await interaction.edit_original_response(content=error)
+            return
+
+        # The role picker is a normal channel message so it outlives the interaction
+        with tracer.span('send'):
+            message = await interaction.channel.send(embed=build_roles_embed(roles_data, ainult_uks))
+        await publish_role_message(message, str(interaction.guild_id), interaction.channel_id, roles_data, ainult_uks)
+        await interaction.edit_original_response(content="✅ Rollide valimise sõnum loodud")
+
+    async def send_lookup(interaction: discord.Interaction, title: str, days):
+        if schedule_index.built_at is None:
+            await interaction.edit_original_response(content="⏳ Tunniplaanide indeks alles laeb, proovi hetke pärast uuesti.")
+            return
+        if not days:
+            await interaction.edit_original_response(content=f"📅 **{title}**: järgmisel {LOOKUP_DAYS} päeval tunde ei ole.")
+            return
+        first, *rest = build_range_embeds(title, days)
+        await interaction.edit_original_response(embed=first)
+        for embed in rest:
+            await interaction.followup.send(embed=embed)
+
+    @bot.tree.command(name='opetaja', description='Näita õpetaja tunde kõigis gruppides')
+    @app_commands.autocomplete(nimi=autocomplete_teacher)
+    async def opetaja(interaction: discord.Interaction, nimi: str):
+        await interaction.response.defer(thinking=True)
+        matches = schedule_index.find_teachers(nimi)
+        if len(matches) != 1:
+            message = f"❌ Õpetajat `{nimi}` ei leitud." if not matches else f"🔍 Leidsin mitu õpetajat: {', '.join(matches)}. Täpsusta nime."
+            await interaction.edit_original_response(content=message)
+            return
+        start = date.today()
+        days = schedule_index.teacher_lessons(matches[0], start, start + timedelta(days=LOOKUP_DAYS - 1))
+        await send_lookup(interaction, f"Õpetaja {matches[0]}", days)
+
+    @bot.tree.command(name='ruum', description='Näita ruumi tunde, nt A310')
+    @app_commands.autocomplete(ruum=autocomplete_room)
+    async def ruum(interaction: discord.Interaction, ruum: str):
+        await interaction.response.defer(thinking=True)
+        code = schedule_index.find_room(ruum)
+        if code is None:
+            await interaction.edit_original_response(content=f"❌ Ruumi `{ruum}` ei leitud.")
+            return
+        start = date.today()
+        days = schedule_index.room_lessons(code, start, start + timedelta(days=LOOKUP_DAYS - 1))
+        await send_lookup(interaction, f"Ruum {code}", days)
+
+
+async def sync_commands(bot):
+    """Sync the command tree with Discord only when the command definitions changed"""
+    payload = json.dumps([command.to_dict() for command in bot.tree.get_commands()], sort_keys=True)
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    data_dir = os.getenv('DATA_DIR', '.')
+    path = os.path.join(data_dir, 'command_tree.sha256')
+    try:
+        with open(path) as f:
+            if f.read().strip() == digest:
+                return
+    except FileNotFoundError:
+        pass
+
+    synced = await bot.tree.sync()
+    with open(path, 'w') as f:
+        f.write(digest)
+    print(f"🔁 Synced {len(synced)} slash commands")
@@ -0,0 +1,151 @@
+"""
+Lightweight tracing for bot commands and event handlers
+"""
+import contextvars
+import functools
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List
+
+# Current span of the running command/event (per asyncio task)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """A single timed operation, optionally with child spans"""
+
+    __slots__ = ('name', 'attrs', 'start', 'end', 'children', 'error')
+
+    def __init__(self, name: str, attrs: Dict):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+        self.children: List['Span'] = []
+        self.error = None
+
+    def set(self, **attrs):
+        """Attach extra attributes to the span"""
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def to_dict(self, root_start: float) -> Dict:
+        data = {
+            'name': self.name,
+            'offset_ms': round((self.start - root_start) * 1000, 2),
+            'duration_ms': round(self.duration_ms, 2),
+        }
+        if self.attrs:
+            data['attrs'] = self.attrs
+        if self.error:
+            data['error'] = self.error
+        if self.children:
+            data['children'] = [child.to_dict(root_start) for child in self.children]
+        return data
+
+
+class Tracer:
+    """Times commands and writes traces over the threshold to a JSON log"""
+
+    def __init__(self, slow_ms: float = None, sample_rate: float = None, log_path: str = None):
+        if slow_ms is None:
+            slow_ms = float(os.getenv('TRACE_SLOW_MS', '2000'))
+        if sample_rate is None:
+            sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+        if log_path is None:
+            data_dir = os.getenv('DATA_DIR', '.')
+            log_path = os.getenv('TRACE_LOG_PATH', os.path.join(data_dir, 'slow_traces.log'))
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.log_path = log_path
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Start a root span for a command or event handler"""
+        root = Span(name, attrs)
+        # Unsampled traces only time the root and skip child spans entirely
+        sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        token = _current_span.set(root if sampled else None)
+        try:
+            yield root
+        except BaseException as e:
+            root.error = repr(e)
+            raise
+        finally:
+            root.end = time.perf_counter()
+            _current_span.reset(token)
+            if root.duration_ms >= self.slow_ms:
+                self._write(root, sampled)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Start a child span; does nothing outside of a sampled trace"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        child = Span(name, attrs)
+        parent.children.append(child)
+        token = _current_span.set(child)
+        try:
+            yield child
+        except BaseException as e:
+            child.error = repr(e)
+            raise
+        finally:
+            child.end = time.perf_counter()
+            _current_span.reset(token)
+
+    def _write(self, root: Span, sampled: bool):
+        """Append a slow trace to the JSON lines log"""
+        record = {
+            'ts': datetime.now().isoformat(timespec='milliseconds'),
+            'trace': root.name,
+            'duration_ms': round(root.duration_ms, 2),
+            'sampled': sampled,
+        }
+        tree = root.to_dict(root.start)
+        for key in ('attrs', 'error', 'children'):
+            if key in tree:
+                record[key] = tree[key]
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            print(f"🐢 Slow trace {root.name}: {record['duration_ms']:.0f}ms")
+        except Exception as e:
+            print(f"⚠️ Could not write trace log: {e}")
+
+
+def traced(name: str):
+    """Decorator that wraps an async command or event handler in a root span"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.trace(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def spanned(name: str):
+    """Decorator that wraps an async helper (e.g. a DB call) in a child span"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Global tracer instance
+tracer = Tracer()
@@ -0,0 +1,83 @@
+"""
+Event loop lag monitor and blocking-call detector
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from .metrics import metrics
+
+loop_lag = metrics.gauge('event_loop_lag_seconds', 'Latest measured event loop lag')
+loop_lag_max = metrics.gauge('event_loop_lag_max_seconds', 'Largest event loop lag since start')
+loop_blocked = metrics.counter('event_loop_blocked_total', 'Times the event loop was blocked over the threshold')
+
+
+class LoopWatchdog:
+    """Measures event loop lag and dumps the stack of whatever blocks the loop"""
+
+    def __init__(self, interval: float = None, threshold: float = None):
+        if interval is None:
+            interval = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+        if threshold is None:
+            threshold = float(os.getenv('LOOP_LAG_THRESHOLD', '0.5'))
+        self.interval = interval
+        self.threshold = threshold
+        self._last_tick = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start monitoring the running loop (idempotent)"""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._detect, name='loop-watchdog', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _measure(self):
+        """Sleep for a fixed interval and record how late the loop woke us up"""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_tick = now
+            lag = max(0.0, now - expected)
+            loop_lag.set(lag)
+            if lag > loop_lag_max.get():
+                loop_lag_max.set(lag)
+            if lag >= self.threshold:
+                print(f"🐌 Event loop lag {lag * 1000:.0f}ms")
+
+    def _detect(self):
+        """Watcher thread: capture the loop thread's stack while it is stalled"""
+        reported_tick = None
+        while not self._stopped.wait(self.threshold / 2):
+            last_tick = self._last_tick
+            stalled = time.monotonic() - last_tick - self.interval
+            if stalled < self.threshold or reported_tick == last_tick:
+                continue
+            # Report each stall once
+            reported_tick = last_tick
+            loop_blocked.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame else '<no frame>'
+            print(f"⚠️ Event loop blocked for {stalled * 1000:.0f}ms, stack of loop thread:\n{stack}")
+
+
+# Global watchdog instance
+watchdog = LoopWatchdog()
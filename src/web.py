@@ -0,0 +1,152 @@
+"""
+Minimal local HTTP server for metrics and feeds
+"""
+import asyncio
+import os
+from datetime import date
+from typing import AsyncIterator, Awaitable, Callable, Dict, Tuple, Union
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .ical import stream_calendar
+from .metrics import metrics
+from .programs import registry
+
+# Body is either complete bytes or an async iterator streamed with chunked encoding
+Body = Union[bytes, AsyncIterator[bytes]]
+
+# Handler receives (path, query) and returns (status, content_type, body)
+Handler = Callable[[str, Dict[str, str]], Awaitable[Tuple[int, str, Body]]]
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class WebServer:
+    """Tiny asyncio HTTP/1.1 server with prefix routing (GET only)"""
+
+    def __init__(self, host: str = None, port: int = None):
+        self.host = host or os.getenv('HTTP_HOST', '0.0.0.0')
+        self.port = port if port is not None else int(os.getenv('HTTP_PORT', '0'))
+        self.routes: Dict[str, Handler] = {}
+        self._server = None
+
+    def route(self, prefix: str):
+        """Register a handler for all paths starting with prefix"""
+        def decorator(handler: Handler):
+            self.routes[prefix] = handler
+            return handler
+        return decorator
+
+    async def start(self):
+        """Start listening; does nothing if HTTP_PORT is not set or already running"""
+        if not self.port or self._server is not None:
+            return
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"🌐 HTTP server listening on {self.host}:{self.port}")
+
+    def _find_handler(self, path: str):
+        # Longest matching prefix wins
+        for prefix in sorted(self.routes, key=len, reverse=True):
+            if path.startswith(prefix):
+                return self.routes[prefix]
+        return None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+            # Drain headers, they are not used
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=10)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2:
+                await self._respond(writer, 400, 'text/plain', b'bad request\n')
+                return
+            method, target = parts[0], parts[1]
+            if method != 'GET':
+                await self._respond(writer, 405, 'text/plain', b'method not allowed\n')
+                return
+
+            url = urlsplit(target)
+            path = unquote(url.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            handler = self._find_handler(path)
+            if handler is None:
+                await self._respond(writer, 404, 'text/plain', b'not found\n')
+                return
+
+            try:
+                status, content_type, body = await handler(path, query)
+            except Exception as e:
+                print(f"⚠️ HTTP handler error for {path}: {e}")
+                status, content_type, body = 500, 'text/plain', b'internal error\n'
+            await self._respond(writer, status, content_type, body)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"⚠️ HTTP error: {e}")
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, content_type: str, body: Body):
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+        )
+        if isinstance(body, bytes):
+            head += f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+            writer.write(head.encode('latin-1') + body)
+            await writer.drain()
+            return
+
+        # Stream the body chunk by chunk without materializing it
+        head += "Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+        writer.write(head.encode('latin-1'))
+        async for chunk in body:
+            if chunk:
+                writer.write(f"{len(chunk):x}\r\n".encode('latin-1') + chunk + b"\r\n")
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+# Weeks included in the calendar feed unless ?weeks= is given
+ICAL_FEED_WEEKS = int(os.getenv('ICAL_FEED_WEEKS', '20'))
+# Uncached weeks one feed request may fetch from VOCO; the feed is unauthenticated
+ICAL_FEED_FETCHES = int(os.getenv('ICAL_FEED_FETCHES', '4'))
+
+# Global web server instance
+web = WebServer()
+
+
+@web.route('/metrics')
+async def metrics_endpoint(path: str, query: Dict[str, str]):
+    return 200, 'text/plain; version=0.0.4', metrics.render().encode('utf-8')
+
+
+@web.route('/ical/')
+async def ical_feed(path: str, query: Dict[str, str]):
+    """Calendar feed: /ical/ITA25.ics?weeks=20"""
+    program = path[len('/ical/'):]
+    if program.lower().endswith('.ics'):
+        program = program[:-4]
+    program = program.upper()
+    if program not in registry:
+        return 404, 'text/plain', b'unknown program\n'
+    try:
+        weeks = min(max(int(query.get('weeks', ICAL_FEED_WEEKS)), 1), 52)
+    except ValueError:
+        return 400, 'text/plain', b'invalid weeks\n'
+    return 200, 'text/calendar; charset=utf-8', stream_calendar(program, date.today(), weeks, max_fetches=ICAL_FEED_FETCHES)
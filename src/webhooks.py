@@ -0,0 +1,121 @@
+"""
+Webhook transport for broadcasts (daily lessons, schedule changes)
+
+Posts go through a webhook per tunniplaan channel, so they use the webhook's own
+rate-limit buckets instead of the bot's and never queue behind interactive commands.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import discord
+
+from .database import db
+from .metrics import metrics
+
+broadcast_sends = metrics.counter('broadcast_sends_total', 'Broadcast posts by transport (webhook, channel)')
+
+WEBHOOK_NAME = 'Tunniplaan'
+
+# After a channel refuses webhooks (missing Manage Webhooks), retry only after this many seconds
+RETRY_UNAVAILABLE = 3600
+
+
+def webhooks_enabled() -> bool:
+    return os.getenv('BROADCAST_WEBHOOKS', '').lower() in ('1', 'true', 'yes')
+
+
+class WebhookTransport:
+    """Sends broadcast posts through a cached webhook per tunniplaan channel, falling back to channel.send"""
+
+    def __init__(self):
+        self.enabled = webhooks_enabled()
+        # Set by main.py; webhooks share the client's HTTP session but not its rate limits
+        self.client: Optional[discord.Client] = None
+        # guild_id -> (channel_id, webhook)
+        self._webhooks: Dict[str, Tuple[int, discord.Webhook]] = {}
+        # channel_id -> monotonic time webhooks were last found unavailable
+        self._unavailable: Dict[int, float] = {}
+        # Created on first use, inside the running loop (the transport is built at import time)
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def send(self, guild_id: str, channel: discord.abc.Messageable, **kwargs):
+        """Post to channel, through its webhook when the transport is enabled"""
+        kwargs = {key: value for key, value in kwargs.items() if value is not None}
+        if self.enabled and self.client is not None:
+            for _ in range(2):
+                webhook = await self._webhook(guild_id, channel)
+                if webhook is None:
+                    break
+                try:
+                    user = self.client.user
+                    await webhook.send(username=user.display_name, avatar_url=user.display_avatar.url, **kwargs)
+                    broadcast_sends.inc(transport='webhook')
+                    return
+                except discord.NotFound:
+                    # Deleted in Discord: forget it and create a new one
+                    self._webhooks.pop(guild_id, None)
+                    await db.set_webhook(guild_id, None, None)
+                except discord.HTTPException as e:
+                    # Any other failure (invalid token, server error): forget it and post as the bot
+                    print(f"⚠️ Webhook post failed in #{getattr(channel, 'name', channel.id)}, posting as the bot: {e}")
+                    self._webhooks.pop(guild_id, None)
+                    await db.set_webhook(guild_id, None, None)
+                    break
+        await channel.send(**kwargs)
+        broadcast_sends.inc(transport='channel')
+
+    async def _webhook(self, guild_id: str, channel) -> Optional[discord.Webhook]:
+        cached = self._webhooks.get(guild_id)
+        if cached is not None and cached[0] == channel.id:
+            return cached[1]
+        failed_at = self._unavailable.get(channel.id)
+        if failed_at is not None and time.monotonic() - failed_at < RETRY_UNAVAILABLE:
+            return None
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            cached = self._webhooks.get(guild_id)
+            if cached is not None and cached[0] == channel.id:
+                return cached[1]
+            stored = await db.get_webhook(guild_id)
+            if stored is not None and stored[0] == channel.id:
+                webhook = discord.Webhook.from_url(stored[1], client=self.client)
+            else:
+                webhook = await self._create(channel)
+                if webhook is None:
+                    self._unavailable[channel.id] = time.monotonic()
+                    return None
+                await db.set_webhook(guild_id, channel.id, webhook.url)
+            self._webhooks[guild_id] = (channel.id, webhook)
+            return webhook
+
+    async def _create(self, channel) -> Optional[discord.Webhook]:
+        """Reuse the bot's webhook in channel or create one; None without Manage Webhooks"""
+        try:
+            for webhook in await channel.webhooks():
+                if webhook.user == self.client.user and webhook.name == WEBHOOK_NAME and webhook.token:
+                    return webhook
+            return await channel.create_webhook(name=WEBHOOK_NAME, reason='Tunniplaani teated')
+        except (discord.Forbidden, AttributeError):
+            # AttributeError: channel types without webhooks
+            print(f"⚠️ No webhook permission in #{getattr(channel, 'name', channel.id)}, posting as the bot")
+            return None
+
+    async def forget(self, guild_id: str):
+        """Delete a guild's webhook, e.g. when its tunniplaan channel changes or is removed"""
+        self._webhooks.pop(guild_id, None)
+        stored = await db.get_webhook(guild_id)
+        if stored is None or self.client is None:
+            return
+        await db.set_webhook(guild_id, None, None)
+        try:
+            await discord.Webhook.from_url(stored[1], client=self.client).delete(reason='Tunniplaan kanal muudetud')
+        except discord.HTTPException:
+            pass
+
+
+# Global broadcast transport
+webhooks = WebhookTransport()